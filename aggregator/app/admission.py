@@ -0,0 +1,169 @@
+"""Admission control /publish: batas konkurensi adaptif + quota per topic/source.
+
+Batas konkurensi mengikuti latency tulis DB (AIMD): tiap request yang selesai
+di bawah admission_target_latency_ms menaikkan batas +1/limit (~ +1 per
+"putaran" request), yang lebih lambat (atau acquire pool timeout) menurunkan
+batas x admission_backoff, paling sering sekali per target latency supaya satu
+lonjakan tidak menjatuhkan batas berkali-kali. Request di atas batas antri
+sebentar (admission_queue_max / admission_queue_timeout_ms); sisanya langsung
+429 + Retry-After alih-alih menumpuk di pool.acquire().
+
+Quota = token bucket event/s per topic dan per source (field `source` event).
+Bucket boleh berutang: batch diterima selama saldo masih positif lalu dipotong
+sebanyak jumlah event, jadi batch yang lebih besar dari burst tetap bisa masuk
+tapi laju jangka panjang tetap terjaga; Retry-After = waktu sampai saldo positif.
+"""
+import asyncio
+import math
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+
+class Overloaded(Exception):
+    """Ditolak admission control -> 429 dengan Retry-After (detik)."""
+
+    def __init__(self, reason: str, retry_after: int, key: Optional[str] = None) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, retry_after)
+        self.key = key
+
+
+class TokenBuckets:
+    """Token bucket per key (event/s); key paling lama tidak dipakai dibuang (LRU)."""
+
+    def __init__(self, rate: float, burst: float = 0.0, max_keys: int = 10_000) -> None:
+        self.rate = rate
+        self.burst = burst if burst > 0 else rate
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (token, waktu)
+
+    def _tokens(self, key: str, now: float) -> float:
+        tokens, at = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - at) * self.rate)
+
+    def wait_time(self, key: str, now: float) -> float:
+        """0 bila key boleh lewat; selain itu detik sampai saldo positif lagi."""
+        tokens = self._tokens(key, now)
+        return 0.0 if tokens > 0 else (1e-9 - tokens) / self.rate
+
+    def take(self, key: str, n: int, now: float) -> None:
+        self._buckets[key] = (self._tokens(key, now) - n, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+
+class AdmissionController:
+    def __init__(self, settings) -> None:
+        self.enabled = settings.admission_enabled
+        self.min_limit = max(1, settings.admission_min_limit)
+        self.max_limit = max(self.min_limit, settings.admission_max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, settings.admission_initial_limit)))
+        self.target_s = settings.admission_target_latency_ms / 1000.0
+        self.backoff = settings.admission_backoff
+        self.queue_max = settings.admission_queue_max
+        self.queue_timeout_s = settings.admission_queue_timeout_ms / 1000.0
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.topic_quota = (TokenBuckets(settings.admission_topic_rate, settings.admission_topic_burst)
+                            if settings.admission_topic_rate > 0 else None)
+        self.source_quota = (TokenBuckets(settings.admission_source_rate, settings.admission_source_burst)
+                             if settings.admission_source_rate > 0 else None)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def check_quotas(self, events: Iterable) -> None:
+        """Potong quota topic/source untuk batch; Overloaded bila salah satu habis.
+
+        Semua bucket dicek dulu baru dipotong: batch yang ditolak tidak
+        menghabiskan quota key lain."""
+        if self.topic_quota is None and self.source_quota is None:
+            return
+        events = list(events)
+        now = time.monotonic()
+        checks: Dict[str, Tuple[TokenBuckets, Counter]] = {}
+        if self.topic_quota is not None:
+            checks["topic_quota"] = (self.topic_quota, Counter(e.topic for e in events))
+        if self.source_quota is not None:
+            checks["source_quota"] = (self.source_quota, Counter(e.source for e in events))
+        for reason, (buckets, counts) in checks.items():
+            for key in counts:
+                wait = buckets.wait_time(key, now)
+                if wait > 0:
+                    raise Overloaded(reason, math.ceil(wait), key)
+        for buckets, counts in checks.values():
+            for key, n in counts.items():
+                buckets.take(key, n, now)
+
+    def _retry_after(self) -> int:
+        # Perkiraan kasar waktu antrian terkuras: (antrian / batas) putaran x target latency
+        return math.ceil((self.queue_depth / max(1.0, self.limit) + 1) * self.target_s)
+
+    def _grant(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                self.inflight += 1
+
+    def _sample(self, seconds: float, overloaded: bool) -> None:
+        if overloaded or seconds > self.target_s:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.target_s:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    async def _acquire(self) -> None:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        if len(self._waiters) >= self.queue_max:
+            raise Overloaded("concurrency", self._retry_after())
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            raise Overloaded("queue_timeout", self._retry_after())
+        except asyncio.CancelledError:
+            # Klien putus setelah slot diberikan: kembalikan slotnya
+            if fut.done() and not fut.cancelled():
+                self.inflight -= 1
+                self._grant()
+            raise
+        finally:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Satu slot konkurensi tulis DB; durasinya jadi sinyal AIMD."""
+        if not self.enabled:
+            yield
+            return
+        await self._acquire()
+        t0 = time.perf_counter()
+        overloaded = False
+        try:
+            yield
+        except asyncio.TimeoutError:
+            overloaded = True  # pool.acquire / command timeout: DB kewalahan
+            raise
+        finally:
+            self.inflight -= 1
+            self._sample(time.perf_counter() - t0, overloaded)
+            self._grant()
+
+
+def build_admission(settings) -> Optional[AdmissionController]:
+    if not (settings.admission_enabled or settings.admission_topic_rate > 0 or settings.admission_source_rate > 0):
+        return None
+    return AdmissionController(settings)
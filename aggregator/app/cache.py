@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# Cache respons baca (/events, /stats) in-process: body sudah di-serialize
+# (bytes) + ETag, jadi hit tidak menyentuh pool maupun serializer. Invalidasi
+# per topic pakai counter generasi: entry menyimpan generasi saat query
+# dimulai, dan dianggap basi begitu topic-nya (atau "semua topic") ditulis.
+# Generasi topic = nilai _all_gen saat topic terakhir ditulis; topic yang tidak
+# tercatat memakai _floor. Map per topic dipangkas ke topic yang masih punya
+# entry (paling banyak max_entries), sisanya jatuh ke _floor = _all_gen saat itu:
+# paling buruk satu miss ekstra, tidak pernah entry basi dianggap segar.
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match memakai perbandingan lemah: prefix W/ diabaikan di kedua sisi
+    if not if_none_match:
+        return False
+    etag = etag.removeprefix("W/")
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "headers", "expires", "topic", "gen")
+
+    def __init__(self, body: bytes, headers: Dict[str, str], expires: float,
+                 topic: Optional[str], gen: Optional[int]) -> None:
+        self.body = body
+        self.etag = etag_for(body)
+        self.headers = headers
+        self.expires = expires
+        self.topic = topic
+        self.gen = gen
+
+
+Loader = Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]
+
+ALL_TOPICS = None  # dependensi "semua topic" (mis. /events tanpa filter topic)
+NO_INVALIDATION = ...  # hanya TTL (mis. /stats: berubah di tiap write)
+
+
+class ResponseCache:
+    """LRU + TTL, invalidasi per topic, single-flight untuk miss pada key yang sama."""
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 1.0) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self._topic_gen: Dict[str, int] = {}
+        self._all_gen = 0  # juga jam global generasi topic
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _generation(self, topic) -> Optional[int]:
+        if topic is NO_INVALIDATION:
+            return None
+        if topic is ALL_TOPICS:
+            return self._all_gen
+        return self._topic_gen.get(topic, self._floor)
+
+    def _fresh(self, e: CachedResponse) -> bool:
+        return e.expires > time.monotonic() and e.gen == self._generation(e.topic)
+
+    async def get_or_load(self, key: Hashable, topic, loader: Loader, ttl_s: Optional[float] = None
+                          ) -> Tuple[CachedResponse, bool]:
+        """Return (entry, hit). `topic` = topic yang jadi dependensi entry,
+        ALL_TOPICS, atau NO_INVALIDATION."""
+        e = self._entries.get(key)
+        if e is not None:
+            if self._fresh(e):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return e, True
+            del self._entries[key]
+        # Miss bersamaan pada key yang sama menunggu satu query saja
+        pending = self._loading.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending), True
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._loading[key] = fut
+        gen = self._generation(topic)  # diambil SEBELUM query: write di tengah jalan membuat entry basi
+        try:
+            body, headers = await loader()
+            e = CachedResponse(body, headers, time.monotonic() + (self.ttl_s if ttl_s is None else ttl_s), topic, gen)
+            fut.set_result(e)
+        except BaseException as exc:
+            fut.set_exception(exc)
+            fut.exception()  # ditandai sudah diambil bila tidak ada yang menunggu
+            raise
+        finally:
+            del self._loading[key]
+        self._entries[key] = e
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return e, False
+
+    def invalidate(self, topics: Iterable[str]) -> None:
+        """Dipanggil setelah commit yang menambah baris ke `topics`."""
+        topics = list(topics)
+        if not topics:
+            return
+        self._all_gen += 1
+        for t in topics:
+            self._topic_gen[t] = self._all_gen
+        self.invalidations += 1
+        if len(self._topic_gen) > 2 * self.max_entries:
+            self._prune_generations()
+
+    def _prune_generations(self) -> None:
+        # Topic yang masih punya entry dipatok ke generasinya sekarang
+        live = {e.topic for e in self._entries.values() if isinstance(e.topic, str)}
+        self._topic_gen = {t: self._topic_gen.get(t, self._floor) for t in live}
+        self._floor = self._all_gen
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def build_response_cache(settings) -> Optional[ResponseCache]:
+    if not settings.response_cache_enabled:
+        return None
+    return ResponseCache(settings.response_cache_max_entries, settings.response_cache_ttl_ms / 1000.0)
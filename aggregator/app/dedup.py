@@ -0,0 +1,195 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from .partitions import dedup_ttl
+
+Key = Tuple[str, str]
+
+
+class LRUKeys:
+    """LRU terbatas berisi key (topic, event_id) yang SUDAH pasti ada di DB.
+
+    Tiap key boleh punya batas waktu (epoch detik); lewat dari itu key dianggap
+    tidak ada lagi (baris dedup_keys-nya mungkin sudah dipurge).
+    """
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[Key, Optional[float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Key) -> bool:
+        if key not in self._keys:
+            return False
+        expires = self._keys[key]
+        if expires is not None and time.time() >= expires:
+            del self._keys[key]
+            return False
+        self._keys.move_to_end(key)
+        return True
+
+    def add(self, key: Key, expires: Optional[float] = None) -> None:
+        self._keys[key] = expires
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+
+
+class _Bloom:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.nbits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.nbits / capacity * math.log(2)))
+        self.bits = bytearray((self.nbits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, h1: int, h2: int):
+        for i in range(self.k):
+            yield (h1 + i * h2) % self.nbits
+
+    def add(self, h1: int, h2: int) -> None:
+        for p in self._positions(h1, h2):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, h: Tuple[int, int]) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(*h))
+
+
+class ScalableBloom:
+    """Scalable Bloom filter (filter baru 2x kapasitas saat penuh) dengan batas memori.
+
+    Hanya dipakai sebagai pre-check negatif: "pasti belum pernah dilihat proses
+    ini". Jawaban positif bisa false positive, jadi tidak pernah dipakai sendiri
+    untuk menyatakan duplikat.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01, max_bytes: int = 16 << 20) -> None:
+        self.initial_capacity = capacity
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.filters: List[_Bloom] = []
+        self._grow()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(f.bits) for f in self.filters)
+
+    def _grow(self) -> None:
+        n = len(self.filters)
+        # Error rate tiap filter baru diperketat (r=0.5) supaya total tetap terbatas
+        f = _Bloom(self.initial_capacity * (2 ** n), self.error_rate * (0.5 ** (n + 1)))
+        self.filters.append(f)
+        # Lewat batas memori: buang filter tertua (hanya menambah miss, tidak pernah salah)
+        while len(self.filters) > 1 and self.nbytes > self.max_bytes:
+            self.filters.pop(0)
+
+    @staticmethod
+    def _hash(key: Key) -> Tuple[int, int]:
+        d = hashlib.blake2b(f"{key[0]}\x00{key[1]}".encode(), digest_size=16).digest()
+        return int.from_bytes(d[:8], "little"), int.from_bytes(d[8:], "little") | 1
+
+    def add(self, key: Key) -> None:
+        h = self._hash(key)
+        if any(h in f for f in self.filters):
+            return
+        if self.filters[-1].count >= self.filters[-1].capacity:
+            self._grow()
+        self.filters[-1].add(*h)
+
+    def __contains__(self, key: Key) -> bool:
+        h = self._hash(key)
+        return any(h in f for f in self.filters)
+
+
+class DedupCache:
+    """Pre-filter dedup per proses di depan INSERT ... ON CONFLICT.
+
+    Key hanya dicatat setelah transaksi commit, sehingga hit LRU = event pasti
+    sudah ada di DB dan boleh langsung dihitung duplikat. Semua yang tidak bisa
+    dikonfirmasi (miss) tetap dikirim ke DB; unique constraint tetap sumber kebenaran.
+
+    Bila dedup_keys dipurge (`ttl_sec`), purge memakai first_seen sedangkan
+    cache tiap proses tidak ikut diberi tahu. Karena itu hanya key yang diklaim
+    proses ini sendiri (first_seen >= awal transaksinya) yang masuk LRU, dan
+    hanya dipercaya selama setengah TTL; sisa setengahnya menampung selisih jam
+    proses vs DB dan jeda maintenance. Key yang ternyata duplikat di DB
+    (first_seen tidak diketahui) cuma masuk Bloom. Rebalance tidak butuh
+    invalidasi: key dipindah beserta dedup_keys-nya, jadi hit tetap duplikat.
+    """
+
+    def __init__(self, max_keys: int, bloom: Optional[ScalableBloom] = None,
+                 ttl_sec: Optional[float] = None) -> None:
+        self.lru = LRUKeys(max_keys)
+        self.bloom = bloom
+        self.trust_sec = ttl_sec / 2 if ttl_sec is not None else None
+        self.hits = 0
+        self.misses = 0
+        self.bloom_negatives = 0
+
+    def split(self, events: list) -> Tuple[list, list]:
+        """Return (event yang harus ke DB, event duplikat yang sudah pasti)."""
+        fresh, known = [], []
+        for e in events:
+            key = (e.topic, e.event_id)
+            if self.bloom is not None and key not in self.bloom:
+                self.bloom_negatives += 1
+                self.misses += 1
+                fresh.append(e)
+            elif key in self.lru:
+                self.hits += 1
+                known.append(e)
+            else:
+                self.misses += 1
+                fresh.append(e)
+        return fresh, known
+
+    def remember(self, keys: Iterable[Key]) -> None:
+        """Key yang sudah commit di DB (baru atau duplikat), umur barisnya tidak diketahui."""
+        for key in keys:
+            if self.trust_sec is None:
+                self.lru.add(key)
+            if self.bloom is not None:
+                self.bloom.add(key)
+
+    def remember_claimed(self, keys: Iterable[Key], since: float) -> None:
+        """Key yang baru diklaim di dedup_keys oleh transaksi yang mulai setelah `since`."""
+        expires = since + self.trust_sec if self.trust_sec is not None else None
+        for key in keys:
+            self.lru.add(key, expires)
+            if self.bloom is not None:
+                self.bloom.add(key)
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        out = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "lru_keys": len(self.lru),
+            "lru_max_keys": self.lru.max_keys,
+        }
+        if self.bloom is not None:
+            out["bloom_negatives"] = self.bloom_negatives
+            out["bloom_bytes"] = self.bloom.nbytes
+            out["bloom_filters"] = len(self.bloom.filters)
+        return out
+
+
+def build_dedup_cache(settings) -> Optional[DedupCache]:
+    if not settings.dedup_cache_enabled:
+        return None
+    bloom = None
+    if settings.dedup_bloom_enabled:
+        bloom = ScalableBloom(
+            settings.dedup_bloom_capacity,
+            settings.dedup_bloom_error_rate,
+            settings.dedup_bloom_max_bytes,
+        )
+    ttl = dedup_ttl(settings)
+    return DedupCache(settings.dedup_cache_max_keys, bloom, ttl.total_seconds() if ttl is not None else None)
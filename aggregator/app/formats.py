@@ -0,0 +1,332 @@
+"""Decode body POST /publish: Content-Encoding (gzip/zstd) + content type
+(JSON, NDJSON, MessagePack). Semua format menghasilkan list dict mentah yang
+divalidasi EventIn yang sama di main. Untuk /publish/stream ada decoder
+inkremental (stream_decoder + LineSplitter): body tidak pernah utuh di memori.
+
+zstd dan MessagePack butuh paket opsional (`zstandard`, `msgpack`); bila tidak
+terpasang, request dengan format itu ditolak 415, format lain tetap jalan.
+"""
+import zlib
+from typing import Any, Iterator, List, Optional
+
+import orjson
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - tergantung environment
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - tergantung environment
+    msgpack = None
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/jsonlines"}
+MSGPACK_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+
+
+class UnsupportedMediaType(Exception):
+    """Content-Encoding tidak dikenal, atau paket opsional format tidak terpasang (415)."""
+
+
+class BodyTooLarge(Exception):
+    """Body (setelah dekompresi) melewati publish_max_body_bytes (413)."""
+
+
+def supported_encodings() -> List[str]:
+    return ["gzip"] + (["zstd"] if zstandard is not None else [])
+
+
+def _gunzip(data: bytes, max_bytes: int) -> bytes:
+    # Output dibatasi max_bytes + 1: bom gzip berhenti tanpa mengisi memori
+    out = b""
+    while data:  # beberapa member gzip berurutan = satu body
+        d = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            out += d.decompress(data, max_bytes + 1 - len(out))
+        except zlib.error as e:
+            raise ValueError(f"gzip rusak: {e}")
+        if len(out) > max_bytes or d.unconsumed_tail:
+            raise BodyTooLarge()
+        if not d.eof:
+            raise ValueError("gzip terpotong")
+        data = d.unused_data
+    return out
+
+
+def _unzstd(data: bytes, max_bytes: int) -> bytes:
+    # stream_reader: frame tanpa content size juga bisa, dan output dibatasi
+    chunks, n = [], 0
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(data) as r:
+            while True:
+                chunk = r.read(min(1 << 20, max_bytes + 1 - n))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                n += len(chunk)
+                if n > max_bytes:
+                    raise BodyTooLarge()
+    except zstandard.ZstdError as e:
+        raise ValueError(f"zstd rusak: {e}")
+    # Frame terpotong dibaca reader sebagai EOF biasa (output sebagian)
+    frames = _ZstdFrames()
+    frames.scan(data)
+    if not frames.complete:
+        raise ValueError("zstd terpotong")
+    return b"".join(chunks)
+
+
+def decode_body(data: bytes, content_encoding: Optional[str], max_bytes: int) -> bytes:
+    """Buka Content-Encoding (boleh berantai, mis. "gzip, zstd" = dibuka dari kanan)."""
+    codings = [c.strip().lower() for c in (content_encoding or "").split(",") if c.strip()]
+    for coding in reversed(codings):
+        if coding == "identity":
+            continue
+        if coding in ("gzip", "x-gzip"):
+            data = _gunzip(data, max_bytes)
+        elif coding == "zstd" and zstandard is not None:
+            data = _unzstd(data, max_bytes)
+        elif coding == "zstd":
+            raise UnsupportedMediaType("zstd butuh paket 'zstandard'")
+        else:
+            raise UnsupportedMediaType(f"Content-Encoding '{coding}' tidak didukung")
+    if len(data) > max_bytes:
+        raise BodyTooLarge()
+    return data
+
+
+class _GzipStream:
+    # max_length per decompress: satu chunk jaringan tidak bisa mengembang
+    # tanpa batas di memori (sisa input diproses di iterasi berikutnya)
+    PIECE = 1 << 20
+
+    def __init__(self) -> None:
+        self._d = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        self._in_member = False
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        while data:
+            self._in_member = True
+            try:
+                out = self._d.decompress(data, self.PIECE)
+            except zlib.error as e:
+                raise ValueError(f"gzip rusak: {e}")
+            if out:
+                yield out
+            if self._d.eof:  # member berikutnya (gzip multi-member)
+                data = self._d.unused_data
+                self._d = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+                self._in_member = False
+            else:
+                data = self._d.unconsumed_tail
+
+    def finish(self) -> None:
+        if self._in_member:
+            raise ValueError("gzip terpotong")
+
+
+class _ZstdFrames:
+    """Lacak batas frame zstd dari header frame/blok saja (tanpa dekompresi).
+
+    stream_reader tidak memberi tahu apakah input berhenti tepat di akhir
+    frame; `complete` dipakai finish() untuk menolak body terpotong seperti
+    "gzip terpotong". Skippable frame ikut dilewati.
+    """
+
+    MAGIC = 0xFD2FB528
+    SKIPPABLE = 0x184D2A50  # 0x184D2A50..0x184D2A5F
+
+    def __init__(self) -> None:
+        self.complete = True  # body kosong = tidak ada frame yang terbuka
+        self._state = "magic"
+        self._need = 4
+        self._hdr = b""
+        self._skip = 0
+        self._checksum = False
+
+    def scan(self, data: bytes) -> None:
+        pos, n = 0, len(data)
+        while pos < n:
+            if self._skip:
+                step = min(self._skip, n - pos)
+                self._skip -= step
+                pos += step
+            else:
+                take = min(self._need - len(self._hdr), n - pos)
+                self._hdr += data[pos:pos + take]
+                pos += take
+                if len(self._hdr) == self._need:
+                    hdr, self._hdr = self._hdr, b""
+                    self._field(hdr)
+            if self._state == "end" and not self._skip:
+                self._state, self._need, self.complete = "magic", 4, True
+
+    def _field(self, hdr: bytes) -> None:
+        value = int.from_bytes(hdr, "little")
+        if self._state == "magic":
+            self.complete = False
+            if value == self.MAGIC:
+                self._state, self._need = "descriptor", 1
+            elif value & 0xFFFFFFF0 == self.SKIPPABLE:
+                self._state, self._need = "skippable", 4
+            else:
+                raise ValueError("zstd rusak: magic number frame tidak dikenal")
+        elif self._state == "skippable":
+            self._state, self._skip = "end", value
+        elif self._state == "descriptor":
+            # Sisa header: window descriptor, dictionary id, frame content size
+            single_segment = value >> 5 & 1
+            self._checksum = bool(value >> 2 & 1)
+            self._skip = ((0 if single_segment else 1) + (0, 1, 2, 4)[value & 3]
+                          + (single_segment, 2, 4, 8)[value >> 6])
+            self._state, self._need = "block", 3
+        else:  # header blok: bit 0 = blok terakhir, bit 1-2 = tipe, sisanya ukuran
+            last, kind, size = value & 1, value >> 1 & 3, value >> 3
+            self._skip = 1 if kind == 1 else size  # RLE: satu byte di-ulang `size` kali
+            if last:
+                self._skip += 4 if self._checksum else 0
+                self._state = "end"
+
+
+class _InputDrained(Exception):
+    """Buffer input stream habis; tunggu chunk jaringan berikutnya."""
+
+
+class _PushSource:
+    # Sumber stream_reader yang diisi feed(). Saat kosong dilempar _InputDrained,
+    # bukan b"" (b"" = EOF permanen bagi reader). read1 hanya membaca sumber
+    # bila belum ada output, jadi tidak ada output yang hilang karena exception.
+    def __init__(self) -> None:
+        self.buf = b""
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.buf:
+            raise _InputDrained()
+        if size < 0:
+            size = len(self.buf)
+        out, self.buf = self.buf[:size], self.buf[size:]
+        return out
+
+
+class _ZstdStream:
+    # Sama seperti gzip: output per langkah paling banyak PIECE, jadi satu
+    # chunk jaringan tidak bisa mengembang tanpa batas di memori (decompressobj
+    # zstandard tidak punya max_length, maka dipakai stream_reader + read1)
+    PIECE = _GzipStream.PIECE
+
+    def __init__(self) -> None:
+        self._src = _PushSource()
+        self._r = zstandard.ZstdDecompressor().stream_reader(self._src, read_across_frames=True)
+        self._frames = _ZstdFrames()
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        self._frames.scan(data)
+        self._src.buf += data
+        while True:
+            try:
+                out = self._r.read1(self.PIECE)
+            except _InputDrained:
+                return
+            except zstandard.ZstdError as e:
+                raise ValueError(f"zstd rusak: {e}")
+            if not out:
+                return
+            yield out
+
+    def finish(self) -> None:
+        if not self._frames.complete:
+            raise ValueError("zstd terpotong")
+
+
+class _Identity:
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        if data:
+            yield data
+
+    def finish(self) -> None:
+        pass
+
+
+def stream_decoder(content_encoding: Optional[str]):
+    """Decoder inkremental untuk body streaming (satu Content-Encoding)."""
+    codings = [c.strip().lower() for c in (content_encoding or "").split(",")]
+    codings = [c for c in codings if c and c != "identity"]
+    if not codings:
+        return _Identity()
+    if len(codings) > 1:
+        raise UnsupportedMediaType("streaming hanya mendukung satu Content-Encoding")
+    if codings[0] in ("gzip", "x-gzip"):
+        return _GzipStream()
+    if codings[0] == "zstd":
+        if zstandard is None:
+            raise UnsupportedMediaType("zstd butuh paket 'zstandard'")
+        return _ZstdStream()
+    raise UnsupportedMediaType(f"Content-Encoding '{codings[0]}' tidak didukung")
+
+
+class LineSplitter:
+    """Potong aliran byte jadi baris utuh; baris > max_line_bytes ditolak."""
+
+    def __init__(self, max_line_bytes: int) -> None:
+        self.max_line_bytes = max_line_bytes
+        self._tail = b""
+
+    def feed(self, data: bytes) -> List[bytes]:
+        lines = (self._tail + data).split(b"\n")
+        self._tail = lines.pop()
+        if len(self._tail) > self.max_line_bytes or any(len(x) > self.max_line_bytes for x in lines):
+            raise BodyTooLarge()
+        return lines
+
+    def finish(self) -> List[bytes]:
+        tail, self._tail = self._tail, b""
+        return [tail] if tail.strip() else []
+
+
+def media_type(content_type: Optional[str]) -> str:
+    return (content_type or "application/json").split(";", 1)[0].strip().lower()
+
+
+def ndjson_record(line: bytes, lineno: int) -> Any:
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError:
+        raise ValueError(f"NDJSON baris {lineno} bukan JSON valid")
+
+
+def parse_ndjson(data: bytes) -> List[Any]:
+    return [ndjson_record(line, n) for n, line in enumerate(data.splitlines(), 1) if line.strip()]
+
+
+def parse_body(data: bytes, content_type: Optional[str]) -> Any:
+    """Body (sudah didekompresi) -> objek Python sesuai content type.
+
+    JSON dan MessagePack boleh berbentuk event tunggal, array, atau
+    {"events": [...]}; NDJSON selalu satu event per baris (hasilnya list).
+    Content type lain tetap dibaca sebagai JSON seperti sebelumnya (mis.
+    `curl -d` yang mengirim x-www-form-urlencoded).
+    """
+    mt = media_type(content_type)
+    if mt in NDJSON_TYPES:
+        return parse_ndjson(data)
+    if mt in MSGPACK_TYPES:
+        if msgpack is None:
+            raise UnsupportedMediaType("MessagePack butuh paket 'msgpack'")
+        try:
+            # timestamp=3: ext timestamp MessagePack -> datetime (UTC)
+            body = msgpack.unpackb(data, raw=False, strict_map_key=False, timestamp=3)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"MessagePack tidak valid: {e}")
+        # Payload disimpan sebagai jsonb lewat orjson: bin (bytes), key map
+        # non-string, dan ext lain harus ditolak di sini (400), bukan gagal
+        # di codec jsonb di tengah transaksi insert (500)
+        try:
+            orjson.dumps(body)
+        except orjson.JSONEncodeError as e:
+            raise ValueError(f"MessagePack tidak bisa direpresentasikan sebagai JSON: {e}")
+        return body
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        raise ValueError("Invalid JSON body")
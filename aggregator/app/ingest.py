@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from .db import (
+    add_stats,
+    add_topic_rollup,
+    add_topic_stats,
+    claim_keys,
+    complete_receipts,
+    insert_claimed,
+    insert_receipts,
+    notify_pending,
+    pick_shard,
+    resolve_sources,
+)
+from .metrics import AppMetrics
+
+log = logging.getLogger("ingest")
+
+SOURCE_CACHE_MAX = 10_000
+
+
+def topic_deltas(rows: Sequence[Tuple], inserted_keys, known: Sequence = (), done: bool = False) -> dict:
+    """Delta agregat per topic: topic -> [received, inserted, done, first_ts, last_ts].
+
+    `rows` = (topic, event_id, ts, ...) yang dikirim ke DB, `known` = duplikat
+    yang sudah disaring cache (tetap dihitung received). first/last_ts dari
+    ts_ingest event yang benar-benar ter-insert.
+    """
+    agg: dict = {}
+    ts_by_key = {}
+    for r in rows:
+        agg.setdefault(r[0], [0, 0, 0, None, None])[0] += 1
+        ts_by_key.setdefault((r[0], r[1]), r[2])
+    for e in known:
+        agg.setdefault(e.topic, [0, 0, 0, None, None])[0] += 1
+    for key in inserted_keys:
+        a = agg[key[0]]
+        a[1] += 1
+        if done:
+            a[2] += 1
+        ts = ts_by_key[key]
+        a[3] = ts if a[3] is None or ts < a[3] else a[3]
+        a[4] = ts if a[4] is None or ts > a[4] else a[4]
+    return agg
+
+
+def attribute_inserted(groups: Sequence[list], inserted_keys) -> List[int]:
+    """Hitung jumlah inserted per group dari key yang dikembalikan RETURNING.
+
+    Kalau key yang sama muncul beberapa kali (dalam satu request atau lintas
+    request yang digabung), hanya kemunculan pertama yang dihitung inserted.
+    """
+    remaining = set(inserted_keys)
+    out = []
+    for events in groups:
+        n = 0
+        for e in events:
+            key = (e.topic, e.event_id)
+            if key in remaining:
+                remaining.discard(key)
+                n += 1
+        out.append(n)
+    return out
+
+
+class Ingestor:
+    """Tulis satu atau beberapa batch event dalam SATU transaksi."""
+
+    def __init__(self, pool, settings, metrics: Optional[AppMetrics] = None) -> None:
+        self.pool = pool
+        self.settings = settings
+        self.metrics = metrics or AppMetrics()
+        # workers=0 -> diproses inline (langsung 'done' + unique_processed);
+        # workers>0 -> masuk antrian, unique_processed dihitung oleh mark_done
+        self.inline = settings.workers <= 0
+        self.status = "done" if self.inline else "pending"
+        # Dipanggil setelah commit dengan set topic yang mendapat baris baru
+        # (mis. ResponseCache.invalidate, SubscriptionHub.wake)
+        self.commit_listeners: List[Callable[[Set[str]], None]] = []
+        # Dipanggil setelah commit dengan key yang baru masuk dedup_keys dan epoch
+        # sebelum transaksi dimulai (batas bawah first_seen; DedupCache.remember_claimed)
+        self.claim_listeners: List[Callable[[List[Tuple[str, str]], float], None]] = []
+        self.source_ids: Dict[str, int] = {}  # cache kamus event_sources
+
+    async def _resolve_sources(self, conn, groups: Sequence[list]) -> None:
+        # Di luar transaksi insert: id di cache selalu milik baris yang sudah commit
+        missing = {e.source for events in groups for e in events} - self.source_ids.keys()
+        if missing:
+            if len(self.source_ids) + len(missing) > SOURCE_CACHE_MAX:
+                self.source_ids.clear()
+            self.source_ids.update(await resolve_sources(conn, missing))
+
+    def _committed(self, keys: Sequence[Tuple[str, str]], since: float) -> None:
+        if keys and self.commit_listeners:
+            topics = {topic for topic, _ in keys}
+            for listener in self.commit_listeners:
+                listener(topics)
+        if keys:
+            for claim_listener in self.claim_listeners:
+                claim_listener(keys, since)
+
+    async def _write(self, conn, groups: Sequence[list], received: int, known: Sequence = (),
+                     before_insert: Optional[Callable[[List[Tuple[str, str]]], Awaitable[None]]] = None,
+                     ) -> List[Tuple[str, str]]:
+        # payload dikirim sebagai dict; di-encode sekali oleh codec jsonb (orjson)
+        rows = [(e.topic, e.event_id, e.timestamp, e.source, e.payload) for events in groups for e in events]
+        # Statement set-based untuk seluruh batch (bukan 1 INSERT per event)
+        keys = await claim_keys(conn, rows)
+        inserted = len(keys)
+        shard = pick_shard(self.settings.stats_shards)
+        await add_stats(conn, received, inserted if self.inline else 0, received - inserted, shard=shard)
+        deltas = topic_deltas(rows, keys, known, done=self.inline)
+        await add_topic_stats(conn, deltas, shard)
+        if self.settings.topic_rollup_enabled:
+            await add_topic_rollup(conn, deltas, shard)
+        if before_insert is not None:
+            await before_insert(keys)
+        if inserted and not self.inline and self.settings.notify_enabled:
+            await notify_pending(conn)
+        # Paling akhir: alokasi seq mengunci baris topic_seq sampai commit
+        await insert_claimed(conn, rows, keys, self.status, self.source_ids)
+        m = self.metrics
+        m.db_batch_rows.observe(len(rows))
+        m.rows_inserted.inc(inserted)
+        m.rows_duplicated.inc(received - inserted)
+        return keys
+
+    async def write_groups(self, groups: Sequence[list], received: int, known: Sequence = ()) -> List[int]:
+        """`groups` = list batch event (sudah lolos pre-filter), `received` = total
+        event yang diterima termasuk duplikat yang sudah disaring cache (`known`).
+        Return jumlah inserted per group."""
+        m = self.metrics
+        async with m.acquire(self.pool, self.settings.db_acquire_timeout_sec) as conn:
+            await self._resolve_sources(conn, groups)
+            t1 = time.perf_counter()
+            since = time.time()
+            async with conn.transaction():
+                keys = await self._write(conn, groups, received, known)
+        m.db_batch_seconds.observe(time.perf_counter() - t1)
+        self._committed(keys, since)
+        if len(groups) == 1:
+            return [len(keys)]
+        return attribute_inserted(groups, keys)
+
+    async def write_receipted(self, records: Sequence[Tuple[str, list]]) -> None:
+        """Tulis record WAL (receipt, events) dalam satu transaksi, idempotent per receipt.
+
+        Receipt yang sudah ada di wal_receipts (replay setelah crash) dilewati
+        utuh, jadi stats tidak terhitung dua kali.
+        """
+        m = self.metrics
+        keys = []
+        async with m.acquire(self.pool, self.settings.db_acquire_timeout_sec) as conn:
+            await self._resolve_sources(conn, [ev for _, ev in records])
+            t1 = time.perf_counter()
+            since = time.time()
+            async with conn.transaction():
+                new = await insert_receipts(conn, [r for r, _ in records], [len(ev) for _, ev in records])
+                fresh = [(r, ev) for r, ev in records if r in new]
+                if fresh:
+                    groups = [ev for _, ev in fresh]
+
+                    async def complete(new_keys):
+                        await complete_receipts(conn, [r for r, _ in fresh], attribute_inserted(groups, new_keys))
+
+                    keys = await self._write(conn, groups, sum(len(ev) for ev in groups), before_insert=complete)
+        m.db_batch_seconds.observe(time.perf_counter() - t1)
+        self._committed(keys, since)
+
+
+class Coalescer:
+    """Gabungkan event dari request /publish yang bersamaan ke transaksi bersama.
+
+    Request dikumpulkan sampai `window_ms` atau `max_events`, lalu ditulis dalam
+    satu transaksi; tiap request menerima hasil inserted-nya sendiri lewat future.
+    Window hanya ditunggu bila ada flush lain yang sedang berjalan.
+    """
+
+    def __init__(self, ingestor: Ingestor, window_ms: float, max_events: int, max_inflight: int = 4) -> None:
+        self.ingestor = ingestor
+        self.window_s = max(0.0, window_ms / 1000.0)
+        self.max_events = max(1, max_events)
+        self._pending: list = []  # (events, received, known, future)
+        self._pending_events = 0
+        self._has_work = asyncio.Event()
+        self._full = asyncio.Event()
+        self._inflight = asyncio.Semaphore(max(1, max_inflight))
+        self._flushes: set = set()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_requests = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="ingest-coalescer")
+
+    async def submit(self, events: list, received: int, known: Sequence = ()) -> int:
+        if self._closing:
+            raise RuntimeError("coalescer sedang berhenti")
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((events, received, known, fut))
+        self._pending_events += len(events)
+        self._has_work.set()
+        if self._pending_events >= self.max_events:
+            self._full.set()
+        return await fut
+
+    def _take(self) -> list:
+        # Ambil request utuh sampai max_events (request besar tetap tidak dipecah)
+        batch, n = [], 0
+        while self._pending and (not batch or n + len(self._pending[0][0]) <= self.max_events):
+            item = self._pending.pop(0)
+            batch.append(item)
+            n += len(item[0])
+        self._pending_events -= n
+        if not self._pending:
+            self._has_work.clear()
+        if self._pending_events < self.max_events:
+            self._full.clear()
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_work.wait()
+            # Tidak ada transaksi berjalan -> langsung flush (latency rendah saat sepi);
+            # selama ada flush berjalan, request baru menumpuk sampai window/max_events
+            if self._flushes and not self._closing and not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.window_s)
+                except asyncio.TimeoutError:
+                    pass
+            await self._inflight.acquire()
+            batch = self._take()
+            if not batch:
+                self._inflight.release()
+                if self._closing:
+                    return
+                continue
+            t = asyncio.create_task(self._flush(batch))
+            self._flushes.add(t)
+            t.add_done_callback(self._flushes.discard)
+            if self._closing and not self._pending:
+                return
+
+    async def _flush(self, batch: list) -> None:
+        try:
+            results = await self.ingestor.write_groups(
+                [b[0] for b in batch], sum(b[1] for b in batch), [e for b in batch for e in b[2]])
+        except Exception as e:
+            for *_, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for (*_, fut), n in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(n)
+        finally:
+            self.flushes += 1
+            self.flushed_requests += len(batch)
+            self._inflight.release()
+
+    async def close(self) -> None:
+        # Flush sisa request lalu tunggu transaksi yang sedang berjalan
+        self._closing = True
+        self._has_work.set()
+        if self._task:
+            await self._task
+        await asyncio.gather(*list(self._flushes), return_exceptions=True)
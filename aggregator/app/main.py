@@ -1,25 +1,56 @@
 from __future__ import annotations
-from contextlib import asynccontextmanager
-from datetime import datetime
+from contextlib import AsyncExitStack, asynccontextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
 from typing import Any, List, Optional
-import json
+import asyncio
+import base64
+import time
+import uuid
 
-from fastapi import FastAPI, HTTPException, Query, Request
-from pydantic import BaseModel, Field, ValidationError
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 
-from .db import init_db
+from .db import (
+    events_query,
+    read_offsets,
+    get_receipt,
+    init_db,
+    pool_options,
+    read_stats,
+    read_topic_rollup,
+    read_topic_stats,
+    storage_report,
+)
+from .admission import Overloaded, build_admission
+from .cache import CachedResponse, build_response_cache, etag_for, etag_matches
+from .formats import (
+    MSGPACK_TYPES,
+    NDJSON_TYPES,
+    BodyTooLarge,
+    LineSplitter,
+    UnsupportedMediaType,
+    decode_body,
+    media_type,
+    ndjson_record,
+    parse_body,
+    stream_decoder,
+    supported_encodings,
+)
+from .ingest import Coalescer, Ingestor
+from .metrics import AppMetrics
+from .models import EventIn, StatsResponse, TopicCount
+from .dedup import build_dedup_cache
+from .notify import Listener, Wakeup
+from .partitions import maintenance_loop, run_maintenance
+from .wal import WalFlusher, WalFull, WriteAheadLog
+from .worker import WorkerStats, start_workers
 # Pastikan file settings.py kamu memiliki class Settings
 from .settings import Settings 
-
-# =========================
-# Pydantic models
-# =========================
-class EventIn(BaseModel):
-    topic: str = Field(min_length=1)
-    event_id: str = Field(min_length=1)
-    timestamp: datetime
-    source: str = Field(min_length=1)
-    payload: dict[str, Any]
+from .shards import ShardedIngestor, ShardSet, merge_event_streams, merge_events
+from .subscriptions import SubscriptionHub, decode_position, encode_position
 
 # =========================
 # Helper Functions
@@ -34,11 +65,77 @@ def _normalize_payload(body: Any) -> List[dict]:
     if isinstance(body, dict): return [body]
     raise HTTPException(status_code=400, detail="Body format salah")
 
-def _parse_events(raw_events: List[dict]) -> List[EventIn]:
+# Validasi seluruh list dalam satu panggilan pydantic-core
+_EVENTS_ADAPTER = TypeAdapter(List[EventIn])
+
+# orjson bisa meng-encode payload lebih panjang dari teks sumbernya: angka
+# dinormalisasi ("1e15", 4 byte -> "1000000000000000.0", 18 byte). Spasi,
+# escape \uXXXX, dsb. hanya memendekkan, jadi 5x teks sumber = batas atas aman.
+JSON_REENCODE_GROWTH = 5
+
+def _payload_limit(json_bytes: int, max_payload_bytes: int) -> int:
+    # Payload adalah potongan teks JSON body/baris (sudah didekompresi): bila
+    # teks itu x JSON_REENCODE_GROWTH masih di bawah batas, payload hasil encode
+    # juga -> lewati orjson.dumps per event (encode ganda yang dihapus user-005).
+    # Selain itu (dan selalu untuk MessagePack) ukuran diukur per event.
+    return 0 if json_bytes * JSON_REENCODE_GROWTH <= max_payload_bytes else max_payload_bytes
+
+def _parse_events(raw_events: List[dict], max_payload_bytes: int = 0) -> List[EventIn]:
+    ctx = {"max_payload_bytes": max_payload_bytes}
+    try:
+        return _EVENTS_ADAPTER.validate_python(raw_events, context=ctx)
+    except ValidationError:
+        pass
+    # Jalur lambat hanya saat ada error: validasi per item supaya detail error
+    # sama persis seperti sebelumnya (error item pertama yang gagal, tanpa index)
     try:
-        return [EventIn.model_validate(e) for e in raw_events]
+        return [EventIn.model_validate(e, context=ctx) for e in raw_events]
     except ValidationError as ve:
-        raise HTTPException(status_code=400, detail=ve.errors())
+        # ve.json(): ctx bisa berisi exception (mis. ValueError validator payload)
+        raise HTTPException(status_code=400, detail=orjson.loads(ve.json()))
+
+def _parse_lines(raw_events: List[dict], linenos: List[int], max_payload_bytes: int = 0) -> List[EventIn]:
+    # Seperti _parse_events, tapi error menyebut nomor baris NDJSON
+    ctx = {"max_payload_bytes": max_payload_bytes}
+    try:
+        return _EVENTS_ADAPTER.validate_python(raw_events, context=ctx)
+    except ValidationError:
+        pass
+    for raw, lineno in zip(raw_events, linenos):
+        try:
+            EventIn.model_validate(raw, context=ctx)
+        except ValidationError as ve:
+            raise HTTPException(status_code=400, detail={"line": lineno, "errors": orjson.loads(ve.json())})
+    return _parse_events(raw_events, max_payload_bytes)
+
+def _encode_cursor(row) -> str:
+    # Cursor opaque: posisi keyset (ts_ingest, topic, event_id) baris terakhir
+    raw = orjson.dumps([row["ts_ingest"].isoformat(), row["topic"], row["event_id"]])
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _conditional(request: Request, body: bytes, etag: str, headers: Optional[dict] = None) -> Response:
+    # If-None-Match cocok -> 304 tanpa body (klien memakai salinan lokalnya)
+    headers = {**(headers or {}), "ETag": etag}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    if not cursor:
+        return None
+    try:
+        ts, topic, event_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(ts), topic, event_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor tidak valid")
+
+def _check_after_seq(topic: Optional[str], cursor: Optional[str], after_seq: Optional[int]) -> Optional[int]:
+    # seq hanya urut di dalam satu topic; cursor keyset memakai urutan lain
+    if after_seq is not None and not topic:
+        raise HTTPException(status_code=400, detail="after_seq butuh parameter topic")
+    if after_seq is not None and cursor:
+        raise HTTPException(status_code=400, detail="after_seq tidak bisa digabung dengan cursor")
+    return after_seq
 
 # =========================
 # Factory Function (Untuk Pytest & Docker)
@@ -50,69 +147,511 @@ def create_app(settings: Optional[Settings] = None) -> FastAPI:
 
     @asynccontextmanager
     async def lifespan(app: FastAPI):
-        # init_db sekarang menerima URL dari settings
-        pool = await init_db(settings.database_url)
-        app.state.db_pool = pool
+        app.state.started_at = time.monotonic()
+        # Satu pool + skema + partisi per shard (tanpa DATABASE_SHARDS: satu shard)
+        pools = await asyncio.gather(*[
+            init_db(shard.url, settings.stats_shards,
+                    on_connect=metrics.count_queries if settings.db_query_count else None, **pool_options(settings))
+            for shard in shards
+        ])
+        for shard, pool in zip(shards, pools):
+            shard.pool = pool
+            shard.ingestor = Ingestor(pool, settings, metrics)
+        app.state.db_pool = shards.shards[0].pool
+        db_ready = time.monotonic()
+        # Partisi periode berjalan + beberapa ke depan harus ada sebelum menerima event
+        await asyncio.gather(*[run_maintenance(shard.pool, settings) for shard in shards])
+        metrics.bind_pool(shards)
+        app.state.ingestor = shards.shards[0].ingestor if len(shards) == 1 else ShardedIngestor(shards)
+        if response_cache is not None:
+            app.state.ingestor.commit_listeners.append(response_cache.invalidate)
+        if dedup_cache is not None:
+            app.state.ingestor.claim_listeners.append(dedup_cache.remember_claimed)
+        app.state.coalescer = None
+        if settings.coalesce_enabled:
+            app.state.coalescer = Coalescer(
+                app.state.ingestor,
+                settings.coalesce_window_ms,
+                settings.coalesce_max_events,
+                settings.coalesce_max_inflight,
+            )
+            app.state.coalescer.start()
+        # Subscription SSE: broadcaster topic dibangunkan setelah commit lokal
+        app.state.subscriptions = SubscriptionHub(shards.pool_for, settings, metrics)
+        app.state.subscriptions.start()
+        metrics.bind_subscriptions(app.state.subscriptions)
+        app.state.ingestor.commit_listeners.append(app.state.subscriptions.wake)
+        app.state.wal = None
+        wal_flusher = None
+        if settings.wal_enabled:
+            # Replay segmen sisa run sebelumnya dimulai di sini (flusher jalan di background)
+            app.state.wal = WriteAheadLog(
+                settings.wal_dir,
+                segment_max_bytes=settings.wal_segment_max_bytes,
+                fsync=settings.wal_fsync,
+                max_backlog_bytes=settings.wal_max_backlog_bytes,
+                metrics=metrics,
+            )
+            app.state.wal.open()
+            metrics.bind_wal(app.state.wal)
+            wal_flusher = WalFlusher(app.state.wal, app.state.ingestor, settings.wal_flush_max_events)
+            wal_flusher.start()
+        # Worker pool: proses event di luar jalur request /publish (per shard)
+        stop_event = asyncio.Event()
+        listeners, wakeups, tasks = [], [], []
+        app.state.worker_stats = WorkerStats()
+        for shard in shards:
+            wakeup = None
+            if settings.workers > 0 and settings.notify_enabled:
+                wakeup = Wakeup()
+                listener = Listener(shard.url, wakeup)
+                listener.start()
+                wakeups.append(wakeup)
+                listeners.append(listener)
+            tasks += start_workers(shard.pool, settings, stop_event, wakeup=wakeup, stats=app.state.worker_stats,
+                                   metrics=metrics)
+            tasks.append(asyncio.create_task(maintenance_loop(shard.pool, settings, stop_event),
+                                             name=f"partition-maintenance-{shard.name}"))
+        # db_init = pool + migrasi (fast path bila skema terkini), total = siap menerima request
+        metrics.bind_startup({"db_init": db_ready - app.state.started_at,
+                              "total": time.monotonic() - app.state.started_at})
         try:
             yield
         finally:
-            await pool.close()
+            if app.state.coalescer is not None:
+                await app.state.coalescer.close()
+            if wal_flusher is not None:
+                # Request in-flight sudah selesai (uvicorn), jadi tidak ada append baru:
+                # flush backlog dulu, baru lepas segmen + lock slot
+                await wal_flusher.close(settings.shutdown_drain_sec)
+                await app.state.wal.close()
+            stop_event.set()
+            for wakeup in wakeups:
+                wakeup.notify_all()
+            # Worker menyelesaikan batch yang sudah di-claim; lewat batas -> cancel
+            # (claim dikembalikan ke pending oleh worker_loop)
+            _, pending = await asyncio.wait(tasks, timeout=settings.shutdown_drain_sec)
+            for t in pending:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for listener in listeners:
+                await listener.stop()
+            # Tutup stream SSE + flush offset terakhir sebelum pool ditutup
+            await app.state.subscriptions.close()
+            await asyncio.gather(*[shard.pool.close() for shard in shards])
 
     app = FastAPI(title="PubSub Log Aggregator", lifespan=lifespan)
+    shards = ShardSet.from_settings(settings)
+    app.state.shards = shards
+    dedup_cache = build_dedup_cache(settings)
+    app.state.dedup_cache = dedup_cache
+    metrics = AppMetrics()
+    app.state.metrics = metrics
+    if dedup_cache is not None:
+        metrics.bind_dedup_cache(dedup_cache)
+    response_cache = build_response_cache(settings)
+    app.state.response_cache = response_cache
+    if response_cache is not None:
+        metrics.bind_response_cache(response_cache)
+    admission = build_admission(settings)
+    app.state.admission = admission
+    if admission is not None:
+        metrics.bind_admission(admission)
+
+    async def on_shards(targets, fn, *args) -> list:
+        """fn(conn, *args) di tiap shard secara paralel, hasil urut sesuai shard."""
+        async def one(shard):
+            async with metrics.acquire(shard.pool, settings.db_acquire_timeout_sec) as conn:
+                return await fn(conn, *args)
+
+        return await asyncio.gather(*[one(shard) for shard in targets])
+
+    @app.exception_handler(asyncio.TimeoutError)
+    async def db_timeout(request: Request, exc: asyncio.TimeoutError):
+        # Pool habis (acquire timeout) atau command_timeout: overload, bukan bug klien
+        return JSONResponse(status_code=503, content={"detail": "Database busy"}, headers={"Retry-After": "1"})
+
+    @app.exception_handler(Overloaded)
+    async def overloaded(request: Request, exc: Overloaded):
+        # Tolak cepat sebelum menyentuh pool: klien mundur sesuai Retry-After
+        metrics.admission_rejected.inc(reason=exc.reason)
+        content = {"detail": "terlalu banyak request, coba lagi nanti", "reason": exc.reason}
+        if exc.key is not None:
+            content["key"] = exc.key
+        return JSONResponse(status_code=429, content=content, headers={"Retry-After": str(exc.retry_after)})
 
     @app.post("/publish")
     async def publish(request: Request):
+        t_start = time.perf_counter()
+        raw = await request.body()
+        t_parse = time.perf_counter()
         try:
-            body = await request.json()
-        except:
-            raise HTTPException(status_code=400, detail="Invalid JSON body")
-
-        events = _parse_events(_normalize_payload(body))
-        pool = request.app.state.db_pool
-        
-        received, inserted, duplicates = len(events), 0, 0
-
-        async with pool.acquire() as conn:
-            async with conn.transaction():
-                for e in events:
-                    # Perbaikan notasi titik: e.payload
-                    row = await conn.fetchrow(
-                        """
-                        INSERT INTO processed_events(topic, event_id, ts_ingest, source, payload)
-                        VALUES ($1, $2, $3, $4, $5::jsonb)
-                        ON CONFLICT (topic, event_id) DO NOTHING
-                        RETURNING 1
-                        """,
-                        e.topic, e.event_id, e.timestamp, e.source, json.dumps(e.payload)
-                    )
-                    if row: inserted += 1
-                    else: duplicates += 1
-
-                await conn.execute("UPDATE stats SET val = val + $1 WHERE key = 'received'", received)
-                if inserted: await conn.execute("UPDATE stats SET val = val + $1 WHERE key = 'unique_processed'", inserted)
-                if duplicates: await conn.execute("UPDATE stats SET val = val + $1 WHERE key = 'duplicate_dropped'", duplicates)
+            data = decode_body(raw, request.headers.get("content-encoding"), settings.publish_max_body_bytes)
+            body = parse_body(data, request.headers.get("content-type"))
+        except UnsupportedMediaType as e:
+            return JSONResponse(status_code=415, content={"detail": str(e)},
+                                headers={"Accept-Encoding": ", ".join(supported_encodings())})
+        except BodyTooLarge:
+            raise HTTPException(status_code=413, detail="body melebihi publish_max_body_bytes")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        metrics.publish_wire_bytes.inc(len(raw))
+        metrics.publish_body_bytes.inc(len(data))
+
+        # MessagePack lebih ringkas dari JSON: ukuran body bukan batas atas payload.
+        # len(data) = body setelah dekompresi (bukan ukuran di wire)
+        limit = settings.max_payload_bytes
+        if media_type(request.headers.get("content-type")) not in MSGPACK_TYPES:
+            limit = _payload_limit(len(data), limit)
+        events = _parse_events(_normalize_payload(body), limit)
+        metrics.publish_parse_seconds.observe(time.perf_counter() - t_parse)
+        received = len(events)
+        metrics.publish_requests.inc()
+        metrics.batch_size.observe(received)
+        if admission is not None:
+            admission.check_quotas(events)
+        wal = request.app.state.wal
+        if wal is not None:
+            # Ack asinkron: durable di WAL lokal -> 202; commit ke Postgres menyusul.
+            # Pre-filter dedup cache tidak dipakai di sini (key baru pasti commit belakangan).
+            receipt = uuid.uuid4().hex
+            try:
+                await wal.append(receipt, events)
+            except WalFull:
+                return JSONResponse(status_code=503, content={"detail": "WAL backlog penuh"},
+                                    headers={"Retry-After": "1"})
+            metrics.publish_seconds.observe(time.perf_counter() - t_start)
+            return JSONResponse(status_code=202,
+                                content={"accepted": received, "receipt": receipt, "status": "pending"})
+
+        # Duplikat yang sudah pasti (hit cache) tidak perlu dikirim ke DB
+        fresh, known = events, []
+        if dedup_cache is not None:
+            fresh, known = dedup_cache.split(events)
+
+        coalescer = request.app.state.coalescer
+        async with admission.slot() if admission is not None else nullcontext():
+            if coalescer is not None:
+                inserted = await coalescer.submit(fresh, received, known)
+            else:
+                inserted = (await request.app.state.ingestor.write_groups([fresh], received, known))[0]
+        duplicates = received - inserted
+
+        if dedup_cache is not None:
+            # Setelah commit semua key batch pasti ada di DB (baru atau sudah ada);
+            # key yang baru diklaim sudah dicatat lewat claim_listeners
+            dedup_cache.remember((e.topic, e.event_id) for e in fresh)
+        metrics.publish_seconds.observe(time.perf_counter() - t_start)
 
         return {"accepted": received, "inserted": inserted, "duplicates": duplicates}
 
+    @app.post("/publish/stream")
+    async def publish_stream(request: Request):
+        """NDJSON (boleh gzip/zstd) divalidasi dan di-insert per chunk selagi body
+        masih diterima. Selalu commit langsung ke Postgres (tanpa WAL/coalescer).
+
+        Error di tengah jalan menghentikan request; chunk yang sudah commit tetap
+        commit dan dilaporkan di respons error. Kirim ulang seluruh body aman
+        (dedup per (topic, event_id)).
+        """
+        t_start = time.perf_counter()
+        content_type = request.headers.get("content-type")
+        if content_type is not None and media_type(content_type) not in NDJSON_TYPES:
+            return JSONResponse(status_code=415, content={"detail": "/publish/stream hanya menerima NDJSON"})
+        try:
+            decoder = stream_decoder(request.headers.get("content-encoding"))
+        except UnsupportedMediaType as e:
+            return JSONResponse(status_code=415, content={"detail": str(e)},
+                                headers={"Accept-Encoding": ", ".join(supported_encodings())})
+        splitter = LineSplitter(settings.publish_stream_max_line_bytes)
+        ingestor = request.app.state.ingestor
+        totals = {"accepted": 0, "inserted": 0, "duplicates": 0, "chunks": 0}
+        inflight: set = set()
+
+        async def write(events: List[EventIn]) -> None:
+            fresh, known = events, []
+            if dedup_cache is not None:
+                fresh, known = dedup_cache.split(events)
+            inserted = (await ingestor.write_groups([fresh], len(events), known))[0]
+            if dedup_cache is not None:
+                dedup_cache.remember((e.topic, e.event_id) for e in fresh)
+            totals["accepted"] += len(events)
+            totals["inserted"] += inserted
+            totals["duplicates"] += len(events) - inserted
+            totals["chunks"] += 1
+
+        async def submit(raw_events: List[dict], linenos: List[int], longest: int) -> None:
+            # longest = baris terpanjang di chunk: batas atas teks payload mana pun
+            events = _parse_lines(raw_events, linenos, _payload_limit(longest, settings.max_payload_bytes))
+            # Backpressure: body berikutnya baru dibaca setelah ada slot commit
+            while len(inflight) >= settings.publish_stream_max_inflight:
+                done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    inflight.discard(t)
+                    t.result()
+            inflight.add(asyncio.create_task(write(events)))
+
+        raw_events, linenos, lineno, size, longest = [], [], 0, 0, 0
+        try:
+            async for chunk in request.stream():
+                metrics.publish_wire_bytes.inc(len(chunk))
+                for piece in decoder.feed(chunk):
+                    size += len(piece)
+                    if size > settings.publish_stream_max_body_bytes:
+                        raise BodyTooLarge()
+                    metrics.publish_body_bytes.inc(len(piece))
+                    for line in splitter.feed(piece):
+                        lineno += 1
+                        if not line.strip():
+                            continue
+                        raw_events.append(ndjson_record(line, lineno))
+                        linenos.append(lineno)
+                        longest = max(longest, len(line))
+                        if len(raw_events) >= settings.publish_stream_chunk_events:
+                            await submit(raw_events, linenos, longest)
+                            raw_events, linenos, longest = [], [], 0
+            decoder.finish()
+            for line in splitter.finish():
+                lineno += 1
+                raw_events.append(ndjson_record(line, lineno))
+                linenos.append(lineno)
+                longest = max(longest, len(line))
+            if raw_events:
+                await submit(raw_events, linenos, longest)
+            await asyncio.gather(*inflight)
+        except BaseException as e:
+            # Tunggu chunk yang sedang commit supaya totals di respons akurat
+            await asyncio.gather(*inflight, return_exceptions=True)
+            if isinstance(e, HTTPException):
+                status, detail = e.status_code, e.detail
+            elif isinstance(e, BodyTooLarge):
+                status, detail = 413, "body/baris melebihi publish_stream_max_body_bytes/max_line_bytes"
+            elif isinstance(e, ValueError):
+                status, detail = 400, str(e)
+            else:
+                raise
+            return JSONResponse(status_code=status, content=jsonable_encoder({"detail": detail, **totals}))
+        finally:
+            metrics.publish_stream_seconds.observe(time.perf_counter() - t_start)
+        return totals
+
+    @app.get("/publish/receipts/{receipt}")
+    async def receipt_status(request: Request, receipt: str):
+        wal = request.app.state.wal
+        if wal is not None and receipt in wal.pending:
+            return {"receipt": receipt, "status": "pending", "accepted": wal.pending[receipt]}
+        # Sharding: tiap shard mencatat receipt untuk bagian event-nya sendiri
+        rows = [r for r in await on_shards(shards, get_receipt, receipt) if r is not None]
+        if not rows:
+            # Belum commit di proses lain (multi-proses), kedaluwarsa, atau tidak pernah ada
+            raise HTTPException(status_code=404, detail="receipt tidak dikenal")
+        out = dict(rows[0])
+        for r in rows[1:]:
+            for k in ("accepted", "inserted", "duplicates"):
+                out[k] = None if out[k] is None or r[k] is None else out[k] + r[k]
+            out["committed_at"] = max(out["committed_at"], r["committed_at"])
+        return {"status": "committed", **out}
+
     @app.get("/events")
-    async def list_events(request: Request, topic: Optional[str] = None, limit: int = Query(100, ge=1, le=5000)):
-        q = "SELECT topic,event_id,ts_ingest,source,payload FROM processed_events"
-        args = [limit]
-        if topic:
-            q = "SELECT topic,event_id,ts_ingest,source,payload FROM processed_events WHERE topic=$1 ORDER BY ts_ingest DESC LIMIT $2"
-            args = [topic, limit]
+    async def list_events(
+        request: Request,
+        topic: Optional[str] = None,
+        limit: int = Query(100, ge=1, le=5000),
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        fields: str = Query("all", pattern="^(all|meta)$"),
+        after_seq: Optional[int] = Query(None, ge=0),
+    ):
+        t0 = time.perf_counter()
+        # since/until membatasi ts_ingest -> partition pruning di sisi Postgres;
+        # fields=meta -> tanpa payload (payload_bytes saja), tidak ada detoast
+        q, args = events_query(topic, _decode_cursor(cursor), limit, since=since, until=until, fields=fields,
+                               after_seq=_check_after_seq(topic, cursor, after_seq))
+
+        async def load():
+            # Dengan topic hanya shard topic itu; tanpa topic semua shard lalu digabung
+            targets = [shards.for_topic(topic)] if topic else shards.shards
+            results = await on_shards(targets, lambda conn: conn.fetch(q, *args))
+            rows = results[0] if len(results) == 1 else merge_events(results, limit)
+            headers = {}
+            if after_seq is not None:
+                # Baca inkremental: request berikutnya after_seq=X-Last-Seq
+                headers["X-Last-Seq"] = str(rows[-1]["seq"] if rows else after_seq)
+            elif len(rows) == limit:
+                # Halaman penuh -> kemungkinan masih ada data: kirim cursor halaman berikutnya
+                headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
+            return orjson.dumps([dict(r) for r in rows]), headers
+
+        if response_cache is not None:
+            # topic None (= cache.ALL_TOPICS): basi oleh write ke topic mana pun
+            entry, hit = await response_cache.get_or_load(
+                ("events", topic, limit, cursor, since, until, fields, after_seq), topic, load)
+            metrics.response_cache_requests.inc(endpoint="events", result="hit" if hit else "miss")
         else:
-            q += " ORDER BY ts_ingest DESC LIMIT $1"
-        
-        async with request.app.state.db_pool.acquire() as conn:
-            rows = await conn.fetch(q, *args)
-        return [dict(r) for r in rows]
+            entry = CachedResponse(*(await load()), expires=0, topic=topic, gen=None)
+        resp = _conditional(request, entry.body, entry.etag, entry.headers)
+        metrics.events_read_seconds.observe(time.perf_counter() - t0)
+        return resp
+
+    @app.get("/events/export")
+    async def export_events(
+        request: Request,
+        topic: Optional[str] = None,
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        fields: str = Query("all", pattern="^(all|meta)$"),
+        after_seq: Optional[int] = Query(None, ge=0),
+    ):
+        # NDJSON streaming lewat server-side cursor: memori konstan berapa pun jumlah baris
+        q, args = events_query(topic, _decode_cursor(cursor), None, since=since, until=until, fields=fields,
+                               after_seq=_check_after_seq(topic, cursor, after_seq))
+        targets = [shards.for_topic(topic)] if topic else shards.shards
+
+        async def rows_ndjson():
+            async with AsyncExitStack() as stack:
+                cursors = []
+                for shard in targets:
+                    conn = await stack.enter_async_context(
+                        metrics.acquire(shard.pool, settings.db_acquire_timeout_sec))
+                    await stack.enter_async_context(conn.transaction())
+                    cursors.append(conn.cursor(q, *args, prefetch=settings.export_prefetch).__aiter__())
+                rows = cursors[0] if len(cursors) == 1 else merge_event_streams(cursors)
+                async for r in rows:
+                    yield orjson.dumps(dict(r)) + b"\n"
+
+        return StreamingResponse(rows_ndjson(), media_type="application/x-ndjson")
+
+    # Cache /stats: bagian DB (agregat) di-cache stats_cache_ttl_ms; satu query
+    # saja saat kedaluwarsa meski banyak dashboard polling bersamaan
+    stats_cache = {"at": 0.0, "value": None, "etag": None}
+    stats_lock = asyncio.Lock()
+
+    async def load_stats() -> StatsResponse:
+        async def one(conn):
+            return await read_stats(conn), await read_topic_stats(conn)
+
+        parts = await on_shards(shards, one)
+        # Topic hanya ada di satu shard: baris topic cukup disambung
+        totals = {k: sum(p[0][k] for p in parts) for k in parts[0][0]}
+        topics = sorted((t for p in parts for t in p[1]), key=lambda t: t["topic"])
+        queue = {
+            "backlog": sum(max(0, t["unique"] - t["done"] - t["failed"]) for t in topics),
+            "failed": sum(t["failed"] for t in topics),
+        }
+        return StatsResponse(**totals, topics=[TopicCount(**t) for t in topics], queue=queue, uptime_seconds=0)
+
+    def _stats_etag(stats: StatsResponse) -> str:
+        # Hanya bagian agregat: uptime/dedup_cache berubah tiap detik tanpa write,
+        # jadi body bisa beda byte untuk tag yang sama -> validator lemah (W/)
+        return "W/" + etag_for(stats.model_dump_json(exclude={"uptime_seconds", "dedup_cache"}).encode())
+
+    async def cached_stats() -> tuple:
+        """(StatsResponse, etag, hit). Tidak di-invalidasi per write (counter
+        berubah di setiap publish), hanya TTL stats_cache_ttl_ms."""
+        ttl = settings.stats_cache_ttl_ms / 1000.0
+        if ttl <= 0:
+            stats = await load_stats()
+            return stats, _stats_etag(stats), False
+        hit = True
+        if stats_cache["value"] is None or time.monotonic() - stats_cache["at"] >= ttl:
+            async with stats_lock:
+                if stats_cache["value"] is None or time.monotonic() - stats_cache["at"] >= ttl:
+                    stats_cache["value"] = await load_stats()
+                    stats_cache["etag"] = _stats_etag(stats_cache["value"])
+                    stats_cache["at"] = time.monotonic()
+                    hit = False
+        return stats_cache["value"], stats_cache["etag"], hit
 
     @app.get("/stats")
     async def get_stats(request: Request):
-        async with request.app.state.db_pool.acquire() as conn:
-            rows = await conn.fetch("SELECT key,val FROM stats")
-        return {r["key"]: r["val"] for r in rows}
+        t0 = time.perf_counter()
+        stats, etag, hit = await cached_stats()
+        if settings.stats_cache_ttl_ms > 0:
+            metrics.response_cache_requests.inc(endpoint="stats", result="hit" if hit else "miss")
+        out = stats.model_dump(exclude={"dedup_cache"})
+        out["uptime_seconds"] = int(time.monotonic() - request.app.state.started_at)
+        if dedup_cache is not None:
+            out["dedup_cache"] = dedup_cache.snapshot()
+        resp = _conditional(request, orjson.dumps(out), etag)
+        metrics.stats_read_seconds.observe(time.perf_counter() - t0)
+        return resp
+
+    @app.get("/stats/topics/{topic}/rollup")
+    async def topic_rollup(request: Request, topic: str, minutes: int = Query(60, ge=1, le=7 * 24 * 60)):
+        if not settings.topic_rollup_enabled:
+            raise HTTPException(status_code=404, detail="rollup per menit tidak aktif (TOPIC_ROLLUP_ENABLED)")
+        since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+        async with metrics.acquire(shards.pool_for(topic), settings.db_acquire_timeout_sec) as conn:
+            return await read_topic_rollup(conn, topic, since)
+
+    @app.get("/stats/storage")
+    async def storage(request: Request, exact: bool = False):
+        # Byte per event (heap/TOAST/index/dedup_keys); exact=true -> count(*) penuh
+        reports = await on_shards(shards, storage_report, exact)
+        if len(reports) == 1:
+            return reports[0]
+        return {"shards": {shard.name: r for shard, r in zip(shards, reports)}}
+
+    @app.get("/subscribe/{topic}")
+    async def subscribe(
+        request: Request,
+        topic: str,
+        group: Optional[str] = Query(None, min_length=1, max_length=200),
+        start: str = Query("committed", pattern="^(committed|earliest|latest)$"),
+        batch: int = Query(100, ge=1, le=1000),
+        auto_commit: bool = True,
+        limit: Optional[int] = Query(None, ge=1),
+    ):
+        """Stream SSE event topic dalam urutan commit.
+
+        Posisi awal: header Last-Event-ID (reconnect) > offset group yang
+        ter-commit (start=committed) > earliest/latest. Tanpa `group` tidak ada
+        offset yang disimpan. `limit` menutup stream setelah N event.
+        """
+        hub: SubscriptionHub = request.app.state.subscriptions
+        last_id = request.headers.get("last-event-id")
+        if last_id:
+            try:
+                pos = decode_position(last_id)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            pos = await hub.start_position(group or "", topic, start)
+        frames = hub.stream(group or "", topic, pos, batch=min(batch, hub.batch_max),
+                            auto_commit=auto_commit and group is not None, limit=limit)
+        return StreamingResponse(frames, media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.post("/subscriptions/{group}/offsets/{topic}")
+    async def set_offset(request: Request, group: str, topic: str):
+        """Seek offset group (replay/skip); berlaku untuk koneksi berikutnya.
+
+        Stream group itu yang masih tersambung tetap auto-commit posisinya
+        sendiri, jadi hentikan consumer dulu sebelum seek."""
+        try:
+            body = orjson.loads(await request.body())
+            pos = decode_position(body["cursor"])
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail='body harus {"cursor": "<seq>"}')
+        await request.app.state.subscriptions.committer.seek(group, topic, pos)
+        return {"group": group, "topic": topic, "cursor": encode_position(pos)}
+
+    @app.get("/subscriptions/{group}")
+    async def group_offsets(request: Request, group: str):
+        # Offset yang belum di-flush committer ikut terlihat setelah flush berikutnya
+        parts = await on_shards(shards, read_offsets, group)
+        rows = sorted((r for p in parts for r in p), key=lambda r: r["topic"])
+        return [
+            {"topic": r["topic"], "cursor": encode_position(r["seq"]), "updated_at": r["updated_at"]}
+            for r in rows
+        ]
+
+    @app.get("/metrics")
+    async def get_metrics():
+        # Murni baca memori proses, tidak ada query DB per scrape
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
     @app.get("/health")
     async def health():
@@ -120,5 +659,12 @@ def create_app(settings: Optional[Settings] = None) -> FastAPI:
 
     return app
 
-# Penting: Variabel global agar 'uvicorn app.main:app' bisa jalan
-app = create_app()
\ No newline at end of file
+# Penting: Variabel global agar 'uvicorn app.main:app' bisa jalan. Dibuat saat
+# pertama diakses (PEP 562), jadi import modul ini (mis. oleh supervisor
+# multi-proses atau `--factory create_app`) tidak membangun app cadangan.
+def __getattr__(name: str):
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,242 @@
+import asyncio
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Semua metric in-process: update cukup operasi int/float biasa di event loop
+# (single thread, tanpa lock), dan /metrics hanya membaca memori -> tidak ada
+# query DB per scrape.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _fmt_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name, self.help = name, help
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, v: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + v
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(k)} {_fmt(v)}" for k, v in self._values.items()] or [f"{self.name} 0"]
+
+
+class Gauge:
+    """Nilai yang dibaca dari callback saat render (mis. ukuran pool).
+
+    `kind="counter"` untuk counter yang sudah dihitung di tempat lain
+    (mis. DedupCache.hits)."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float], kind: str = "gauge") -> None:
+        self.name, self.help, self.fn, self.type = name, help, fn, kind
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_fmt(self.fn())}"]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # + bucket +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def samples(self) -> List[str]:
+        out, acc = [], 0
+        for le, c in zip(self.buckets, self.counts):
+            acc += c
+            out.append(f'{self.name}_bucket{{le="{_fmt(le)}"}} {acc}')
+        out.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        out.append(f"{self.name}_sum {repr(self.sum)}")
+        out.append(f"{self.name}_count {self.count}")
+        return out
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+
+    def _add(self, m):
+        self._metrics[m.name] = m
+        return m
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float], kind: str = "gauge") -> Gauge:
+        return self._add(Gauge(name, help, fn, kind))
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics.values():
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.type}")
+            try:
+                lines.extend(m.samples())
+            except Exception:
+                # Callback gauge gagal (mis. pool sudah ditutup): lewati saja
+                lines.pop()
+                lines.pop()
+        return "\n".join(lines) + "\n"
+
+
+class AppMetrics:
+    """Metric hot-path aggregator (satu instance per app)."""
+
+    def __init__(self) -> None:
+        r = self.registry = Registry()
+        self.publish_requests = r.counter("aggregator_publish_requests_total", "Request /publish")
+        self.admission_rejected = r.counter(
+            "aggregator_admission_rejected_total", "Request /publish yang ditolak 429 (label reason)")
+        self.publish_parse_seconds = r.histogram(
+            "aggregator_publish_parse_seconds", "Dekompresi + parse + validasi body /publish")
+        self.publish_seconds = r.histogram("aggregator_publish_seconds", "Durasi total /publish")
+        self.publish_wire_bytes = r.counter(
+            "aggregator_publish_wire_bytes_total", "Byte body /publish seperti diterima (terkompresi)")
+        self.publish_body_bytes = r.counter(
+            "aggregator_publish_body_bytes_total", "Byte body /publish setelah dekompresi")
+        self.publish_stream_seconds = r.histogram(
+            "aggregator_publish_stream_seconds", "Durasi total /publish/stream", LATENCY_BUCKETS + (10.0, 30.0, 60.0))
+        self.batch_size = r.histogram("aggregator_publish_batch_size", "Event per request /publish", SIZE_BUCKETS)
+        self.rows_inserted = r.counter("aggregator_rows_inserted_total", "Event baru yang ter-insert")
+        self.rows_duplicated = r.counter("aggregator_rows_duplicate_total", "Event duplikat yang di-drop")
+        self.pool_acquire_seconds = r.histogram(
+            "aggregator_db_pool_acquire_seconds", "Waktu tunggu pool.acquire() (ingest, /events, /stats)")
+        self.pool_acquire_timeouts = r.counter(
+            "aggregator_db_pool_acquire_timeouts_total", "pool.acquire() yang melewati db_acquire_timeout_sec")
+        self.pool_waiting = 0
+        r.gauge("aggregator_db_pool_waiting", "Coroutine yang sedang menunggu koneksi pool",
+                lambda: self.pool_waiting)
+        self.db_batch_seconds = r.histogram(
+            "aggregator_db_batch_seconds", "Durasi transaksi insert per batch (setelah acquire)")
+        self.db_batch_rows = r.histogram(
+            "aggregator_db_batch_rows", "Event per transaksi insert (setelah coalescing)", SIZE_BUCKETS)
+        self.worker_claim_seconds = r.histogram("aggregator_worker_claim_seconds", "Latency claim_events")
+        self.worker_mark_seconds = r.histogram("aggregator_worker_mark_seconds", "Latency mark_done")
+        self.worker_claimed_rows = r.counter("aggregator_worker_claimed_rows_total", "Baris yang di-claim worker")
+        self.worker_empty_claims = r.counter("aggregator_worker_empty_claims_total", "Claim yang kosong")
+        self.wal_fsync_seconds = r.histogram("aggregator_wal_fsync_seconds", "Durasi fsync group commit WAL")
+        self.response_cache_requests = r.counter(
+            "aggregator_response_cache_requests_total", "Lookup cache respons baca per endpoint (hit/miss)")
+        self.events_read_seconds = r.histogram("aggregator_events_read_seconds", "Durasi GET /events (hit + miss)")
+        self.stats_read_seconds = r.histogram("aggregator_stats_read_seconds", "Durasi GET /stats (hit + miss)")
+        self.db_queries = r.counter("aggregator_db_queries_total", "Query (round-trip) ke Postgres")
+        self.subscription_db_reads = r.counter(
+            "aggregator_subscription_db_reads_total", "Baca DB subscription (broadcast = dibagi semua subscriber)")
+        self.subscription_rows_read = r.counter(
+            "aggregator_subscription_rows_read_total", "Baris yang dibaca subscription dari DB")
+        self.subscription_events_sent = r.counter(
+            "aggregator_subscription_events_sent_total", "Event yang dikirim ke subscriber SSE")
+        self.offset_commits = r.counter("aggregator_offset_commits_total", "Flush batch offset consumer group")
+
+    def count_queries(self, conn) -> None:
+        # Dipasang di init koneksi pool: tiap query yang dieksekusi menambah counter
+        conn.add_query_logger(lambda _record: self.db_queries.inc())
+
+    @asynccontextmanager
+    async def acquire(self, pool, timeout: Optional[float] = None):
+        """pool.acquire() yang mencatat lama tunggu, antrian, dan timeout.
+
+        Wait tinggi + in_use == max_size -> terikat pool; wait rendah tapi
+        db_batch_seconds tinggi -> terikat database.
+        """
+        t0 = time.perf_counter()
+        self.pool_waiting += 1
+        try:
+            conn = await pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.pool_acquire_timeouts.inc()
+            raise
+        finally:
+            self.pool_waiting -= 1
+            self.pool_acquire_seconds.observe(time.perf_counter() - t0)
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    def bind_pool(self, pool) -> None:
+        self.registry.gauge("aggregator_db_pool_size", "Koneksi di pool", pool.get_size)
+        self.registry.gauge(
+            "aggregator_db_pool_in_use", "Koneksi pool yang sedang dipakai",
+            lambda: pool.get_size() - pool.get_idle_size())
+        self.registry.gauge("aggregator_db_pool_max_size", "Batas maksimum pool", pool.get_max_size)
+
+    def bind_dedup_cache(self, cache) -> None:
+        r = self.registry
+        r.gauge("aggregator_dedup_cache_hits_total", "Duplikat yang dikonfirmasi cache", lambda: cache.hits, "counter")
+        r.gauge("aggregator_dedup_cache_misses_total", "Lookup cache yang diteruskan ke DB",
+                lambda: cache.misses, "counter")
+        r.gauge("aggregator_dedup_cache_keys", "Key di LRU dedup", lambda: len(cache.lru))
+
+    def bind_wal(self, wal) -> None:
+        r = self.registry
+        r.gauge("aggregator_wal_backlog_bytes", "Byte WAL yang belum commit ke Postgres", lambda: wal.backlog_bytes)
+        r.gauge("aggregator_wal_pending_receipts", "Receipt 202 yang belum commit", lambda: len(wal.pending))
+
+    def bind_response_cache(self, cache) -> None:
+        r = self.registry
+        r.gauge("aggregator_response_cache_entries", "Respons di cache /events", lambda: len(cache))
+        r.gauge("aggregator_response_cache_evictions_total", "Entry yang dibuang LRU",
+                lambda: cache.evictions, "counter")
+        r.gauge("aggregator_response_cache_invalidations_total", "Commit yang meng-invalidasi topic",
+                lambda: cache.invalidations, "counter")
+
+    def bind_subscriptions(self, hub) -> None:
+        r = self.registry
+        r.gauge("aggregator_subscribers", "Koneksi SSE /subscribe yang aktif", lambda: hub.subscribers)
+        r.gauge("aggregator_subscription_topics", "Topic dengan broadcaster aktif", lambda: len(hub.broadcasters))
+
+    def bind_admission(self, ctrl) -> None:
+        r = self.registry
+        r.gauge("aggregator_admission_limit", "Batas konkurensi /publish saat ini (AIMD)", lambda: ctrl.limit)
+        r.gauge("aggregator_admission_inflight", "Request /publish yang memegang slot", lambda: ctrl.inflight)
+        r.gauge("aggregator_admission_queue_depth", "Request /publish yang antri menunggu slot",
+                lambda: ctrl.queue_depth)
+
+    def bind_startup(self, phases: Dict[str, float]) -> None:
+        """Durasi startup per fase (detik sejak lifespan mulai), di-set sekali saat siap."""
+        for phase, seconds in phases.items():
+            self.registry.gauge(f"aggregator_startup_{phase}_seconds", f"Startup sampai {phase} selesai",
+                                lambda v=seconds: v)
+
+    def render(self) -> str:
+        return self.registry.render()
@@ -0,0 +1,102 @@
+"""Migrasi skema berversi dari sql/migrations/NNNN_nama.sql.
+
+Tiap file dijalankan sekali dalam transaksinya sendiri dan dicatat di
+schema_migrations (versi, checksum sha256, durasi). Startup replica membaca
+tabel itu dulu tanpa lock: bila semua file sudah tercatat dengan checksum yang
+sama, tidak ada DDL sama sekali (fast path). Bila ada yang belum, satu replica
+mengambil advisory lock dan menjalankannya; replica lain menunggu lock lalu
+melihat skema sudah terkini.
+
+File yang sudah diterapkan tidak boleh diubah (checksum beda -> startup gagal);
+perubahan skema selalu berupa file baru dengan nomor berikutnya.
+"""
+import hashlib
+import logging
+import re
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+log = logging.getLogger("migrations")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "sql" / "migrations"
+MIGRATE_LOCK_KEY = 0x6D696772  # 'migr'
+_FILE = re.compile(r"^(\d+)_([A-Za-z0-9_]+)\.sql$")
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  version INT PRIMARY KEY,
+  name TEXT NOT NULL,
+  checksum TEXT NOT NULL,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  duration_ms INT NOT NULL
+)
+"""
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    checksum: str
+
+
+def load_migrations(directory: Optional[Path] = None) -> List[Migration]:
+    out = []
+    for path in sorted((directory or MIGRATIONS_DIR).glob("*.sql")):
+        m = _FILE.match(path.name)
+        if m is None:
+            raise MigrationError(f"nama file migrasi tidak valid: {path.name} (harus NNNN_nama.sql)")
+        sql = path.read_text()
+        out.append(Migration(int(m.group(1)), m.group(2), sql, hashlib.sha256(sql.encode()).hexdigest()))
+    versions = [mg.version for mg in out]
+    if len(set(versions)) != len(versions):
+        raise MigrationError(f"versi migrasi duplikat: {versions}")
+    return sorted(out)
+
+
+async def _applied(conn) -> Optional[dict]:
+    """{versi: checksum}, None bila tabel versi belum ada (database baru / upgrade)."""
+    if await conn.fetchval("SELECT to_regclass('schema_migrations')") is None:
+        return None
+    return {r["version"]: r["checksum"] for r in await conn.fetch("SELECT version, checksum FROM schema_migrations")}
+
+
+def _pending(migrations: List[Migration], applied: dict) -> List[Migration]:
+    for mg in migrations:
+        if mg.version in applied and applied[mg.version] != mg.checksum:
+            raise MigrationError(f"checksum migrasi {mg.version}_{mg.name} berbeda dari yang sudah diterapkan")
+    # Versi di DB yang tidak dikenal file = replica versi lama saat rolling deploy: dibiarkan
+    return [mg for mg in migrations if mg.version not in applied]
+
+
+async def migrate(conn, directory: Optional[Path] = None) -> List[int]:
+    """Terapkan migrasi yang belum ada; return versi yang diterapkan proses ini."""
+    migrations = load_migrations(directory)
+    applied = await _applied(conn)
+    if applied is not None and not _pending(migrations, applied):
+        return []
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATE_LOCK_KEY)
+    try:
+        await conn.execute(VERSION_TABLE_SQL)
+        done = []
+        # Dibaca ulang di bawah lock: replica lain mungkin baru selesai migrasi
+        for mg in _pending(migrations, await _applied(conn)):
+            t0 = time.perf_counter()
+            async with conn.transaction():
+                # Migrasi data besar bisa lebih lama dari statement_timeout jalur request
+                await conn.execute("SET LOCAL statement_timeout = 0")
+                await conn.execute(mg.sql)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES ($1, $2, $3, $4)",
+                    mg.version, mg.name, mg.checksum, int((time.perf_counter() - t0) * 1000),
+                )
+            log.info("migrasi %04d_%s diterapkan (%.0f ms)", mg.version, mg.name, (time.perf_counter() - t0) * 1000)
+            done.append(mg.version)
+        return done
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATE_LOCK_KEY)
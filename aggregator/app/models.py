@@ -1,14 +1,35 @@
 from datetime import datetime
-from typing import Any, Dict, List
-from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+import orjson
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
 
 
 class EventIn(BaseModel):
+    """Satu-satunya model event masuk (semua format /publish, /publish/stream).
+
+    Batas ukuran payload dibaca dari validation context
+    {"max_payload_bytes": n} (Settings.max_payload_bytes; 0 = tanpa batas).
+    """
+
     topic: str = Field(min_length=1, max_length=200)
     event_id: str = Field(min_length=1, max_length=200)
     timestamp: datetime
     source: str = Field(min_length=1, max_length=200)
-    payload: Dict[str, Any] = Field(default_factory=dict)
+    payload: Dict[str, Any]
+
+    @field_validator("payload")
+    @classmethod
+    def _payload_size(cls, v: Dict[str, Any], info: ValidationInfo) -> Dict[str, Any]:
+        limit = (info.context or {}).get("max_payload_bytes", 0)
+        if limit:
+            try:
+                size = len(orjson.dumps(v))
+            except orjson.JSONEncodeError:
+                raise ValueError("payload tidak bisa di-encode sebagai JSON")
+            if size > limit:
+                raise ValueError(f"payload {size} byte melebihi batas {limit} byte")
+        return v
 
 
 class PublishResponse(BaseModel):
@@ -20,6 +41,12 @@ class PublishResponse(BaseModel):
 class TopicCount(BaseModel):
     topic: str
     done: int
+    received: int = 0
+    unique: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    first_ts: Optional[datetime] = None
+    last_ts: Optional[datetime] = None
 
 
 class StatsResponse(BaseModel):
@@ -29,3 +56,4 @@ class StatsResponse(BaseModel):
     topics: List[TopicCount]
     queue: dict
     uptime_seconds: int
+    dedup_cache: Optional[dict] = None
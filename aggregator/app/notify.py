@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+import asyncpg
+
+log = logging.getLogger("notify")
+
+# Channel NOTIFY yang dikirim transaksi /publish saat ada event baru di antrian
+CHANNEL = "events_pending"
+
+
+class Wakeup:
+    """Fan-out wakeup dari listener ke worker dalam satu proses.
+
+    `seq` naik setiap ada notifikasi; worker mencatat seq sebelum claim sehingga
+    notifikasi yang datang di antara claim kosong dan `wait()` tidak hilang.
+    """
+
+    def __init__(self) -> None:
+        self.seq = 0
+        self._waiters: deque = deque()
+
+    def notify(self, n: int = 1) -> None:
+        self.seq += 1
+        while n > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(True)
+                n -= 1
+
+    def notify_all(self) -> None:
+        self.notify(len(self._waiters) or 1)
+
+    async def wait(self, seen_seq: int, timeout: float) -> bool:
+        """True jika dibangunkan notifikasi, False jika timeout (polling safety net)."""
+        if self.seq != seen_seq:
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            try:
+                self._waiters.remove(fut)
+            except ValueError:
+                pass
+
+
+class Listener:
+    """Satu koneksi LISTEN khusus per proses; reconnect otomatis bila putus."""
+
+    def __init__(self, dsn: str, wakeup: Wakeup, *, reconnect_delay: float = 1.0) -> None:
+        self.dsn = dsn
+        self.wakeup = wakeup
+        self.reconnect_delay = reconnect_delay
+        self.notifications = 0
+        self._conn: Optional[asyncpg.Connection] = None
+        self._lost = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _on_notify(self, conn, pid, channel, payload) -> None:
+        self.notifications += 1
+        self.wakeup.notify()
+
+    def _on_terminate(self, conn) -> None:
+        self._lost.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self._lost.clear()
+                self._conn = await asyncpg.connect(self.dsn)
+                self._conn.add_termination_listener(self._on_terminate)
+                await self._conn.add_listener(CHANNEL, self._on_notify)
+                # Event bisa masuk saat listener belum aktif: bangunkan worker sekali
+                self.wakeup.notify_all()
+                await self._lost.wait()
+                log.warning("listener connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("listener connect failed")
+            await asyncio.sleep(self.reconnect_delay)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="notify-listener")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._conn and not self._conn.is_closed():
+            await self._conn.close()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+log = logging.getLogger("partitions")
+
+PARENT = "processed_events"
+DEFAULT_PARTITION = "processed_events_default"
+# Advisory lock supaya hanya satu replica yang menjalankan maintenance
+MAINTENANCE_LOCK_KEY = 0x70617274  # 'part'
+
+_FORMATS = {"day": "%Y%m%d", "hour": "%Y%m%d%H"}
+_STEPS = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+
+
+def _floor(ts: datetime, interval: str) -> datetime:
+    ts = ts.astimezone(timezone.utc)
+    if interval == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(start: datetime, interval: str) -> str:
+    return f"{PARENT}_p{start.strftime(_FORMATS[interval])}"
+
+
+def parse_partition_start(name: str, interval: str) -> Optional[datetime]:
+    prefix = f"{PARENT}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix):], _FORMATS[interval]).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+async def list_partitions(conn) -> List[str]:
+    rows = await conn.fetch(
+        """
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+        ORDER BY c.relname
+        """,
+        PARENT,
+    )
+    return [r["relname"] for r in rows]
+
+
+async def create_partition(conn, start: datetime, interval: str) -> bool:
+    """Buat satu partisi [start, start+interval). Baris yang sudah terlanjur masuk
+    partisi DEFAULT untuk rentang itu dipindah dalam transaksi yang sama."""
+    name = partition_name(start, interval)
+    end = start + _STEPS[interval]
+    if await conn.fetchval("SELECT to_regclass($1)", name) is not None:
+        return False
+    async with conn.transaction():
+        moved = await conn.fetchval(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE ts_ingest >= $1 AND ts_ingest < $2)",
+            start, end,
+        )
+        if moved:
+            await conn.execute(
+                f"""
+                CREATE TEMP TABLE _moved ON COMMIT DROP AS
+                WITH d AS (
+                    DELETE FROM {DEFAULT_PARTITION} WHERE ts_ingest >= $1 AND ts_ingest < $2 RETURNING *
+                )
+                SELECT * FROM d
+                """,
+                start, end,
+            )
+        # Literal timestamp (DDL tidak menerima parameter bind)
+        await conn.execute(
+            f"CREATE TABLE {name} PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        if moved:
+            await conn.execute(f"INSERT INTO {PARENT} SELECT * FROM _moved")
+    log.info("created partition %s", name)
+    return True
+
+
+async def ensure_partitions(conn, interval: str, premake: int, now: Optional[datetime] = None) -> List[str]:
+    """Pastikan partisi periode sekarang + `premake` periode ke depan sudah ada."""
+    start = _floor(now or datetime.now(timezone.utc), interval)
+    created = []
+    for i in range(premake + 1):
+        s = start + _STEPS[interval] * i
+        if await create_partition(conn, s, interval):
+            created.append(partition_name(s, interval))
+    return created
+
+
+async def drop_expired_partitions(conn, interval: str, retention: timedelta,
+                                  now: Optional[datetime] = None) -> List[str]:
+    """DROP partisi yang seluruh rentangnya lebih tua dari retention (O(1) per partisi)."""
+    cutoff = (now or datetime.now(timezone.utc)) - retention
+    dropped = []
+    for name in await list_partitions(conn):
+        start = parse_partition_start(name, interval)
+        if start is None or start + _STEPS[interval] > cutoff:
+            continue
+        await conn.execute(f"DROP TABLE IF EXISTS {name}")
+        dropped.append(name)
+        log.info("dropped expired partition %s", name)
+    if dropped:
+        # Sisa event lama di DEFAULT (timestamp di luar partisi) ikut dibersihkan
+        await conn.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE ts_ingest < $1", cutoff)
+    return dropped
+
+
+def dedup_ttl(settings) -> Optional[timedelta]:
+    """TTL dedup_keys (`DEDUP_TTL_DAYS`, default `RETENTION_DAYS`); None = tidak pernah dipurge."""
+    days = settings.dedup_ttl_days if settings.dedup_ttl_days is not None else settings.retention_days
+    return timedelta(days=days) if days > 0 else None
+
+
+async def purge_dedup_keys(conn, ttl: timedelta, now: Optional[datetime] = None) -> int:
+    cutoff = (now or datetime.now(timezone.utc)) - ttl
+    status = await conn.execute("DELETE FROM dedup_keys WHERE first_seen < $1", cutoff)
+    return int(status.split()[-1])
+
+
+async def purge_receipts(conn, ttl: timedelta, now: Optional[datetime] = None) -> int:
+    cutoff = (now or datetime.now(timezone.utc)) - ttl
+    status = await conn.execute("DELETE FROM wal_receipts WHERE committed_at < $1", cutoff)
+    return int(status.split()[-1])
+
+
+async def purge_topic_rollup(conn, ttl: timedelta, now: Optional[datetime] = None) -> int:
+    cutoff = (now or datetime.now(timezone.utc)) - ttl
+    status = await conn.execute("DELETE FROM topic_rollup_minute WHERE minute < $1", cutoff)
+    return int(status.split()[-1])
+
+
+async def run_maintenance(pool, settings, now: Optional[datetime] = None) -> None:
+    async with pool.acquire() as conn:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MAINTENANCE_LOCK_KEY):
+            return
+        try:
+            await ensure_partitions(conn, settings.partition_interval, settings.partition_premake, now)
+            if settings.retention_days > 0:
+                await drop_expired_partitions(
+                    conn, settings.partition_interval, timedelta(days=settings.retention_days), now)
+            ttl = dedup_ttl(settings)
+            if ttl is not None:
+                await purge_dedup_keys(conn, ttl, now)
+            if settings.receipt_ttl_days > 0:
+                await purge_receipts(conn, timedelta(days=settings.receipt_ttl_days), now)
+            if settings.topic_rollup_enabled:
+                await purge_topic_rollup(conn, timedelta(hours=settings.topic_rollup_retention_hours), now)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MAINTENANCE_LOCK_KEY)
+
+
+async def maintenance_loop(pool, settings, stop_event: asyncio.Event) -> None:
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), settings.maintenance_interval_sec)
+        except asyncio.TimeoutError:
+            pass
+        if stop_event.is_set():
+            return
+        try:
+            await run_maintenance(pool, settings)
+        except Exception:
+            log.exception("partition maintenance failed")
@@ -0,0 +1,192 @@
+"""Pindahkan data topic antar shard setelah DATABASE_SHARDS berubah.
+
+    python -m app.rebalance --old "a=postgres://...,b=postgres://..." \\
+        --new "a=postgres://...,b=postgres://...,c=postgres://..." [--dry-run]
+
+Topic yang menurut ring baru berada di shard lain disalin utuh ke shard
+tujuan (event + status antrian + seq, dedup_keys, topic_stats, topic_seq,
+offset consumer group, rollup per menit), lalu dihapus dari shard asal.
+Lokasi topic dibaca dari data (bukan dihitung dari ring lama), jadi run yang
+terhenti di tengah cukup diulang: salinan ke tujuan idempotent dan topic yang
+sudah dihapus dari asal tidak dipindah lagi.
+
+Tidak ada transaksi lintas database: hentikan ingest/worker untuk topic yang
+pindah (paling sederhana: semua instance) selama rebalance, lalu deploy
+DATABASE_SHARDS baru sebelum publish dibuka lagi.
+"""
+import argparse
+import asyncio
+from typing import Dict, List, Sequence
+
+from .db import init_db, resolve_sources
+from .partitions import create_partition, list_partitions, parse_partition_start
+from .settings import Settings
+from .shards import ShardSet, parse_shards, plan_moves
+
+CHUNK_ROWS = 5000
+
+# topic_stats ada untuk setiap topic yang pernah menerima event; topic_seq /
+# consumer_offsets menangkap topic yang datanya sudah habis kena retention
+TOPICS_SQL = """
+SELECT topic FROM topic_stats
+UNION SELECT topic FROM topic_seq
+UNION SELECT topic FROM consumer_offsets
+"""
+
+READ_EVENTS_SQL = """
+SELECT e.topic, e.event_id, e.ts_ingest, coalesce(s.name, e.source, '') AS source, e.payload, e.status,
+       e.claimed_at, e.attempts, e.last_error, e.processed_at, e.enqueued_at, e.seq
+FROM processed_events e LEFT JOIN event_sources s ON s.id = e.source_id
+WHERE e.topic = ANY($1::text[])
+"""
+
+# Idempotent: baris yang (topic, event_id)-nya sudah ada di tujuan dilewati
+COPY_EVENTS_SQL = """
+INSERT INTO processed_events(topic, event_id, ts_ingest, source_id, payload, status,
+                             claimed_at, attempts, last_error, processed_at, enqueued_at, seq)
+SELECT i.*
+FROM unnest($1::text[], $2::text[], $3::timestamptz[], $4::int[], $5::jsonb[], $6::text[],
+            $7::timestamptz[], $8::int[], $9::text[], $10::timestamptz[], $11::timestamptz[], $12::bigint[])
+    AS i(topic, event_id, ts_ingest, source_id, payload, status,
+         claimed_at, attempts, last_error, processed_at, enqueued_at, seq)
+WHERE NOT EXISTS (
+    SELECT 1 FROM processed_events p WHERE p.topic = i.topic AND p.event_id = i.event_id
+)
+"""
+
+READ_DEDUP_SQL = "SELECT topic, event_id, first_seen FROM dedup_keys WHERE topic = ANY($1::text[])"
+
+COPY_DEDUP_SQL = """
+INSERT INTO dedup_keys(topic, event_id, first_seen)
+SELECT * FROM unnest($1::text[], $2::text[], $3::timestamptz[])
+ON CONFLICT (topic, event_id) DO NOTHING
+"""
+
+# unique_processed = baris yang sudah 'done' (topic_stats.done), bukan inserted:
+# dengan workers>0 baris pending/processing ikut pindah apa adanya dan baru
+# dihitung oleh mark_done di shard tujuan. Baris 'failed' tidak pernah masuk
+# unique_processed; counternya cukup ikut baris topic_stats yang disalin.
+TOPIC_TOTALS_SQL = """
+SELECT coalesce(sum(received), 0)::bigint AS received,
+       coalesce(sum(done), 0)::bigint AS done,
+       coalesce(sum(duplicates), 0)::bigint AS duplicates
+FROM topic_stats WHERE topic = ANY($1::text[])
+"""
+
+# Counter global pindah bersama topic-nya: total semua shard tetap sama
+ADJUST_STATS_SQL = """
+UPDATE stats_shard
+SET received = received + $1, unique_processed = unique_processed + $2, duplicate_dropped = duplicate_dropped + $3
+WHERE shard = 0
+"""
+
+# Tabel kecil per topic disalin apa adanya (tujuan diganti isi asal, jadi aman diulang)
+TOPIC_TABLES = {
+    "topic_stats": ("topic, shard, received, inserted, duplicates, done, failed, first_ts, last_ts", "topic, shard"),
+    "topic_seq": ("topic, last_seq", "topic"),
+    "consumer_offsets": ("group_name, topic, seq, updated_at", "group_name, topic"),
+    "topic_rollup_minute": ("topic, minute, shard, received, inserted", "topic, minute, shard"),
+}
+
+DELETE_TABLES = ("processed_events", "dedup_keys", "topic_stats", "topic_seq", "consumer_offsets",
+                 "topic_rollup_minute")
+
+
+async def shard_topics(conn) -> set:
+    return {r["topic"] for r in await conn.fetch(TOPICS_SQL)}
+
+
+async def _mirror_partitions(src, dst, interval: str) -> None:
+    # Baris lama harus masuk partisi rentangnya (bukan DEFAULT) supaya retention
+    # DROP PARTITION di tujuan tetap bekerja
+    for name in await list_partitions(src):
+        start = parse_partition_start(name, interval)
+        if start is not None:
+            await create_partition(dst, start, interval)
+
+
+async def _copy_events(src, dst, topics: List[str], chunk: int) -> int:
+    copied = 0
+    async with src.transaction():
+        cur = await src.cursor(READ_EVENTS_SQL, topics)
+        while rows := await cur.fetch(chunk):
+            ids = await resolve_sources(dst, {r["source"] for r in rows})
+            cols = [[r[k] for r in rows] for k in (
+                "topic", "event_id", "ts_ingest", "source", "payload", "status",
+                "claimed_at", "attempts", "last_error", "processed_at", "enqueued_at", "seq")]
+            cols[3] = [ids[s] for s in cols[3]]
+            status = await dst.execute(COPY_EVENTS_SQL, *cols)
+            copied += int(status.split()[-1])
+        cur = await src.cursor(READ_DEDUP_SQL, topics)
+        while rows := await cur.fetch(chunk):
+            await dst.execute(COPY_DEDUP_SQL, *([r[k] for r in rows] for k in ("topic", "event_id", "first_seen")))
+    return copied
+
+
+async def move_topics(src, dst, topics: List[str], interval: str, chunk: int = CHUNK_ROWS) -> dict:
+    """Salin `topics` dari koneksi `src` ke `dst` lalu hapus dari `src`."""
+    await _mirror_partitions(src, dst, interval)
+    async with dst.transaction():
+        copied = await _copy_events(src, dst, topics, chunk)
+        before = await dst.fetchrow(TOPIC_TOTALS_SQL, topics)
+        for table, (cols, _) in TOPIC_TABLES.items():
+            rows = await src.fetch(f"SELECT {cols} FROM {table} WHERE topic = ANY($1::text[])", topics)
+            await dst.execute(f"DELETE FROM {table} WHERE topic = ANY($1::text[])", topics)
+            if rows:
+                await dst.copy_records_to_table(table, records=rows, columns=[c.strip() for c in cols.split(",")])
+        after = await dst.fetchrow(TOPIC_TOTALS_SQL, topics)
+        await dst.execute(ADJUST_STATS_SQL, *(after[k] - before[k] for k in ("received", "done", "duplicates")))
+    # Tujuan sudah commit; baru sekarang asal dihapus (crash di antaranya -> ulangi)
+    async with src.transaction():
+        moved = await src.fetchrow(TOPIC_TOTALS_SQL, topics)
+        for table in DELETE_TABLES:
+            await src.execute(f"DELETE FROM {table} WHERE topic = ANY($1::text[])", topics)
+        await src.execute(ADJUST_STATS_SQL, *(-moved[k] for k in ("received", "done", "duplicates")))
+    return {"topics": len(topics), "events": copied}
+
+
+async def rebalance(old: ShardSet, new: ShardSet, settings: Settings, dry_run: bool = False) -> Dict:
+    """{(asal, tujuan): {"topics": [...], "events": n}}; dry_run hanya rencana."""
+    urls = {s.name: s.url for s in old}
+    urls.update((s.name, s.url) for s in new)
+    pools = dict(zip(urls, await asyncio.gather(*[
+        init_db(url, settings.stats_shards, min_size=1, max_size=2) for url in urls.values()
+    ])))
+    try:
+        located = {}
+        for shard in old:
+            async with pools[shard.name].acquire() as conn:
+                located[shard.name] = await shard_topics(conn)
+        plan = plan_moves(located, new)
+        out = {}
+        for (src_name, dst_name), topics in plan.items():
+            out[(src_name, dst_name)] = {"topics": topics, "events": None}
+            if dry_run:
+                continue
+            async with pools[src_name].acquire() as src, pools[dst_name].acquire() as dst:
+                res = await move_topics(src, dst, topics, settings.partition_interval)
+            out[(src_name, dst_name)]["events"] = res["events"]
+        return out
+    finally:
+        await asyncio.gather(*[p.close() for p in pools.values()])
+
+
+def main(argv: Sequence[str] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--old", required=True, help="DATABASE_SHARDS sebelum perubahan")
+    ap.add_argument("--new", required=True, help="DATABASE_SHARDS sesudah perubahan")
+    ap.add_argument("--dry-run", action="store_true", help="tampilkan topic yang pindah saja")
+    args = ap.parse_args(argv)
+    settings = Settings()
+    old = ShardSet(parse_shards(args.old, settings.database_url), settings.shard_vnodes)
+    new = ShardSet(parse_shards(args.new, settings.database_url), settings.shard_vnodes)
+    result = asyncio.run(rebalance(old, new, settings, args.dry_run))
+    for (src, dst), r in result.items():
+        moved = "dry-run" if r["events"] is None else f"{r['events']} event"
+        print(f"{src} -> {dst}: {len(r['topics'])} topic ({moved})", flush=True)
+    if not result:
+        print("tidak ada topic yang pindah", flush=True)
+
+
+if __name__ == "__main__":
+    main()
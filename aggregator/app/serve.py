@@ -0,0 +1,34 @@
+"""Entry point serving: `python -m app.serve` (container) / `python -m aggregator.app.serve`.
+
+PROCESSES=1 menjalankan satu proses uvicorn. PROCESSES>1 memakai supervisor
+multi-proses uvicorn: tiap anak mengimpor `main:create_app` sendiri (parent tidak
+membuka pool/koneksi apa pun), dan SIGTERM ke parent diteruskan ke semua anak
+yang lalu drain secara graceful (request in-flight, coalescer, claim worker).
+"""
+import logging
+
+import uvicorn
+
+from .db import pool_max_size
+from .settings import Settings
+
+log = logging.getLogger("serve")
+
+
+def main() -> None:
+    settings = Settings()
+    # Validasi budget koneksi di parent supaya salah konfigurasi gagal sekali, bukan N kali
+    per_process = pool_max_size(settings)
+    log.info("serving processes=%d pool_max_size/process=%d", settings.processes, per_process)
+    uvicorn.run(
+        f"{__package__}.main:create_app",
+        factory=True,
+        host=settings.host,
+        port=settings.port,
+        workers=settings.processes,
+        timeout_graceful_shutdown=settings.shutdown_grace_sec,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Sharding storage per topic ke beberapa database Postgres.
+
+Topic dipetakan ke shard lewat consistent hashing (ring dengan virtual node):
+menambah shard hanya memindahkan ~1/N topic, dan topic lain tetap di shard
+lamanya. Kuncinya topic (bukan topic+event_id) supaya semua yang per topic
+tetap lokal di satu database: dedup (topic, event_id), seq per topic,
+topic_stats, offset subscription, dan /events?topic=... (satu shard saja).
+
+Satu shard = database biasa dengan skema lengkap + pool asyncpg sendiri. Tanpa
+DATABASE_SHARDS, ShardSet berisi satu shard dari DATABASE_URL dan semua jalur
+sama persis seperti sebelum ada sharding.
+"""
+import asyncio
+import bisect
+import hashlib
+import heapq
+import itertools
+import re
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+from .ingest import Ingestor
+
+VNODES = 64
+_NAMED = re.compile(r"^([A-Za-z0-9_-]+)=(\w+://.*)$")
+
+
+def parse_shards(spec: str, default_url: str) -> List[Tuple[str, str]]:
+    """`"a=postgres://...,b=postgres://..."` -> [(nama, dsn)].
+
+    Nama boleh dihilangkan (jadi shard0, shard1, ... sesuai urutan), tapi nama
+    eksplisit lebih aman: posisi di ring ditentukan nama, bukan urutan/DSN, jadi
+    ganti host/password tidak memindahkan topic.
+    """
+    entries = [e.strip() for e in spec.split(",") if e.strip()]
+    if not entries:
+        return [("shard0", default_url)]
+    out = []
+    for i, entry in enumerate(entries):
+        m = _NAMED.match(entry)
+        out.append((m.group(1), m.group(2)) if m else (f"shard{i}", entry))
+    names = [n for n, _ in out]
+    if len(set(names)) != len(names):
+        raise ValueError(f"nama shard duplikat: {names}")
+    return out
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, names: Sequence[str], vnodes: int = VNODES) -> None:
+        points = sorted((_hash(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        self._keys = [h for h, _ in points]
+        self._names = [n for _, n in points]
+
+    def lookup(self, key: str) -> str:
+        i = bisect.bisect(self._keys, _hash(key))
+        return self._names[i % len(self._names)]
+
+
+class Shard:
+    def __init__(self, name: str, url: str) -> None:
+        self.name = name
+        self.url = url
+        self.pool = None
+        self.ingestor: Optional[Ingestor] = None
+
+    def __repr__(self) -> str:
+        return f"Shard({self.name!r})"
+
+
+class ShardSet:
+    """Daftar shard + router topic -> shard.
+
+    get_size/get_idle_size/get_max_size = jumlah semua pool, jadi
+    AppMetrics.bind_pool bisa langsung memakai ShardSet."""
+
+    ROUTE_CACHE_MAX = 100_000
+
+    def __init__(self, specs: Sequence[Tuple[str, str]], vnodes: int = VNODES) -> None:
+        self.shards = [Shard(name, url) for name, url in specs]
+        self.by_name = {s.name: s for s in self.shards}
+        self.ring = HashRing(list(self.by_name), vnodes)
+        self._routes: Dict[str, Shard] = {}
+
+    @classmethod
+    def from_settings(cls, settings) -> "ShardSet":
+        return cls(parse_shards(settings.database_shards, settings.database_url), settings.shard_vnodes)
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def for_topic(self, topic: str) -> Shard:
+        shard = self._routes.get(topic)
+        if shard is None:
+            if len(self.shards) == 1:
+                return self.shards[0]
+            if len(self._routes) >= self.ROUTE_CACHE_MAX:
+                self._routes.clear()
+            shard = self._routes[topic] = self.by_name[self.ring.lookup(topic)]
+        return shard
+
+    def pool_for(self, topic: str):
+        return self.for_topic(topic).pool
+
+    def split(self, events: Sequence) -> Dict[Shard, list]:
+        out: Dict[Shard, list] = {}
+        for e in events:
+            out.setdefault(self.for_topic(e.topic), []).append(e)
+        return out
+
+    def get_size(self) -> int:
+        return sum(s.pool.get_size() for s in self.shards)
+
+    def get_idle_size(self) -> int:
+        return sum(s.pool.get_idle_size() for s in self.shards)
+
+    def get_max_size(self) -> int:
+        return sum(s.pool.get_max_size() for s in self.shards)
+
+
+class ShardedIngestor:
+    """Antarmuka sama dengan Ingestor; batch dipecah per shard dan ditulis paralel.
+
+    Tiap shard commit sendiri-sendiri (tidak ada transaksi lintas database):
+    bila satu shard gagal, bagian di shard lain tetap commit dan error diteruskan
+    ke pemanggil; kirim ulang batch aman karena dedup per (topic, event_id).
+    """
+
+    def __init__(self, shards: ShardSet) -> None:
+        self.shards = shards
+        # Satu list dipakai bersama semua Ingestor shard
+        self.commit_listeners = shards.shards[0].ingestor.commit_listeners
+        self.claim_listeners = shards.shards[0].ingestor.claim_listeners
+        for s in shards:
+            s.ingestor.commit_listeners = self.commit_listeners
+            s.ingestor.claim_listeners = self.claim_listeners
+
+    async def write_groups(self, groups: Sequence[list], received: int, known: Sequence = ()) -> List[int]:
+        # received = event batch + duplikat yang sudah disaring cache (known)
+        parts: Dict[Shard, Tuple[List[list], list]] = {}
+        for gi, events in enumerate(groups):
+            for shard, evs in self.shards.split(events).items():
+                parts.setdefault(shard, ([[] for _ in groups], []))[0][gi].extend(evs)
+        for shard, evs in self.shards.split(known).items():
+            parts.setdefault(shard, ([[] for _ in groups], []))[1].extend(evs)
+        items = list(parts.items())
+        results = await asyncio.gather(*[
+            shard.ingestor.write_groups(sub, sum(len(g) for g in sub) + len(kn), kn)
+            for shard, (sub, kn) in items
+        ])
+        return [sum(r[gi] for r in results) for gi in range(len(groups))]
+
+    async def write_receipted(self, records: Sequence[Tuple[str, list]]) -> None:
+        # Receipt dicatat per shard untuk bagian event-nya sendiri (idempotent per shard)
+        parts: Dict[Shard, list] = {}
+        for receipt, events in records:
+            for shard, evs in self.shards.split(events).items():
+                parts.setdefault(shard, []).append((receipt, evs))
+        await asyncio.gather(*[shard.ingestor.write_receipted(recs) for shard, recs in parts.items()])
+
+
+def event_key(row) -> tuple:
+    """Urutan /events tanpa topic (turun): (ts_ingest, topic, event_id)."""
+    return row["ts_ingest"], row["topic"], row["event_id"]
+
+
+def merge_events(results: Sequence[Sequence], limit: int) -> list:
+    """Gabung hasil /events tiap shard (masing-masing sudah urut turun dan
+    dibatasi limit) menjadi `limit` baris teratas global."""
+    return list(itertools.islice(heapq.merge(*results, key=event_key, reverse=True), limit))
+
+
+async def merge_event_streams(streams: Sequence[AsyncIterator]) -> AsyncIterator:
+    """k-way merge iterator baris per shard (urut turun) untuk /events/export.
+
+    Jumlah shard kecil, jadi kepala tiap stream cukup dibandingkan linear."""
+    heads = {}
+    for i, it in enumerate(streams):
+        row = await anext(it, None)
+        if row is not None:
+            heads[i] = row
+    while heads:
+        i = max(heads, key=lambda k: event_key(heads[k]))
+        yield heads[i]
+        row = await anext(streams[i], None)
+        if row is None:
+            del heads[i]
+        else:
+            heads[i] = row
+
+
+def plan_moves(located: Dict[str, Set[str]], new: ShardSet) -> Dict[Tuple[str, str], List[str]]:
+    """{(shard asal, shard tujuan): [topic]} dari lokasi topic sekarang
+    ({nama shard: topic yang datanya ada di sana}) ke ring `new`."""
+    out: Dict[Tuple[str, str], List[str]] = {}
+    for src, topics in located.items():
+        for t in sorted(topics):
+            dst = new.for_topic(t).name
+            if dst != src:
+                out.setdefault((src, dst), []).append(t)
+    return out
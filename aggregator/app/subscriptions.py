@@ -0,0 +1,322 @@
+"""Subscription push (SSE) dengan consumer group dan offset durable per topic.
+
+Posisi = seq per topic (urut commit, lihat db.INSERT_EVENTS_SQL); cursor SSE
+dan offset group adalah seq terakhir yang sudah dikirim. Per topic ada satu TopicBroadcaster per proses: satu query
+DB per batch baru, hasilnya (sudah di-serialize) disimpan di ring buffer dan
+dibagikan ke semua subscriber topic itu. Subscriber yang tertinggal di
+belakang buffer (resume dari offset lama) membaca DB sendiri sampai menyusul.
+
+Broadcaster dibangunkan Ingestor setelah commit di proses yang sama; commit di
+proses lain terlihat lewat polling subscription_poll_ms. Offset auto-commit
+dikumpulkan OffsetCommitter dan ditulis sekali per offset_commit_interval_ms.
+"""
+import asyncio
+import bisect
+import logging
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import orjson
+
+from . import db
+from .metrics import AppMetrics
+
+log = logging.getLogger("subscriptions")
+
+Position = int
+ORIGIN: Position = 0
+
+
+def encode_position(pos: Position) -> str:
+    return str(pos)
+
+
+def decode_position(cursor: str) -> Position:
+    try:
+        pos = int(cursor)
+    except ValueError:
+        raise ValueError("cursor subscription tidak valid")
+    if pos < 0:
+        raise ValueError("cursor subscription tidak valid")
+    return pos
+
+
+def _serialize(rows) -> Tuple[List[Position], List[bytes]]:
+    return [r["seq"] for r in rows], [orjson.dumps(dict(r)) for r in rows]
+
+
+class TopicBroadcaster:
+    """Satu reader DB per topic; subscriber mengambil slice dari buffer bersama."""
+
+    def __init__(self, hub: "SubscriptionHub", topic: str) -> None:
+        self.hub = hub
+        self.topic = topic
+        self.subscribers = 0
+        self.floor: Optional[Position] = None  # buffer mencakup posisi > floor
+        self.head: Optional[Position] = None
+        self._positions: Deque[Position] = deque()
+        self._items: Deque[bytes] = deque()
+        self._wake = asyncio.Event()
+        self._changed = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name=f"broadcast-{self.topic}")
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def ready(self) -> None:
+        await self._ready.wait()
+
+    def changed(self) -> asyncio.Event:
+        """Event yang di-set saat ada data baru (atau broadcaster ditutup)."""
+        return self._changed
+
+    def _publish(self) -> None:
+        old, self._changed = self._changed, asyncio.Event()
+        old.set()
+
+    def after(self, pos: Position, limit: int) -> Optional[Tuple[List[bytes], Position]]:
+        """Slice buffer setelah `pos`; None bila pos di belakang buffer (baca DB)."""
+        if self.floor is None or pos < self.floor:
+            return None
+        positions = self._positions
+        i = bisect.bisect_right(positions, pos)
+        j = min(len(positions), i + limit)
+        if i == j:
+            return [], pos
+        return [self._items[k] for k in range(i, j)], positions[j - 1]
+
+    async def _run(self) -> None:
+        hub = self.hub
+        while not self.closed:
+            self._wake.clear()
+            try:
+                n = await self._fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("broadcast %s: baca gagal", self.topic)
+                n = 0
+            if n >= hub.batch_max:
+                continue  # kemungkinan masih ada backlog
+            try:
+                await asyncio.wait_for(self._wake.wait(), hub.poll_interval_s)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fetch(self) -> int:
+        hub = self.hub
+        async with hub.metrics.acquire(hub.pool_for(self.topic), hub.acquire_timeout) as conn:
+            if self.head is None:
+                self.head = self.floor = await db.read_head(conn, self.topic)
+                self._ready.set()
+                return 0
+            rows = await db.read_after(conn, self.topic, self.head, hub.batch_max)
+        hub.metrics.subscription_db_reads.inc(kind="broadcast")
+        hub.metrics.subscription_rows_read.inc(len(rows), kind="broadcast")
+        if not rows:
+            return 0
+        positions, items = _serialize(rows)
+        self._positions.extend(positions)
+        self._items.extend(items)
+        self.head = positions[-1]
+        while len(self._positions) > hub.buffer_events:
+            self.floor = self._positions.popleft()
+            self._items.popleft()
+        self._publish()
+        return len(rows)
+
+    async def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+        self._publish()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class OffsetCommitter:
+    """Kumpulkan offset auto-commit in-memory, tulis batch tiap interval."""
+
+    def __init__(self, pool_for, interval_s: float, metrics: AppMetrics,
+                 acquire_timeout: Optional[float] = None) -> None:
+        self.pool_for = pool_for
+        self.interval_s = interval_s
+        self.metrics = metrics
+        self.acquire_timeout = acquire_timeout
+        self._pending: Dict[Tuple[str, str], Position] = {}
+        self._lock = asyncio.Lock()  # flush vs seek: seek tidak ditimpa flush yang sedang jalan
+        self._task: Optional[asyncio.Task] = None
+
+    def note(self, group: str, topic: str, pos: Position) -> None:
+        key = (group, topic)
+        if pos > self._pending.get(key, ORIGIN):
+            self._pending[key] = pos
+
+    async def seek(self, group: str, topic: str, pos: Position) -> None:
+        """Set offset langsung (boleh mundur); offset pending group itu dibuang."""
+        async with self._lock:
+            self._pending.pop((group, topic), None)
+            async with self.metrics.acquire(self.pool_for(topic), self.acquire_timeout) as conn:
+                await db.seek_offset(conn, group, topic, pos)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="offset-committer")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("commit offset gagal, dicoba lagi")
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            # Offset disimpan di shard topic-nya: satu statement per pool
+            by_pool: Dict[object, dict] = {}
+            for key, pos in batch.items():
+                by_pool.setdefault(self.pool_for(key[1]), {})[key] = pos
+            todo = list(by_pool.items())
+            try:
+                while todo:
+                    pool, offsets = todo[0]
+                    async with self.metrics.acquire(pool, self.acquire_timeout) as conn:
+                        await db.commit_offsets(conn, offsets)
+                    todo.pop(0)
+                    self.metrics.offset_commits.inc()
+            except BaseException:
+                # Yang belum tertulis dicoba lagi di flush berikutnya
+                for _, offsets in todo:
+                    for (g, t), pos in offsets.items():
+                        self.note(g, t, pos)
+                raise
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+
+class SubscriptionHub:
+    def __init__(self, pool_for, settings, metrics: Optional[AppMetrics] = None) -> None:
+        self.pool_for = pool_for  # topic -> pool shard-nya
+        self.metrics = metrics or AppMetrics()
+        self.batch_max = max(1, settings.subscription_batch_max)
+        self.buffer_events = max(self.batch_max, settings.subscription_buffer_events)
+        self.poll_interval_s = settings.subscription_poll_ms / 1000.0
+        self.heartbeat_s = settings.subscription_heartbeat_sec
+        self.acquire_timeout = settings.db_acquire_timeout_sec
+        self.committer = OffsetCommitter(pool_for, settings.offset_commit_interval_ms / 1000.0, self.metrics,
+                                         self.acquire_timeout)
+        self.broadcasters: Dict[str, TopicBroadcaster] = {}
+        self.subscribers = 0
+        self.closed = False
+
+    def start(self) -> None:
+        self.committer.start()
+
+    def wake(self, topics) -> None:
+        """Commit listener Ingestor: topic yang baru ditulis dibaca segera."""
+        for t in topics:
+            bc = self.broadcasters.get(t)
+            if bc is not None:
+                bc.wake()
+
+    async def start_position(self, group: str, topic: str, start: str) -> Optional[Position]:
+        """Posisi awal dari offset group / earliest; None = mulai dari head
+        broadcaster (latest) saat stream tersambung."""
+        if start == "earliest":
+            return ORIGIN
+        if start == "committed" and group:
+            async with self.metrics.acquire(self.pool_for(topic), self.acquire_timeout) as conn:
+                rows = await db.read_offsets(conn, group, topic)
+            if rows:
+                return rows[0]["seq"]
+        return None
+
+    def _acquire(self, topic: str) -> TopicBroadcaster:
+        bc = self.broadcasters.get(topic)
+        if bc is None:
+            bc = self.broadcasters[topic] = TopicBroadcaster(self, topic)
+            bc.start()
+        bc.subscribers += 1
+        return bc
+
+    def _release(self, bc: TopicBroadcaster) -> None:
+        bc.subscribers -= 1
+        if bc.subscribers == 0 and self.broadcasters.get(bc.topic) is bc:
+            del self.broadcasters[bc.topic]
+            asyncio.get_running_loop().create_task(bc.close())
+
+    async def stream(self, group: str, topic: str, pos: Optional[Position], *, batch: int, auto_commit: bool = True,
+                     limit: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Frame SSE: satu `event: events` per batch, `id:` = cursor posisi terakhir."""
+        bc = self._acquire(topic)
+        sent = 0
+        m = self.metrics
+        counted = False
+        try:
+            await bc.ready()
+            if bc.closed:
+                return
+            if pos is None:
+                pos = bc.head
+            self.subscribers += 1
+            counted = True
+            while not (bc.closed or self.closed):
+                changed = bc.changed()
+                n = batch if limit is None else min(batch, limit - sent)
+                got = bc.after(pos, n)
+                if got is None:
+                    # Tertinggal di belakang buffer: susul langsung dari DB
+                    async with m.acquire(self.pool_for(topic), self.acquire_timeout) as conn:
+                        rows = await db.read_after(conn, topic, pos, n)
+                    m.subscription_db_reads.inc(kind="catchup")
+                    m.subscription_rows_read.inc(len(rows), kind="catchup")
+                    if rows:
+                        positions, items = _serialize(rows)
+                        got = items, positions[-1]
+                    else:
+                        # Baris di antara pos..floor sudah hilang (retention): lompat
+                        got = [], bc.floor
+                items, new_pos = got
+                if items:
+                    pos = new_pos
+                    sent += len(items)
+                    m.subscription_events_sent.inc(len(items))
+                    yield (b"id: " + encode_position(pos).encode() + b"\nevent: events\ndata: ["
+                           + b",".join(items) + b"]\n\n")
+                    if auto_commit:
+                        self.committer.note(group, topic, pos)
+                    if limit is not None and sent >= limit:
+                        return
+                    continue
+                if new_pos != pos:
+                    pos = new_pos
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), self.heartbeat_s)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            if counted:
+                self.subscribers -= 1
+            self._release(bc)
+
+    async def close(self) -> None:
+        self.closed = True
+        for bc in list(self.broadcasters.values()):
+            await bc.close()
+        self.broadcasters.clear()
+        await self.committer.close()
@@ -0,0 +1,370 @@
+"""Write-ahead log lokal untuk mode ack asinkron (POST /publish -> 202 + receipt).
+
+Event yang sudah lolos validasi ditulis ke segmen file append-only dan di-fsync
+(group commit: satu fsync untuk semua request yang menunggu) sebelum request
+dijawab. WalFlusher memindahkan record ke Postgres secara bulk; segmen yang
+semua record-nya sudah commit dihapus.
+
+Format: satu record per baris, `<crc32 8 hex> <json>\\n` dengan json =
+{"r": receipt, "e": [[topic, event_id, ts, source, payload], ...]}. Saat
+startup semua segmen yang tersisa di-replay; ekor yang terpotong (crash di
+tengah write) dibuang. Replay idempotent: receipt yang sudah ada di
+wal_receipts dilewati utuh (stats tidak terhitung dua kali), event baru tetap
+di-dedup ON CONFLICT.
+
+Tiap proses mengunci satu direktori `slot-N` (flock), jadi beberapa proses
+bisa berbagi wal_dir; slot tanpa pemilik (proses mati / PROCESSES dikurangi)
+di-adopsi dan di-replay oleh proses lain saat startup.
+"""
+import asyncio
+import fcntl
+import itertools
+import logging
+import os
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+from .metrics import AppMetrics
+
+log = logging.getLogger("wal")
+
+
+class WalFull(Exception):
+    """Backlog WAL melewati wal_max_backlog_bytes (flusher tertinggal jauh)."""
+
+
+class WalEvent(NamedTuple):
+    topic: str
+    event_id: str
+    timestamp: datetime
+    source: str
+    payload: dict
+
+
+def encode_record(receipt: str, events) -> bytes:
+    body = orjson.dumps({
+        "r": receipt,
+        "e": [[e.topic, e.event_id, e.timestamp.isoformat(), e.source, e.payload] for e in events],
+    })
+    return b"%08x " % zlib.crc32(body) + body + b"\n"
+
+
+def decode_record(line: bytes) -> Optional[Tuple[str, List[WalEvent]]]:
+    """Record utuh -> (receipt, events); None bila rusak/terpotong."""
+    if len(line) < 10 or line[8:9] != b" " or not line.endswith(b"\n"):
+        return None
+    body = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(body):
+            return None
+        obj = orjson.loads(body)
+    except ValueError:
+        return None
+    return obj["r"], [WalEvent(t, i, datetime.fromisoformat(ts), s, p) for t, i, ts, s, p in obj["e"]]
+
+
+def read_segment(path: Path) -> Tuple[List[Tuple[str, List[WalEvent], int]], int]:
+    """Baca record valid sampai record rusak pertama: ([(receipt, events, nbytes)], offset_valid)."""
+    records, good = [], 0
+    with open(path, "rb") as f:
+        for line in f:
+            rec = decode_record(line)
+            if rec is None:
+                break
+            records.append((rec[0], rec[1], len(line)))
+            good += len(line)
+    return records, good
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    # os.write boleh menulis sebagian (short write); ulangi sampai habis
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _try_lock(slot: Path) -> Optional[int]:
+    slot.mkdir(parents=True, exist_ok=True)
+    fd = os.open(slot / "lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class _Segment:
+    __slots__ = ("path", "remaining", "sealed")
+
+    def __init__(self, path: Path, sealed: bool = False) -> None:
+        self.path = path
+        self.remaining = 0  # record yang belum commit ke DB
+        self.sealed = sealed
+
+
+class _Entry(NamedTuple):
+    segment: _Segment
+    nbytes: int
+    receipt: str
+    events: List[WalEvent]
+
+
+class WriteAheadLog:
+    def __init__(self, root: str, *, segment_max_bytes: int = 64 << 20, fsync: bool = True,
+                 max_backlog_bytes: int = 1 << 30, metrics: Optional[AppMetrics] = None) -> None:
+        self.root = Path(root)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self.max_backlog_bytes = max_backlog_bytes
+        self.metrics = metrics or AppMetrics()
+        self.slot: Optional[Path] = None
+        self.pending: Dict[str, int] = {}  # receipt -> jumlah event, belum commit ke DB
+        self.backlog_bytes = 0
+        self.replayed_records = 0
+        self._lock_fds: List[int] = []
+        self._ready: Deque[_Entry] = deque()
+        self._has_ready = asyncio.Event()
+        self._buf: List[Tuple[str, list, bytes, asyncio.Future]] = []
+        self._has_buf = asyncio.Event()
+        self._seq = 0
+        self._active: Optional[_Segment] = None
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._writer: Optional[asyncio.Task] = None
+        self._closing = False
+
+    # ---- startup / replay ----
+    def open(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        for k in itertools.count():
+            fd = _try_lock(self.root / f"slot-{k}")
+            if fd is not None:
+                self.slot = self.root / f"slot-{k}"
+                self._lock_fds.append(fd)
+                break
+        # Slot lain yang tidak dikunci siapa pun = milik proses yang sudah mati
+        for other in sorted(self.root.glob("slot-*")):
+            if other == self.slot or not any(other.glob("wal-*.log")):
+                continue
+            fd = _try_lock(other)
+            if fd is not None:
+                self._lock_fds.append(fd)
+                self._replay_dir(other)
+        self._replay_dir(self.slot)
+        self._seq = max((int(p.stem.split("-")[1]) for p in self.slot.glob("wal-*.log")), default=0)
+        self._rotate()
+        self._writer = asyncio.create_task(self._write_loop(), name="wal-writer")
+
+    def _replay_dir(self, slot: Path) -> None:
+        for path in sorted(slot.glob("wal-*.log")):
+            records, good = read_segment(path)
+            if good < path.stat().st_size:
+                log.warning("wal %s: ekor rusak/terpotong dibuang (%d byte)", path, path.stat().st_size - good)
+                os.truncate(path, good)
+            seg = _Segment(path, sealed=True)
+            for receipt, events, nbytes in records:
+                self._enqueue(_Entry(seg, nbytes, receipt, events))
+            self.replayed_records += len(records)
+            if not records:
+                path.unlink()
+
+    # ---- write path ----
+    def _rotate(self) -> None:
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            os.close(fd)
+            self._active.sealed = True
+            self._maybe_delete(self._active)
+        self._seq += 1
+        path = self.slot / f"wal-{self._seq:012d}.log"
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._active = _Segment(path)
+        self._size = 0
+        if self.fsync:
+            _fsync_dir(self.slot)
+
+    async def append(self, receipt: str, events: list) -> None:
+        """Kembali setelah record durable di disk (fsync)."""
+        if self._closing:
+            raise RuntimeError("WAL sedang ditutup")
+        if self.backlog_bytes >= self.max_backlog_bytes:
+            raise WalFull()
+        line = encode_record(receipt, events)
+        fut = asyncio.get_running_loop().create_future()
+        self._buf.append((receipt, events, line, fut))
+        self._has_buf.set()
+        await fut
+
+    async def _write_loop(self) -> None:
+        while True:
+            await self._has_buf.wait()
+            buf, self._buf = self._buf, []
+            self._has_buf.clear()
+            if not buf:
+                if self._closing:
+                    return
+                continue
+            try:
+                if self._fd is None:
+                    self._rotate()  # segmen sebelumnya ditinggalkan setelah error
+                _write_all(self._fd, b"".join(b[2] for b in buf))
+                if self.fsync:
+                    with self.metrics.wal_fsync_seconds.time():
+                        # fsync di thread: event loop tetap melayani request lain
+                        await asyncio.to_thread(os.fsync, self._fd)
+            except Exception as e:
+                log.exception("wal write gagal")
+                self._discard_tail()
+                for *_, fut in buf:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            seg = self._active
+            for receipt, events, line, fut in buf:
+                self._enqueue(_Entry(seg, len(line), receipt, events))
+                self._size += len(line)
+                if not fut.done():
+                    fut.set_result(None)
+            if self._size >= self.segment_max_bytes:
+                try:
+                    self._rotate()
+                except OSError:
+                    log.exception("wal rotate gagal, dicoba lagi saat write berikutnya")
+
+    def _discard_tail(self) -> None:
+        # Write/fsync gagal: setelah record terakhir yang sukses (self._size)
+        # bisa ada record terpotong. read_segment berhenti di record rusak
+        # pertama, jadi ekor itu harus hilang sebelum record lain ditulis di
+        # belakangnya; kalau tidak, record yang di-ack sesudahnya tidak ter-replay.
+        if self._fd is None:
+            return
+        try:
+            os.ftruncate(self._fd, self._size)
+            if self.fsync:
+                os.fsync(self._fd)
+            return
+        except OSError:
+            log.exception("wal truncate gagal, pindah ke segmen baru")
+        # Ekor rusak tetap di segmen lama (dibuang saat replay); record
+        # berikutnya masuk segmen baru
+        try:
+            self._rotate()
+        except OSError:
+            log.exception("wal rotate gagal, dicoba lagi saat write berikutnya")
+
+    def _enqueue(self, entry: _Entry) -> None:
+        entry.segment.remaining += 1
+        self.pending[entry.receipt] = len(entry.events)
+        self.backlog_bytes += entry.nbytes
+        self._ready.append(entry)
+        self._has_ready.set()
+
+    # ---- flush side ----
+    def peek(self, max_events: int) -> List[_Entry]:
+        out, n = [], 0
+        for e in self._ready:
+            if out and n + len(e.events) > max_events:
+                break
+            out.append(e)
+            n += len(e.events)
+        return out
+
+    async def wait_ready(self) -> None:
+        await self._has_ready.wait()
+
+    def commit(self, count: int) -> None:
+        """`count` entry terdepan sudah commit di Postgres."""
+        for _ in range(count):
+            e = self._ready.popleft()
+            self.pending.pop(e.receipt, None)
+            self.backlog_bytes -= e.nbytes
+            e.segment.remaining -= 1
+            self._maybe_delete(e.segment)
+        if not self._ready:
+            self._has_ready.clear()
+
+    def _maybe_delete(self, seg: _Segment) -> None:
+        if seg.sealed and seg.remaining == 0 and seg.path.exists():
+            seg.path.unlink()
+
+    def wake(self) -> None:
+        self._has_ready.set()
+
+    async def close(self) -> None:
+        self._closing = True
+        self._has_buf.set()
+        if self._writer is not None:
+            await self._writer
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            # Segmen aktif yang sudah habis di-flush tidak perlu di-replay
+            self._active.sealed = True
+            self._maybe_delete(self._active)
+        for fd in self._lock_fds:
+            os.close(fd)
+        self._lock_fds = []
+
+
+class WalFlusher:
+    """Bulk-load record WAL ke processed_events (lewat Ingestor) dengan retry."""
+
+    def __init__(self, wal: WriteAheadLog, ingestor, max_events: int = 5000, retry_max_sec: float = 5.0) -> None:
+        self.wal = wal
+        self.ingestor = ingestor
+        self.max_events = max(1, max_events)
+        self.retry_max_sec = retry_max_sec
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.flushes = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="wal-flusher")
+
+    async def _run(self) -> None:
+        delay = 0.05
+        while True:
+            entries = self.wal.peek(self.max_events)
+            if not entries:
+                if self._closing:
+                    return
+                await self.wal.wait_ready()
+                continue
+            try:
+                await self.ingestor.write_receipted([(e.receipt, e.events) for e in entries])
+            except Exception:
+                log.exception("wal flush gagal, retry %.2fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(self.retry_max_sec, delay * 2)
+                continue
+            delay = 0.05
+            self.wal.commit(len(entries))
+            self.flushes += 1
+
+    async def close(self, timeout: float) -> None:
+        """Flush sisa backlog sampai `timeout`; sisanya tetap di disk untuk replay."""
+        self._closing = True
+        self.wal.wake()
+        if self._task is None:
+            return
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            log.warning("wal flush belum selesai setelah %.1fs; %d receipt di-replay saat start berikutnya",
+                        time.monotonic() - t0, len(self.wal.pending))
@@ -1,30 +1,158 @@
 import asyncio
 import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional
+
 from . import db
+from .metrics import AppMetrics
+from .notify import Wakeup
 
 log = logging.getLogger("worker")
 
 
-async def worker_loop(pool, batch_size: int, poll_interval_ms: int, *, stop_event: asyncio.Event) -> None:
+@dataclass
+class WorkerStats:
+    """Counter in-process untuk membandingkan mode polling vs NOTIFY."""
+
+    claims: int = 0
+    empty_claims: int = 0
+    claimed_rows: int = 0
+    notify_wakeups: int = 0
+    timeout_wakeups: int = 0
+    # enqueue -> claim latency (detik) untuk sampel terakhir
+    claim_latency: deque = field(default_factory=lambda: deque(maxlen=10_000))
+
+
+async def worker_loop(
+    pool,
+    batch_size: int,
+    poll_interval_ms: int,
+    *,
+    stop_event: asyncio.Event,
+    stuck_processing_sec: int = 300,
+    max_attempts: int = 5,
+    wakeup: Optional[Wakeup] = None,
+    max_poll_interval_ms: int = 2000,
+    stats: Optional[WorkerStats] = None,
+    stats_shards: int = 1,
+    metrics: Optional[AppMetrics] = None,
+) -> None:
     sleep_s = max(0.001, poll_interval_ms / 1000.0)
+    max_sleep_s = max(sleep_s, max_poll_interval_ms / 1000.0)
+    stats = stats or WorkerStats()
+    metrics = metrics or AppMetrics()
+    delay = sleep_s
     while not stop_event.is_set():
-        rows = await db.claim_events(pool, batch_size)
+        seen = wakeup.seq if wakeup else 0
+        claim = asyncio.ensure_future(db.claim_events(pool, batch_size, stuck_processing_sec))
+        try:
+            with metrics.worker_claim_seconds.time():
+                rows = await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            # UPDATE claim bisa sudah commit di server: tunggu hasilnya lalu kembalikan barisnya
+            await asyncio.shield(_release_after(pool, claim))
+            raise
+        except Exception:
+            # DB sementara tidak tersedia: jangan matikan task, coba lagi nanti
+            log.exception("claim_events failed")
+            await _sleep_or_stop(stop_event, delay)
+            continue
+        stats.claims += 1
         if not rows:
-            await asyncio.sleep(sleep_s)
+            stats.empty_claims += 1
+            metrics.worker_empty_claims.inc()
+            if wakeup is None:
+                await _sleep_or_stop(stop_event, sleep_s)
+            elif await wakeup.wait(seen, delay):
+                stats.notify_wakeups += 1
+                delay = sleep_s
+            else:
+                stats.timeout_wakeups += 1
+                delay = min(max_sleep_s, delay * 2)
             continue
 
+        delay = sleep_s
+        stats.claimed_rows += len(rows)
+        metrics.worker_claimed_rows.inc(len(rows))
+        stats.claim_latency.extend(r["wait_s"] for r in rows)
+        if wakeup is not None and len(rows) >= batch_size:
+            # Batch penuh -> kemungkinan masih ada backlog, bangunkan worker lain
+            wakeup.notify()
+
         ids = [int(r["id"]) for r in rows]
 
         # "processing" side-effect: untuk tugas ini cukup mark done.
         # Kalau mau side-effect lain (mis. agregasi), letakkan di sini
         # dan pastikan commit idempotent berbasis event row yang unik.
+        mark = asyncio.ensure_future(db.mark_done(pool, ids, shard=db.pick_shard(stats_shards)))
         try:
-            done = await db.mark_done(pool, ids)
+            with metrics.worker_mark_seconds.time():
+                done = await asyncio.shield(mark)
             log.info("processed=%s", done)
+        except asyncio.CancelledError:
+            # Drain shutdown habis waktunya: kembalikan claim yang belum selesai
+            # supaya proses lain langsung bisa mengambilnya (bukan menunggu stuck_processing_sec)
+            await asyncio.shield(_release_after(pool, mark, ids))
+            raise
         except Exception as e:
             log.exception("mark_done failed: %s", e)
             for rid in ids:
                 try:
-                    await db.mark_failed(pool, rid, repr(e))
+                    await db.mark_failed(pool, rid, repr(e), max_attempts)
                 except Exception:
                     log.exception("mark_failed failed for id=%s", rid)
+
+
+async def _release_after(pool, task: asyncio.Future, ids: Optional[List[int]] = None) -> None:
+    """Tunggu `task` (claim_events / mark_done) selesai, lalu kembalikan claim-nya ke 'pending'.
+
+    ids=None -> id diambil dari hasil claim_events. mark_done yang sukses sudah
+    commit semua barisnya jadi 'done', jadi tidak ada yang dikembalikan; kalau
+    gagal, RELEASE_CLAIMS_SQL tetap hanya menyentuh baris yang masih 'processing'.
+    """
+    try:
+        result = await task
+    except (Exception, asyncio.CancelledError):
+        result = None
+    if ids is None:
+        ids = [int(r["id"]) for r in result or ()]
+    elif result is not None:
+        return
+    if not ids:
+        return
+    try:
+        await db.release_claims(pool, ids)
+    except Exception:
+        log.exception("release_claims failed for %d rows", len(ids))
+
+
+async def _sleep_or_stop(stop_event: asyncio.Event, timeout: float) -> None:
+    # Seperti asyncio.sleep, tapi langsung bangun saat shutdown
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+def start_workers(pool, settings, stop_event: asyncio.Event, *, wakeup: Optional[Wakeup] = None,
+                  stats: Optional[WorkerStats] = None, metrics: Optional[AppMetrics] = None) -> list:
+    return [
+        asyncio.create_task(
+            worker_loop(
+                pool,
+                settings.batch_size,
+                settings.poll_interval_ms,
+                stop_event=stop_event,
+                stuck_processing_sec=settings.stuck_processing_sec,
+                max_attempts=settings.max_attempts,
+                wakeup=wakeup,
+                max_poll_interval_ms=settings.max_poll_interval_ms,
+                stats=stats,
+                stats_shards=settings.stats_shards,
+                metrics=metrics,
+            ),
+            name=f"worker-{i}",
+        )
+        for i in range(settings.workers)
+    ]
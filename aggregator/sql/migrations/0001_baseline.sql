@@ -0,0 +1,220 @@
+-- Migrasi 0001: skema aggregator sampai sebelum ada schema_migrations.
+-- Idempotent karena database yang sudah ada (tanpa tabel versi) juga
+-- menjalankannya sekali saat upgrade. Jangan diubah: perubahan skema berikutnya
+-- ditulis sebagai file baru (0002_...sql), lihat app/migrations.py.
+
+CREATE TABLE IF NOT EXISTS stats (
+  key TEXT PRIMARY KEY,
+  val BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO stats(key, val) VALUES
+  ('received', 0),
+  ('unique_processed', 0),
+  ('duplicate_dropped', 0)
+ON CONFLICT (key) DO NOTHING;
+
+-- Counter di-shard: satu baris per shard, /stats = SUM semua shard.
+-- Tabel stats lama hanya dipakai sebagai sumber migrasi ke shard 0.
+CREATE TABLE IF NOT EXISTS stats_shard (
+  shard INT PRIMARY KEY,
+  received BIGINT NOT NULL DEFAULT 0,
+  unique_processed BIGINT NOT NULL DEFAULT 0,
+  duplicate_dropped BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO stats_shard(shard, received, unique_processed, duplicate_dropped)
+  SELECT 0,
+         coalesce(sum(val) FILTER (WHERE key = 'received'), 0),
+         coalesce(sum(val) FILTER (WHERE key = 'unique_processed'), 0),
+         coalesce(sum(val) FILTER (WHERE key = 'duplicate_dropped'), 0)
+  FROM stats
+ON CONFLICT (shard) DO NOTHING;
+
+INSERT INTO stats_shard(shard) SELECT generate_series(0, 15)
+ON CONFLICT (shard) DO NOTHING;
+
+-- Dedup key terpisah dari tabel event: unique index global tidak bisa ada di
+-- tabel partisi (harus memuat ts_ingest), jadi dedup (topic, event_id) lintas
+-- partisi dijaga tabel kecil ini. TTL lewat first_seen (lihat partitions.py).
+CREATE TABLE IF NOT EXISTS dedup_keys (
+  topic TEXT NOT NULL,
+  event_id TEXT NOT NULL,
+  first_seen TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (topic, event_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_dedup_first_seen ON dedup_keys (first_seen);
+
+-- Receipt mode ack asinkron (/publish -> 202): status commit per batch WAL.
+-- TTL lewat committed_at (receipt_ttl_days, lihat partitions.py).
+CREATE TABLE IF NOT EXISTS wal_receipts (
+  receipt TEXT PRIMARY KEY,
+  accepted INT NOT NULL,
+  inserted INT NOT NULL DEFAULT 0,
+  committed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_wal_receipts_committed ON wal_receipts (committed_at);
+
+-- Tabel lama (non-partisi) di-rename dulu, lalu datanya dipindah ke tabel partisi.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_class
+    WHERE relname = 'processed_events' AND relkind = 'r'
+      AND relnamespace = current_schema()::regnamespace
+  ) THEN
+    ALTER TABLE processed_events RENAME TO processed_events_legacy;
+  END IF;
+END $$;
+
+-- processed_events = log event + antrian worker, partisi RANGE per ts_ingest.
+-- Partisi harian/jam dibuat di muka oleh partitions.ensure_partitions; event di
+-- luar rentang partisi yang ada masuk ke partisi DEFAULT.
+CREATE TABLE IF NOT EXISTS processed_events (
+  id BIGSERIAL,
+  topic TEXT NOT NULL,
+  event_id TEXT NOT NULL,
+  ts_ingest TIMESTAMPTZ NOT NULL,
+  source TEXT,      -- hanya baris lama; baris baru pakai source_id
+  payload JSONB NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',
+  claimed_at TIMESTAMPTZ,
+  attempts INT NOT NULL DEFAULT 0,
+  last_error TEXT,
+  processed_at TIMESTAMPTZ,
+  enqueued_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  source_id INT,
+  seq BIGINT
+) PARTITION BY RANGE (ts_ingest);
+
+CREATE TABLE IF NOT EXISTS processed_events_default PARTITION OF processed_events DEFAULT;
+
+DO $$
+BEGIN
+  IF to_regclass('processed_events_legacy') IS NOT NULL THEN
+    -- Samakan kolom tabel lama (versi sebelum queue: anggap semua sudah 'done')
+    ALTER TABLE processed_events_legacy ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+    ALTER TABLE processed_events_legacy ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'done';
+    ALTER TABLE processed_events_legacy ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ;
+    ALTER TABLE processed_events_legacy ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0;
+    ALTER TABLE processed_events_legacy ADD COLUMN IF NOT EXISTS last_error TEXT;
+    ALTER TABLE processed_events_legacy ADD COLUMN IF NOT EXISTS processed_at TIMESTAMPTZ;
+    ALTER TABLE processed_events_legacy ADD COLUMN IF NOT EXISTS enqueued_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+    INSERT INTO dedup_keys(topic, event_id, first_seen)
+      SELECT topic, event_id, enqueued_at FROM processed_events_legacy
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO processed_events(id, topic, event_id, ts_ingest, source, payload, status,
+                                 claimed_at, attempts, last_error, processed_at, enqueued_at)
+      SELECT id, topic, event_id, coalesce(ts_ingest, enqueued_at), coalesce(source, ''),
+             coalesce(payload, '{}'::jsonb), status, claimed_at, attempts, last_error,
+             processed_at, enqueued_at
+      FROM processed_events_legacy;
+
+    PERFORM setval(pg_get_serial_sequence('processed_events', 'id'),
+                   greatest((SELECT max(id) FROM processed_events), 1));
+    DROP TABLE processed_events_legacy;
+  END IF;
+END $$;
+
+-- Kamus source: tiap baris menyimpan source_id (4 byte) alih-alih TEXT berulang.
+-- Baris dari versi sebelumnya tetap memakai kolom source (dibaca via coalesce)
+-- sampai partisinya kena retention; tidak ada rewrite tabel saat upgrade.
+CREATE TABLE IF NOT EXISTS event_sources (
+  id INT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  name TEXT NOT NULL UNIQUE
+);
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'processed_events' AND column_name = 'source_id'
+  ) THEN
+    ALTER TABLE processed_events ADD COLUMN source_id INT;
+    ALTER TABLE processed_events ALTER COLUMN source DROP NOT NULL;
+  END IF;
+END $$;
+
+-- Nomor urut per topic (1, 2, 3, ... tanpa celah) dialokasikan per batch dari
+-- counter topic_seq di akhir transaksi insert. Lock baris counter dipegang sampai
+-- commit, jadi urutan seq = urutan commit per topic: pembaca "seq > N" tidak
+-- pernah melewatkan baris yang commit belakangan. Baris sebelum upgrade: seq NULL.
+CREATE TABLE IF NOT EXISTS topic_seq (
+  topic TEXT PRIMARY KEY,
+  last_seq BIGINT NOT NULL
+);
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'processed_events' AND column_name = 'seq'
+  ) THEN
+    ALTER TABLE processed_events ADD COLUMN seq BIGINT;
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_processed_topic_seq ON processed_events (topic, seq);
+
+-- Offset consumer group per topic (seq terakhir yang sudah dikirim)
+CREATE TABLE IF NOT EXISTS consumer_offsets (
+  group_name TEXT NOT NULL,
+  topic TEXT NOT NULL,
+  seq BIGINT NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (group_name, topic)
+);
+
+CREATE INDEX IF NOT EXISTS idx_processed_id ON processed_events (id);
+CREATE INDEX IF NOT EXISTS idx_processed_key ON processed_events (topic, event_id);
+CREATE INDEX IF NOT EXISTS idx_processed_queue ON processed_events (id)
+  WHERE status IN ('pending', 'processing');
+CREATE INDEX IF NOT EXISTS idx_processed_ts ON processed_events (ts_ingest DESC);
+CREATE INDEX IF NOT EXISTS idx_processed_topic_ts ON processed_events (topic, ts_ingest DESC);
+
+-- Agregat per topic (di-shard seperti stats_shard), diupdate di transaksi ingest
+-- dan mark_done/mark_failed. /stats membaca tabel kecil ini, bukan processed_events.
+CREATE TABLE IF NOT EXISTS topic_stats (
+  topic TEXT NOT NULL,
+  shard INT NOT NULL,
+  received BIGINT NOT NULL DEFAULT 0,
+  inserted BIGINT NOT NULL DEFAULT 0,
+  duplicates BIGINT NOT NULL DEFAULT 0,
+  done BIGINT NOT NULL DEFAULT 0,
+  failed BIGINT NOT NULL DEFAULT 0,
+  first_ts TIMESTAMPTZ,
+  last_ts TIMESTAMPTZ,
+  PRIMARY KEY (topic, shard)
+);
+
+-- Backfill sekali dari data yang sudah ada (upgrade dari versi tanpa topic_stats).
+-- Duplikat historis tidak tercatat per topic, jadi received = inserted.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM topic_stats) THEN
+    INSERT INTO topic_stats (topic, shard, received, inserted, done, failed, first_ts, last_ts)
+      SELECT topic, 0, count(*), count(*),
+             count(*) FILTER (WHERE status = 'done'),
+             count(*) FILTER (WHERE status = 'failed'),
+             min(ts_ingest), max(ts_ingest)
+      FROM processed_events
+      GROUP BY topic;
+  END IF;
+END $$;
+
+-- Rollup per menit waktu terima (opsional, TOPIC_ROLLUP_ENABLED); dibersihkan
+-- oleh maintenance setelah topic_rollup_retention_hours.
+CREATE TABLE IF NOT EXISTS topic_rollup_minute (
+  topic TEXT NOT NULL,
+  minute TIMESTAMPTZ NOT NULL,
+  shard INT NOT NULL,
+  received BIGINT NOT NULL DEFAULT 0,
+  inserted BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (topic, minute, shard)
+);
+
+CREATE INDEX IF NOT EXISTS idx_topic_rollup_minute ON topic_rollup_minute (minute);
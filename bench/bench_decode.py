@@ -0,0 +1,70 @@
+"""Micro-benchmark parse+validate(+encode payload) per 1k event untuk POST /publish.
+
+    python -m bench.bench_decode
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+
+import orjson
+
+from aggregator.app.db import _jsonb_encode
+from aggregator.app.main import EventIn, _normalize_payload, _parse_events, _payload_limit
+from aggregator.app.settings import Settings
+
+MAX_PAYLOAD_BYTES = Settings.model_fields["max_payload_bytes"].default
+
+
+def make_body(n: int) -> bytes:
+    now = datetime.now(timezone.utc).isoformat()
+    return json.dumps([
+        {"topic": "orders", "event_id": f"e-{i}", "timestamp": now, "source": "bench",
+         "payload": {"rand": i, "tags": ["a", "b"], "meta": {"ok": True}}}
+        for i in range(n)
+    ]).encode()
+
+
+def old_path(raw: bytes):
+    events = [EventIn.model_validate(e) for e in _normalize_payload(json.loads(raw))]
+    return [json.dumps(e.payload) for e in events]
+
+
+def new_path(raw: bytes):
+    # Seperti POST /publish: cek ukuran payload dilewati bila body x JSON_REENCODE_GROWTH <= batas
+    events = _parse_events(_normalize_payload(orjson.loads(raw)), _payload_limit(len(raw), MAX_PAYLOAD_BYTES))
+    return [_jsonb_encode(e.payload) for e in events]
+
+
+def checked_path(raw: bytes):
+    # Body > batas: orjson.dumps per payload untuk cek ukuran
+    events = _parse_events(_normalize_payload(orjson.loads(raw)), MAX_PAYLOAD_BYTES)
+    return [_jsonb_encode(e.payload) for e in events]
+
+
+def bench(fn, raw, rounds):
+    fn(raw)
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn(raw)
+    return (time.perf_counter() - t0) / rounds
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=1000)
+    ap.add_argument("--rounds", type=int, default=50)
+    a = ap.parse_args()
+    raw = make_body(a.events)
+    scale = 1000 / a.events
+    t_old = bench(old_path, raw, a.rounds) * scale
+    t_new = bench(new_path, raw, a.rounds) * scale
+    t_checked = bench(checked_path, raw, a.rounds) * scale
+    print(f"old (json + model_validate loop + json.dumps): {t_old * 1000:7.2f} ms / 1k events")
+    print(f"new (orjson + TypeAdapter + orjson codec):     {t_new * 1000:7.2f} ms / 1k events")
+    print(f"new + cek payload (body x5 > batas):           {t_checked * 1000:7.2f} ms / 1k events")
+    print(f"speedup: {t_old / t_new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
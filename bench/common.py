@@ -0,0 +1,154 @@
+"""Helper bersama untuk benchmark suite (target in-process / uvicorn, statistik)."""
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+
+def pct(sorted_xs: List[float], p: float) -> float:
+    if not sorted_xs:
+        return float("nan")
+    return sorted_xs[min(len(sorted_xs) - 1, int(len(sorted_xs) * p))]
+
+
+def latency_summary(lat_s: List[float]) -> Dict[str, float]:
+    xs = sorted(lat_s)
+    return {
+        "p50": round(pct(xs, 0.50) * 1000, 3),
+        "p95": round(pct(xs, 0.95) * 1000, 3),
+        "p99": round(pct(xs, 0.99) * 1000, 3),
+        "max": round(xs[-1] * 1000, 3) if xs else float("nan"),
+    }
+
+
+class EventFactory:
+    """Generator event deterministik (seed) dengan dup rate terkontrol."""
+
+    def __init__(self, topic: str, dup_rate: float, seed: int = 42) -> None:
+        self.topic = topic
+        self.dup_rate = dup_rate
+        self.rnd = random.Random(seed)
+        self.n = 0
+
+    def event(self) -> dict:
+        if self.n and self.rnd.random() < self.dup_rate:
+            event_id = f"e-{self.rnd.randrange(self.n)}"
+        else:
+            event_id = f"e-{self.n}"
+            self.n += 1
+        return {
+            "topic": self.topic,
+            "event_id": event_id,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "source": "bench",
+            "payload": {"n": self.n},
+        }
+
+    def batch(self, size: int) -> List[dict]:
+        return [self.event() for _ in range(size)]
+
+
+class TopicRotation:
+    """Batch bergiliran dari beberapa EventFactory (satu topic per batch)."""
+
+    def __init__(self, factories: List[EventFactory]) -> None:
+        self.factories = factories
+        self.n = 0
+
+    def batch(self, size: int) -> List[dict]:
+        f = self.factories[self.n % len(self.factories)]
+        self.n += 1
+        return f.batch(size)
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            out[name] = float(value)
+    return out
+
+
+class Target:
+    def __init__(self, client: httpx.AsyncClient, mode: str) -> None:
+        self.client = client
+        self.mode = mode
+
+    async def metrics(self) -> Dict[str, float]:
+        return parse_metrics((await self.client.get("/metrics")).text)
+
+    async def db_queries(self) -> float:
+        return (await self.metrics()).get("aggregator_db_queries_total", 0.0)
+
+
+def _settings_env(settings: dict) -> Dict[str, str]:
+    return {k.upper(): str(v) for k, v in settings.items()}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@asynccontextmanager
+async def inprocess_target(settings: dict):
+    from asgi_lifespan import LifespanManager
+
+    from aggregator.app.main import create_app
+    from aggregator.app.settings import Settings
+
+    app = create_app(Settings(**settings))
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as c:
+            yield Target(c, "inprocess")
+
+
+@asynccontextmanager
+async def uvicorn_target(settings: dict, startup_timeout: float = 30.0):
+    # Server di proses terpisah (factory create_app membaca Settings dari env)
+    port = _free_port()
+    env = {**os.environ, **_settings_env(settings)}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--factory", "aggregator.app.main:create_app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=512, max_keepalive_connections=512)
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as c:
+            deadline = time.monotonic() + startup_timeout
+            while True:
+                try:
+                    if (await c.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn gagal start")
+                await asyncio.sleep(0.1)
+            yield Target(c, "uvicorn")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def target(mode: str, settings: dict, dsn: Optional[str] = None):
+    # db_queries per request dilaporkan suite -> counter query harus aktif
+    settings = {"db_query_count": True, **settings}
+    settings = {"database_url": dsn, **settings} if dsn else settings
+    return uvicorn_target(settings) if mode == "uvicorn" else inprocess_target(settings)
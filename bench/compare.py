@@ -0,0 +1,57 @@
+"""Bandingkan dua hasil bench/suite.py dan tandai regresi.
+
+    python -m bench.compare baseline.json current.json --threshold 0.10
+
+Exit code 1 bila ada titik yang throughput-nya turun atau p99-nya naik lebih
+dari threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def _key(r: dict) -> str:
+    return r["scenario"] + " " + json.dumps(r["params"], sort_keys=True)
+
+
+def _throughput(r: dict):
+    return r.get("events_per_s") or r.get("requests_per_s")
+
+
+def compare(base: dict, cur: dict, threshold: float):
+    base_by = {_key(r): r for r in base["results"]}
+    rows, regressions = [], 0
+    for r in cur["results"]:
+        b = base_by.get(_key(r))
+        if b is None:
+            continue
+        tb, tc = _throughput(b), _throughput(r)
+        pb, pc = b.get("latency_ms", {}).get("p99"), r.get("latency_ms", {}).get("p99")
+        d_tp = (tc - tb) / tb if tb else 0.0
+        d_p99 = (pc - pb) / pb if pb else 0.0
+        bad = d_tp < -threshold or d_p99 > threshold
+        regressions += bad
+        rows.append((_key(r), tb, tc, d_tp, pb, pc, d_p99, bad))
+    return rows, regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("baseline")
+    ap.add_argument("current")
+    ap.add_argument("--threshold", type=float, default=0.10)
+    a = ap.parse_args()
+    with open(a.baseline) as fb, open(a.current) as fc:
+        base, cur = json.load(fb), json.load(fc)
+    if base["meta"].get("mode") != cur["meta"].get("mode"):
+        print(f"peringatan: mode berbeda ({base['meta'].get('mode')} vs {cur['meta'].get('mode')})")
+    rows, regressions = compare(base, cur, a.threshold)
+    for key, tb, tc, d_tp, pb, pc, d_p99, bad in rows:
+        flag = "REGRESSION" if bad else ""
+        print(f"{key:<80} tput {tb:>10} -> {tc:>10} ({d_tp:+.1%})  p99 {pb} -> {pc} ({d_p99:+.1%}) {flag}")
+    print(f"{regressions} regresi (threshold {a.threshold:.0%})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,486 @@
+"""Publisher simulator / load generator untuk aggregator.
+
+Dua mode (env MODE):
+- closed: CONCURRENCY klien, masing-masing kirim batch berikutnya setelah
+  respons sebelumnya datang (throughput = apa yang sanggup dilayani server).
+- open: batch dijadwalkan pada laju tetap RATE (event/s), tidak menunggu
+  respons. Latency diukur dari waktu kirim *terjadwal*, jadi antrian di sisi
+  klien ketika server jenuh ikut terhitung (koreksi coordinated omission).
+  RATE boleh berupa daftar ("500,1000,2000") untuk menyapu laju dan mencari
+  titik jenuh.
+
+Event dibangkitkan secara streaming (tidak ada daftar batch/task dibangun di
+muka). Duplikat memilih ulang key yang sudah terkirim dengan distribusi Zipf
+(KEY_ZIPF_S, 0 = seragam); topic juga bisa miring (TOPIC_ZIPF_S). Di akhir
+run, selisih /stats dibandingkan dengan jumlah yang dilaporkan /publish.
+
+Format body (BODY_FORMAT=json|ndjson|msgpack) dan kompresi
+(CONTENT_ENCODING=identity|gzip|zstd) bisa diganti untuk membandingkan byte
+di kabel dan throughput; msgpack/zstd butuh paket `msgpack`/`zstandard`.
+
+Retry (RETRIES kali) hanya untuk error transport, 5xx, 408, dan 429, dengan
+backoff eksponensial ber-jitter yang menghormati Retry-After dari aggregator.
+"""
 import asyncio
+import gzip
+import json
+import math
 import os
 import random
+import time
 from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+
 import httpx
 
 TARGET_URL = os.getenv("TARGET_URL", "http://localhost:8080/publish")
+STATS_URL = os.getenv("STATS_URL", TARGET_URL.rsplit("/", 1)[0] + "/stats")
 COUNT = int(os.getenv("COUNT", "20000"))
 DUP_RATE = float(os.getenv("DUP_RATE", "0.30"))
 CONCURRENCY = int(os.getenv("CONCURRENCY", "50"))
 TOPICS = os.getenv("TOPICS", "auth,payment,orders").split(",")
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "100"))
+MODE = os.getenv("MODE", "closed")
+RATE = os.getenv("RATE", "1000")
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "1000"))
+KEY_ZIPF_S = float(os.getenv("KEY_ZIPF_S", "0"))
+TOPIC_ZIPF_S = float(os.getenv("TOPIC_ZIPF_S", "0"))
+RETRIES = int(os.getenv("RETRIES", "3"))
+# Backoff eksponensial dengan full jitter: tunggu acak 0..min(RETRY_MAX_S, RETRY_BASE_S * 2^n);
+# Retry-After dari server (429/503) jadi batas bawahnya
+RETRY_BASE_S = float(os.getenv("RETRY_BASE_S", "0.1"))
+RETRY_MAX_S = float(os.getenv("RETRY_MAX_S", "10"))
+VERIFY = os.getenv("VERIFY", "1") == "1"
+VERIFY_TIMEOUT_S = float(os.getenv("VERIFY_TIMEOUT_S", "30"))
+SEED = os.getenv("SEED")
+OUT = os.getenv("OUT")
+BODY_FORMAT = os.getenv("BODY_FORMAT", "json")
+CONTENT_ENCODING = os.getenv("CONTENT_ENCODING", "identity")
 
 
-def make_event(event_id: str) -> dict:
-    return {
-        "topic": random.choice(TOPICS),
-        "event_id": event_id,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "source": "publisher",
-        "payload": {"rand": random.randint(0, 10_000_000)},
-    }
+class Histogram:
+    """Histogram latency gaya HDR: bucket log-linear dengan presisi relatif tetap.
+
+    Tiap power-of-two dibagi `sub_buckets` bucket linear, jadi error relatif
+    nilai yang dilaporkan <= 1/sub_buckets di seluruh rentang (1us .. jam)
+    dengan memori konstan, tanpa menyimpan semua sampel.
+    """
+
+    def __init__(self, sub_buckets: int = 128, unit: float = 1e-6):
+        self.sub = sub_buckets
+        self.unit = unit
+        self.counts: dict = {}
+        self.total = 0
+        self.max = 0.0
+        self.sum = 0.0
+
+    def _index(self, v: float) -> int:
+        n = max(1, int(v / self.unit))
+        exp = max(0, n.bit_length() - 1 - int(math.log2(self.sub)))
+        return (exp << 32) | (n >> exp)
+
+    def _value(self, idx: int) -> float:
+        exp, m = idx >> 32, idx & 0xFFFFFFFF
+        # Batas atas bucket (konservatif, seperti HDR "highest equivalent value")
+        return (((m + 1) << exp) - 1) * self.unit
+
+    def record(self, v: float) -> None:
+        i = self._index(v)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.total += 1
+        self.sum += v
+        if v > self.max:
+            self.max = v
+
+    def merge(self, other: "Histogram") -> None:
+        for i, c in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + c
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> float:
+        if not self.total:
+            return 0.0
+        target = max(1, math.ceil(self.total * p / 100.0))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= target:
+                return min(self._value(i), self.max)
+        return self.max
+
+    def summary_ms(self) -> dict:
+        out = {f"p{p:g}": round(self.percentile(p) * 1000, 3) for p in (50, 90, 99, 99.9, 99.99)}
+        out["max"] = round(self.max * 1000, 3)
+        out["mean"] = round(self.sum / self.total * 1000, 3) if self.total else 0.0
+        out["count"] = self.total
+        return out
+
+
+def zipf_rank(n: int, s: float, rng: random.Random) -> int:
+    """Rank 0..n-1 dengan P(k) ~ 1/(k+1)^s (inverse CDF kontinu; s=0 seragam)."""
+    if n <= 1:
+        return 0
+    u = rng.random()
+    if s == 0:
+        return int(u * n)
+    if abs(s - 1.0) < 1e-9:
+        r = n ** u
+    else:
+        r = ((n ** (1 - s) - 1) * u + 1) ** (1 / (1 - s))
+    return min(n - 1, int(r) - 1)
+
+
+class EventSource:
+    """Pembangkit event streaming dengan duplikat dan skew Zipf."""
+
+    def __init__(self, topics: List[str], dup_rate: float, key_zipf_s: float = 0.0,
+                 topic_zipf_s: float = 0.0, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.topics = topics
+        self.topic_weights = [1.0 / (k + 1) ** topic_zipf_s for k in range(len(topics))]
+        self.dup_rate = dup_rate
+        self.key_zipf_s = key_zipf_s
+        self.sent: List[Tuple[str, str]] = []
+        self.seq = 0
+
+    def event(self) -> dict:
+        if self.sent and self.rng.random() < self.dup_rate:
+            # Key terkirim paling awal = paling "panas"
+            topic, event_id = self.sent[zipf_rank(len(self.sent), self.key_zipf_s, self.rng)]
+        else:
+            topic = self.rng.choices(self.topics, self.topic_weights)[0]
+            event_id = f"u-{self.seq}-{self.rng.getrandbits(32):08x}"
+            self.seq += 1
+            self.sent.append((topic, event_id))
+        return {
+            "topic": topic,
+            "event_id": event_id,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "source": "publisher",
+            "payload": {"rand": self.rng.randint(0, 10_000_000)},
+        }
+
+    def batches(self, count: int, batch_size: int) -> Iterator[List[dict]]:
+        left = count
+        while left > 0:
+            n = min(batch_size, left)
+            left -= n
+            yield [self.event() for _ in range(n)]
+
+
+class BodyEncoder:
+    """Batch -> (body, headers) sesuai BODY_FORMAT + CONTENT_ENCODING."""
+
+    CONTENT_TYPES = {"json": "application/json", "ndjson": "application/x-ndjson",
+                     "msgpack": "application/msgpack"}
+
+    def __init__(self, fmt: str = "json", encoding: str = "identity"):
+        if fmt not in self.CONTENT_TYPES:
+            raise ValueError(f"BODY_FORMAT tidak dikenal: {fmt}")
+        if encoding not in ("identity", "gzip", "zstd"):
+            raise ValueError(f"CONTENT_ENCODING tidak dikenal: {encoding}")
+        self.fmt, self.encoding = fmt, encoding
+        self.headers = {"Content-Type": self.CONTENT_TYPES[fmt]}
+        if encoding != "identity":
+            self.headers["Content-Encoding"] = encoding
+        if fmt == "msgpack":
+            import msgpack
+            self._packb = msgpack.packb
+        if encoding == "zstd":
+            import zstandard
+            self._zstd = zstandard.ZstdCompressor(level=3)
+
+    def encode(self, batch: List[dict]) -> Tuple[bytes, bytes]:
+        """Return (body sebelum kompresi, body di kabel)."""
+        if self.fmt == "ndjson":
+            raw = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in batch).encode()
+        elif self.fmt == "msgpack":
+            raw = self._packb(batch)
+        else:
+            raw = json.dumps(batch, separators=(",", ":")).encode()
+        if self.encoding == "gzip":
+            return raw, gzip.compress(raw, compresslevel=6)
+        if self.encoding == "zstd":
+            return raw, self._zstd.compress(raw)
+        return raw, raw
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Header Retry-After dalam detik (bentuk HTTP-date tidak dipakai aggregator -> None)."""
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None, rng: random.Random = random,
+                base: float = RETRY_BASE_S, cap: float = RETRY_MAX_S) -> float:
+    """Jeda sebelum retry ke-`attempt` (0-based).
 
+    Full jitter menyebar retry klien yang gagal bersamaan, jadi server yang baru
+    pulih tidak langsung dihantam gelombang retry serentak. Retry-After dihormati
+    (tidak dipotong cap) plus jitter sampai 50% supaya tidak kembali serempak.
+    """
+    delay = rng.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after * rng.uniform(1.0, 1.5))
+    return delay
 
-async def post_with_retry(client: httpx.AsyncClient, url: str, json_body, *, retries: int = 30):
-    last = None
-    for i in range(retries):
+
+def _retryable(status: int) -> bool:
+    # 4xx lain (400/413/415) permanen: mengirim ulang body yang sama pasti gagal lagi
+    return status >= 500 or status in (408, 429)
+
+
+class RunStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.batches = 0
+        self.events = 0
+        self.accepted = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.retries = 0
+        self.backoff_s = 0.0
+        self.failed_batches = 0
+        self.failed_events = 0
+        self.body_bytes = 0
+        self.wire_bytes = 0
+        self.errors: dict = {}
+        self.keys: set = set()
+        self.receipts: List[str] = []  # ack asinkron (202): inserted/duplicates diambil dari receipt
+
+    def as_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "events": self.events,
+            "accepted": self.accepted,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "retries": self.retries,
+            "backoff_s": round(self.backoff_s, 3),
+            "failed_batches": self.failed_batches,
+            "failed_events": self.failed_events,
+            "body_bytes": self.body_bytes,
+            "wire_bytes": self.wire_bytes,
+            "async_receipts": len(self.receipts),
+            "errors": self.errors,
+            "latency_ms": self.latency.summary_ms(),
+        }
+
+
+async def send_batch(client: httpx.AsyncClient, url: str, batch: List[dict], stats: RunStats,
+                     *, retries: int, started: Optional[float] = None,
+                     encoder: Optional[BodyEncoder] = None) -> None:
+    """Kirim satu batch; latency dicatat dari `started` (waktu terjadwal) bila ada.
+
+    Kegagalan tidak disembunyikan: tiap retry dan error akhir dihitung per jenis.
+    """
+    t0 = started if started is not None else time.perf_counter()
+    stats.batches += 1
+    stats.events += len(batch)
+    encoder = encoder or BodyEncoder()
+    raw, body = encoder.encode(batch)
+    stats.body_bytes += len(raw)
+    stats.wire_bytes += len(body)
+    for attempt in range(retries + 1):
+        retry_after = None
         try:
-            r = await client.post(url, json=json_body)
+            r = await client.post(url, content=body, headers=encoder.headers)
             r.raise_for_status()
-            return r.json()
+            out = r.json()
+            break
         except Exception as e:
-            last = e
-            await asyncio.sleep(min(2.0, 0.1 * (i + 1)))
-    raise RuntimeError(f"publish gagal setelah retry: {last!r}")
+            status = r.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            kind = f"{status}" if status is not None else type(e).__name__
+            stats.errors[kind] = stats.errors.get(kind, 0) + 1
+            if status is not None:
+                retry_after = parse_retry_after(r.headers.get("retry-after"))
+            if attempt == retries or (status is not None and not _retryable(status)):
+                stats.failed_batches += 1
+                stats.failed_events += len(batch)
+                stats.latency.record(time.perf_counter() - t0)
+                return
+            stats.retries += 1
+            delay = retry_delay(attempt, retry_after)
+            stats.backoff_s += delay
+            await asyncio.sleep(delay)
+    stats.latency.record(time.perf_counter() - t0)
+    stats.accepted += out.get("accepted", 0)
+    stats.inserted += out.get("inserted", 0)
+    stats.duplicates += out.get("duplicates", 0)
+    if r.status_code == 202:
+        stats.receipts.append(out["receipt"])
+    stats.keys.update((e["topic"], e["event_id"]) for e in batch)
+
+
+async def run_closed(client, url, source: EventSource, count: int, batch_size: int,
+                     concurrency: int, retries: int, encoder: Optional[BodyEncoder] = None) -> RunStats:
+    stats = RunStats()
+    batches = source.batches(count, batch_size)
+
+    async def worker():
+        # Generator dibagi antar worker: batch dibangkitkan tepat sebelum dikirim
+        for batch in batches:
+            await send_batch(client, url, batch, stats, retries=retries, encoder=encoder)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return stats
+
+
+async def run_open(client, url, source: EventSource, count: int, batch_size: int,
+                   rate: float, retries: int, max_inflight: int,
+                   encoder: Optional[BodyEncoder] = None) -> RunStats:
+    stats = RunStats()
+    interval = batch_size / rate
+    inflight: set = set()
+    start = time.perf_counter()
+    for i, batch in enumerate(source.batches(count, batch_size)):
+        due = start + i * interval
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        while len(inflight) >= max_inflight:
+            # Batas keamanan klien; keterlambatan tetap terukur karena start = due
+            await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.create_task(send_batch(client, url, batch, stats, retries=retries, started=due,
+                                                encoder=encoder))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+    if inflight:
+        await asyncio.gather(*inflight)
+    return stats
+
+
+async def fetch_stats(client, stats_url: str) -> dict:
+    r = await client.get(stats_url)
+    r.raise_for_status()
+    return r.json()
+
+
+async def resolve_receipts(client, url: str, stats: RunStats, deadline: float) -> int:
+    """Tunggu receipt 202 sampai committed; tambahkan inserted/duplicates-nya. Return sisa pending."""
+    sem = asyncio.Semaphore(32)
+    unresolved = 0
+
+    async def one(receipt: str):
+        nonlocal unresolved
+        async with sem:
+            while True:
+                r = await client.get(f"{url}/receipts/{receipt}")
+                if r.status_code == 200 and r.json()["status"] == "committed":
+                    stats.inserted += r.json()["inserted"]
+                    stats.duplicates += r.json()["duplicates"]
+                    return
+                if time.monotonic() >= deadline:
+                    unresolved += 1
+                    return
+                await asyncio.sleep(0.2)
+
+    await asyncio.gather(*[one(rc) for rc in stats.receipts])
+    return unresolved
+
+
+async def verify(client, url: str, stats_url: str, before: dict, stats: RunStats, timeout_s: float) -> dict:
+    """Bandingkan selisih /stats dengan hasil /publish.
+
+    unique_processed bisa tertinggal (dihitung worker setelah event selesai),
+    jadi ditunggu sampai `timeout_s`. Asumsi: tidak ada publisher lain selama run.
+    """
+    deadline = time.monotonic() + timeout_s
+    unresolved = await resolve_receipts(client, url, stats, deadline) if stats.receipts else 0
+    expected = {
+        "received": stats.accepted,
+        "duplicate_dropped": stats.duplicates,
+        "unique_processed": stats.inserted,
+    }
+    while True:
+        after = await fetch_stats(client, stats_url)
+        delta = {k: after.get(k, 0) - before.get(k, 0) for k in expected}
+        if delta == expected or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(0.2)
+    return {
+        "ok": delta == expected and stats.inserted == len(stats.keys) and not unresolved,
+        "unresolved_receipts": unresolved,
+        "expected": expected,
+        "delta": delta,
+        "distinct_keys_sent": len(stats.keys),
+    }
+
+
+def _rates(spec: str) -> List[float]:
+    return [float(x) for x in spec.split(",") if x.strip()]
+
+
+async def run(client: httpx.AsyncClient, *, url: str = TARGET_URL, stats_url: str = STATS_URL,
+              mode: str = MODE, count: int = COUNT, batch_size: int = BATCH_SIZE,
+              concurrency: int = CONCURRENCY, rate: str = RATE, dup_rate: float = DUP_RATE,
+              topics: List[str] = TOPICS, key_zipf_s: float = KEY_ZIPF_S,
+              topic_zipf_s: float = TOPIC_ZIPF_S, retries: int = RETRIES,
+              max_inflight: int = MAX_INFLIGHT, verify_stats: bool = VERIFY,
+              verify_timeout_s: float = VERIFY_TIMEOUT_S, seed: Optional[int] = None,
+              body_format: str = BODY_FORMAT, content_encoding: str = CONTENT_ENCODING) -> List[dict]:
+    encoder = BodyEncoder(body_format, content_encoding)
+    steps = _rates(rate) if mode == "open" else [None]
+    results = []
+    for i, step_rate in enumerate(steps):
+        source = EventSource(topics, dup_rate, key_zipf_s, topic_zipf_s, None if seed is None else seed + i)
+        before = await fetch_stats(client, stats_url) if verify_stats else None
+        t0 = time.perf_counter()
+        if mode == "open":
+            stats = await run_open(client, url, source, count, batch_size, step_rate, retries, max_inflight,
+                                   encoder)
+        else:
+            stats = await run_closed(client, url, source, count, batch_size, concurrency, retries, encoder)
+        elapsed = time.perf_counter() - t0
+        res = {
+            "mode": mode,
+            "target_rate": step_rate,
+            "concurrency": concurrency if mode == "closed" else None,
+            "batch_size": batch_size,
+            "body_format": body_format,
+            "content_encoding": content_encoding,
+            "elapsed_s": round(elapsed, 3),
+            "achieved_rate": round(stats.events / elapsed, 1) if elapsed else 0.0,
+            **stats.as_dict(),
+        }
+        if verify_stats:
+            res["verify"] = await verify(client, url, stats_url, before, stats, verify_timeout_s)
+            # Respons 202 tidak membawa inserted/duplicates; terisi dari receipt saat verify
+            res.update(inserted=stats.inserted, duplicates=stats.duplicates)
+        results.append(res)
+    return results
+
+
+def _print(res: dict) -> None:
+    lat = res["latency_ms"]
+    head = f"rate={res['target_rate']:g}ev/s" if res["mode"] == "open" else f"concurrency={res['concurrency']}"
+    print(f"[{res['mode']}] {head} achieved={res['achieved_rate']}ev/s "
+          f"p50={lat['p50']}ms p99={lat['p99']}ms p99.9={lat['p99.9']}ms max={lat['max']}ms "
+          f"accepted={res['accepted']} inserted={res['inserted']} duplicates={res['duplicates']} "
+          f"retries={res['retries']} backoff={res['backoff_s']}s failed={res['failed_events']} errors={res['errors']}")
+    print(f"  body={res['body_format']}/{res['content_encoding']} "
+          f"wire={res['wire_bytes']}B raw={res['body_bytes']}B "
+          f"({res['wire_bytes'] / max(1, res['body_bytes']):.2f}x)")
+    if "verify" in res:
+        v = res["verify"]
+        print(f"  verify /stats: {'OK' if v['ok'] else 'MISMATCH'} expected={v['expected']} "
+              f"delta={v['delta']} distinct_keys={v['distinct_keys_sent']}")
 
 
 async def main():
-    base_unique = max(1, int(COUNT * (1.0 - DUP_RATE)))
-    base_ids = [f"e-{i}" for i in range(base_unique)]
-
-    def pick_event_id(i: int) -> str:
-        if random.random() < DUP_RATE:
-            return random.choice(base_ids)
-        return f"u-{i}-{random.getrandbits(32):08x}"
-
-    sem = asyncio.Semaphore(CONCURRENCY)
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        async def send_batch(batch_events: list[dict]):
-            async with sem:
-                return await post_with_retry(client, TARGET_URL, batch_events)
-
-        tasks = []
-        batch = []
-        for i in range(COUNT):
-            batch.append(make_event(pick_event_id(i)))
-            if len(batch) >= BATCH_SIZE:
-                tasks.append(asyncio.create_task(send_batch(batch)))
-                batch = []
-        if batch:
-            tasks.append(asyncio.create_task(send_batch(batch)))
-
-        inserted = 0
-        received = 0
-        dup = 0
-        for t in asyncio.as_completed(tasks):
-            out = await t
-            # Ganti "received" menjadi "accepted" agar sesuai dengan return main.py
-            received += out.get("accepted", 0) 
-            inserted += out.get("inserted", 0)
-            dup += out.get("duplicates", 0)
-
-        print(f"done received={received} inserted={inserted} duplicates={dup} dup_rate={dup/received:.2%}")
+    async with httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_connections=None)) as client:
+        results = await run(client, seed=int(SEED) if SEED else None)
+    for res in results:
+        _print(res)
+    if OUT:
+        with open(OUT, "w") as fh:
+            json.dump(results, fh, indent=2)
+    if any(r["failed_events"] or not r.get("verify", {"ok": True})["ok"] for r in results):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
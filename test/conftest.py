@@ -1,4 +1,7 @@
 import asyncio
+from urllib.parse import urlsplit, urlunsplit
+
+import asyncpg
 import pytest
 import httpx
 from asgi_lifespan import LifespanManager
@@ -24,6 +27,21 @@ def pg():
         postgres.db_url = url
         yield postgres
 
+@pytest.fixture
+def make_dbs(pg):
+    """Buat database kosong di server yang sama (DROP dulu bila ada) -> {nama: dsn}."""
+    async def make(*names):
+        url = urlsplit(pg.db_url)
+        conn = await asyncpg.connect(pg.db_url)
+        try:
+            for name in names:
+                await conn.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+                await conn.execute(f"CREATE DATABASE {name}")
+        finally:
+            await conn.close()
+        return {name: urlunsplit(url._replace(path=f"/{name}")) for name in names}
+    return make
+
 @pytest.fixture
 async def client(pg):
     """Fixture untuk testing API standar."""
@@ -1,4 +1,6 @@
 import pytest
+import asyncio
+import json
 
 @pytest.mark.asyncio
 async def test_publish_single_event(client):
@@ -42,4 +44,47 @@ async def test_publish_invalid_schema(client):
         "payload": {}
     }
     response = await client.post("/publish", json=payload)
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_stats_exact_under_concurrent_publish(client):
+    """Counter di-shard: total /stats tetap eksak walau banyak publish paralel."""
+    before = (await client.get("/stats")).json()
+
+    async def send(i):
+        return await client.post("/publish", json={
+            "topic": "shard-test",
+            "event_id": f"S-{i % 40}",
+            "timestamp": "2023-10-27T10:00:00Z",
+            "source": "pytest",
+            "payload": {"i": i},
+        })
+
+    rs = await asyncio.gather(*[send(i) for i in range(60)])
+    assert all(r.status_code == 200 for r in rs)
+    after = (await client.get("/stats")).json()
+    assert after["received"] - before["received"] == 60
+    assert after["unique_processed"] - before["unique_processed"] == 40
+    assert after["duplicate_dropped"] - before["duplicate_dropped"] == 20
+
+
+@pytest.mark.asyncio
+async def test_publish_validation_error_detail_per_item(client):
+    """Error validasi batch tetap format lama: error item pertama yang gagal, loc tanpa index."""
+    ok = {"topic": "v", "event_id": "V-1", "timestamp": "2023-10-27T10:00:00Z", "source": "s", "payload": {}}
+    bad = {"topic": "v", "event_id": "V-2", "timestamp": "2023-10-27T10:00:00Z", "payload": {}}
+    r = await client.post("/publish", json=[ok, bad])
+    assert r.status_code == 400
+    assert [e["loc"] for e in r.json()["detail"]] == [["source"]]
+
+
+@pytest.mark.asyncio
+async def test_publish_payload_roundtrip(client):
+    payload = {"s": "héllo", "n": [1, 2.5, None], "nested": {"ok": True}}
+    r = await client.post("/publish", json={
+        "topic": "roundtrip", "event_id": "R-1", "timestamp": "2023-10-27T10:00:00Z",
+        "source": "pytest", "payload": payload,
+    })
+    assert r.json()["inserted"] == 1
+    items = (await client.get("/events?topic=roundtrip")).json()
+    assert json.loads(items[0]["payload"]) == payload
@@ -0,0 +1,52 @@
+import pytest
+import asyncio
+import httpx
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.ingest import attribute_inserted
+from aggregator.app.main import create_app
+from aggregator.app.settings import Settings
+
+
+def ev(event_id, topic="coalesce"):
+    return {
+        "topic": topic,
+        "event_id": event_id,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "source": "test",
+        "payload": {"e": event_id},
+    }
+
+
+def test_attribute_inserted_first_occurrence_wins():
+    def e(i):
+        return SimpleNamespace(topic="t", event_id=i)
+
+    groups = [[e("a"), e("b")], [e("a"), e("c")], [e("c")]]
+    assert attribute_inserted(groups, [("t", "a"), ("t", "c")]) == [1, 1, 0]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_single_event_requests_get_own_results(pg):
+    settings = Settings(database_url=pg.db_url, workers=0, coalesce_enabled=True, coalesce_window_ms=20)
+    app = create_app(settings)
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            before = (await c.get("/stats")).json()
+            ids = [f"C{i % 20}" for i in range(40)]
+            rs = await asyncio.gather(*[c.post("/publish", json=ev(i)) for i in ids])
+            out = [r.json() for r in rs]
+            after = (await c.get("/stats")).json()
+
+    assert all(o["accepted"] == 1 and o["inserted"] + o["duplicates"] == 1 for o in out)
+    # Tiap key unik tepat satu request yang mendapat inserted=1
+    winners = {}
+    for i, o in zip(ids, out):
+        winners[i] = winners.get(i, 0) + o["inserted"]
+    assert set(winners.values()) == {1}
+    assert after["received"] - before["received"] == 40
+    assert after["duplicate_dropped"] - before["duplicate_dropped"] == 20
+    assert app.state.coalescer.flushes < 40
@@ -55,4 +55,16 @@ async def test_batch_mixed_duplicates(client):
     # Perbaikan: 'received' diubah menjadi 'accepted' sesuai return di main.py
     assert j["accepted"] == 5 
     assert j["inserted"] == 3
-    assert j["duplicates"] == 2
\ No newline at end of file
+    assert j["duplicates"] == 2
+
+@pytest.mark.asyncio
+async def test_bulk_batch_counts_with_existing_and_inbatch_duplicates(client):
+    # Batch besar: sebagian sudah ada di DB, sebagian duplikat di dalam batch itu sendiri
+    await client.post("/publish", json=[ev(topic="bulk", event_id=f"K{i}") for i in range(100)])
+    payload = [ev(topic="bulk", event_id=f"K{i}") for i in range(50, 250)]
+    payload += [ev(topic="bulk", event_id=f"K{i}") for i in range(200, 300)]
+    r = await client.post("/publish", json=payload)
+    j = r.json()
+    assert j["accepted"] == 300
+    assert j["inserted"] == 200
+    assert j["duplicates"] == 100
@@ -0,0 +1,115 @@
+import pytest
+import random
+import time
+import httpx
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from asgi_lifespan import LifespanManager
+
+from aggregator.app import dedup
+from aggregator.app.dedup import DedupCache, LRUKeys, ScalableBloom
+from aggregator.app.main import create_app
+from aggregator.app.partitions import purge_dedup_keys
+from aggregator.app.settings import Settings
+
+
+def ev(topic, event_id):
+    return {
+        "topic": topic,
+        "event_id": event_id,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "source": "test",
+        "payload": {"e": event_id},
+    }
+
+
+def test_lru_bounded_and_evicts_oldest():
+    lru = LRUKeys(2)
+    lru.add(("t", "a"))
+    lru.add(("t", "b"))
+    assert ("t", "a") in lru  # touch -> a paling baru
+    lru.add(("t", "c"))
+    assert len(lru) == 2
+    assert ("t", "b") not in lru
+    assert ("t", "a") in lru and ("t", "c") in lru
+
+
+def test_scalable_bloom_no_false_negative_and_memory_bound():
+    bloom = ScalableBloom(capacity=100, error_rate=0.01, max_bytes=4096)
+    keys = [("t", f"k{i}") for i in range(300)]
+    for k in keys:
+        bloom.add(k)
+    assert len(bloom.filters) > 1
+    assert bloom.nbytes <= 4096 or len(bloom.filters) == 1
+    # Filter yang masih ada tidak boleh false negative
+    assert all(k in bloom for k in keys[-100:])
+
+
+async def run_batches(pg, batches, **cache_settings):
+    settings = Settings(database_url=pg.db_url, workers=0, **cache_settings)
+    app = create_app(settings)
+    out = []
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            for b in batches:
+                out.append((await c.post("/publish", json=b)).json())
+            stats = (await c.get("/stats")).json()
+    return out, stats
+
+
+@pytest.mark.asyncio
+async def test_dedup_cache_counts_identical_to_db_only(pg):
+    rnd = random.Random(7)
+    ids = [[f"C{rnd.randrange(60)}" for _ in range(20)] for _ in range(10)]
+
+    db_only, _ = await run_batches(pg, [[ev("cache-off", i) for i in b] for b in ids])
+    cached, stats = await run_batches(
+        pg, [[ev("cache-on", i) for i in b] for b in ids],
+        dedup_cache_enabled=True, dedup_cache_max_keys=1000, dedup_bloom_enabled=True,
+    )
+    assert cached == db_only
+    assert stats["dedup_cache"]["hits"] > 0
+    assert stats["dedup_cache"]["hits"] + stats["dedup_cache"]["misses"] == 200
+
+
+def test_lru_expired_key_is_miss():
+    lru = LRUKeys(4)
+    lru.add(("t", "old"), expires=time.time() - 1)
+    lru.add(("t", "new"), expires=time.time() + 60)
+    assert ("t", "old") not in lru
+    assert ("t", "new") in lru
+    assert len(lru) == 1
+
+
+def test_dedup_cache_with_ttl_trusts_only_own_recent_claims():
+    cache = DedupCache(100, ttl_sec=3600)
+    cache.remember([("t", "dup")])  # duplikat di DB: first_seen tidak diketahui
+    cache.remember_claimed([("t", "mine")], since=time.time())
+    cache.remember_claimed([("t", "stale")], since=time.time() - 1800)
+    events = [SimpleNamespace(topic="t", event_id=i) for i in ("dup", "mine", "stale")]
+    fresh, known = cache.split(events)
+    assert [e.event_id for e in known] == ["mine"]
+    assert [e.event_id for e in fresh] == ["dup", "stale"]
+
+
+@pytest.mark.asyncio
+async def test_dedup_cache_resent_after_purge_is_inserted(pg, monkeypatch):
+    settings = Settings(database_url=pg.db_url, workers=0, dedup_ttl_days=1,
+                        dedup_cache_enabled=True, dedup_bloom_enabled=True)
+    app = create_app(settings)
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            first = (await c.post("/publish", json=ev("purged", "P1"))).json()
+            again = (await c.post("/publish", json=ev("purged", "P1"))).json()
+            assert (first["inserted"], again["duplicates"]) == (1, 1)
+            assert app.state.dedup_cache.hits == 1
+
+            # Dua hari kemudian maintenance (di proses mana pun) sudah purge key-nya
+            later = datetime.now(timezone.utc) + timedelta(days=2)
+            async with app.state.db_pool.acquire() as conn:
+                assert await purge_dedup_keys(conn, timedelta(days=1), now=later) >= 1
+            monkeypatch.setattr(dedup, "time", SimpleNamespace(time=later.timestamp))
+            resent = (await c.post("/publish", json=ev("purged", "P1"))).json()
+    assert resent["inserted"] == 1 and resent["duplicates"] == 0
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+import json
+
+
+def ev(event_id, ts, topic="page"):
+    return {
+        "topic": topic,
+        "event_id": event_id,
+        "timestamp": ts,
+        "source": "test",
+        "payload": {"id": event_id},
+    }
+
+
+async def seed(client, topic):
+    # 25 event, timestamp sengaja banyak yang sama (tie) untuk uji keyset
+    payload = [ev(f"P{i:02d}", f"2024-01-01T00:00:{i // 3:02d}Z", topic=topic) for i in range(25)]
+    r = await client.post("/publish", json=payload)
+    assert r.json()["inserted"] == 25
+
+
+@pytest.mark.asyncio
+async def test_events_keyset_pagination_covers_all_rows_once(client):
+    await seed(client, "page")
+    seen, cursor = [], None
+    while True:
+        params = {"topic": "page", "limit": 10}
+        if cursor:
+            params["cursor"] = cursor
+        r = await client.get("/events", params=params)
+        assert r.status_code == 200
+        seen += r.json()
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    ids = [e["event_id"] for e in seen]
+    assert sorted(ids) == [f"P{i:02d}" for i in range(25)]
+    keys = [(e["ts_ingest"], e["event_id"]) for e in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_events_export_ndjson_stream(client):
+    await seed(client, "export")
+    r = await client.get("/events/export", params={"topic": "export"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert len(lines) == 25
+    assert {line["topic"] for line in lines} == {"export"}
+
+
+@pytest.mark.asyncio
+async def test_events_invalid_cursor(client):
+    r = await client.get("/events", params={"cursor": "bukan-cursor"})
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_after_seq_gapless_under_concurrent_publish(client):
+    async def publish(i):
+        # Duplikat lintas request tidak memakan seq
+        batch = [ev(f"S{i}-{j}", "2024-01-01T00:00:00Z", topic="seq") for j in range(5)]
+        await client.post("/publish", json=batch + [ev("S0-0", "2024-01-01T00:00:00Z", topic="seq")])
+
+    await asyncio.gather(*[publish(i) for i in range(10)])
+    await client.post("/publish", json=[ev("other", "2024-01-01T00:00:00Z", topic="seq-other")])
+
+    seen, after = [], 0
+    while True:
+        r = await client.get("/events", params={"topic": "seq", "after_seq": after, "limit": 7})
+        assert "X-Next-Cursor" not in r.headers
+        if not r.json():
+            assert r.headers["X-Last-Seq"] == str(after)
+            break
+        seen += r.json()
+        after = int(r.headers["X-Last-Seq"])
+    assert [e["seq"] for e in seen] == list(range(1, 51))
+    assert len({e["event_id"] for e in seen}) == 50
+    # Batch yang sama mendapat range berurutan (urutan dalam request)
+    s1 = [e["event_id"] for e in seen if e["event_id"].startswith("S1-")]
+    assert s1 == [f"S1-{j}" for j in range(5)]
+
+    r = await client.get("/events", params={"topic": "seq-other", "after_seq": 0})
+    assert [e["seq"] for e in r.json()] == [1]
+    assert (await client.get("/events", params={"after_seq": 0})).status_code == 400
@@ -0,0 +1,124 @@
+import gzip
+
+import httpx
+import orjson
+import pytest
+from asgi_lifespan import LifespanManager
+
+from aggregator.app import formats
+from aggregator.app.main import create_app
+from aggregator.app.settings import Settings
+from publisher.publisher import run
+
+
+def ev(topic, event_id):
+    return {"topic": topic, "event_id": event_id, "timestamp": "2025-01-01T00:00:00Z",
+            "source": "t", "payload": {"n": event_id}}
+
+
+def ndjson(events):
+    return b"".join(orjson.dumps(e) + b"\n" for e in events)
+
+
+async def test_gzip_json_and_ndjson_share_validation(client):
+    body = gzip.compress(orjson.dumps([ev("fmt-a", "1"), ev("fmt-a", "2")]))
+    r = await client.post("/publish", content=body,
+                          headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    assert r.json() == {"accepted": 2, "inserted": 2, "duplicates": 0}
+
+    r = await client.post("/publish", content=ndjson([ev("fmt-a", "2"), ev("fmt-a", "3")]) + b"\n",
+                          headers={"Content-Type": "application/x-ndjson"})
+    assert r.json() == {"accepted": 2, "inserted": 1, "duplicates": 1}
+
+    # Error validasi sama dengan JSON biasa (detail pydantic item yang gagal)
+    bad = {**ev("fmt-a", "4"), "topic": ""}
+    as_json = await client.post("/publish", json=[bad])
+    as_ndjson = await client.post("/publish", content=ndjson([bad]),
+                                  headers={"Content-Type": "application/x-ndjson"})
+    assert as_json.status_code == as_ndjson.status_code == 400
+    assert as_json.json() == as_ndjson.json()
+
+    r = await client.post("/publish", content=b'{"topic": "x"}\n{oops\n',
+                          headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 400 and "baris 2" in r.json()["detail"]
+
+
+async def test_unsupported_encoding_and_body_limit(pg):
+    app = create_app(Settings(database_url=pg.db_url, workers=0, publish_max_body_bytes=4096))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            r = await c.post("/publish", content=b"x", headers={"Content-Encoding": "br"})
+            assert r.status_code == 415 and "gzip" in r.headers["Accept-Encoding"]
+            # Bom kecil: 1 MB nol -> ~1 KB gzip, ditolak tanpa didekompresi penuh
+            r = await c.post("/publish", content=gzip.compress(b"0" * (1 << 20)),
+                             headers={"Content-Encoding": "gzip"})
+            assert r.status_code == 413
+            if formats.zstandard is not None:
+                bomb = formats.zstandard.ZstdCompressor().compress(b"0" * (1 << 20))
+                r = await c.post("/publish", content=bomb, headers={"Content-Encoding": "zstd"})
+                assert r.status_code == 413
+            r = await c.post("/publish", content=gzip.compress(b"[]")[:-4], headers={"Content-Encoding": "gzip"})
+            assert r.status_code == 400
+            if formats.zstandard is not None:
+                body = formats.zstandard.ZstdCompressor().compress(orjson.dumps([ev("fmt-z", "1")] * 50))
+                r = await c.post("/publish", content=body[:-20], headers={"Content-Encoding": "zstd"})
+                assert r.status_code == 400 and r.json()["detail"] == "zstd terpotong"
+            r = await c.post("/publish", content=b"\x91\x80", headers={"Content-Type": "application/msgpack"})
+            if formats.msgpack is None:
+                assert r.status_code == 415
+            else:
+                assert r.status_code == 400  # event kosong gagal validasi EventIn
+
+
+def test_stream_decoders_bound_bombs():
+    # 64 MB nol -> beberapa KB terkompresi; tiap potongan output paling banyak PIECE
+    raw = b"0" * (64 << 20)
+    bodies = {"gzip": gzip.compress(raw)}
+    if formats.zstandard is not None:
+        bodies["zstd"] = formats.zstandard.ZstdCompressor().compress(raw)
+    for coding, body in bodies.items():
+        assert len(body) < 100_000
+        decoder = formats.stream_decoder(coding)
+        sizes = [len(piece) for piece in decoder.feed(body)]
+        decoder.finish()
+        assert max(sizes) <= decoder.PIECE and sum(sizes) == len(raw), coding
+
+
+def test_stream_decoders_reject_truncated_body():
+    raw = ndjson([ev("fmt-t", str(i)) for i in range(200)])
+    bodies = {"gzip": (gzip.compress(raw), "gzip terpotong")}
+    if formats.zstandard is not None:
+        bodies["zstd"] = (formats.zstandard.ZstdCompressor().compress(raw), "zstd terpotong")
+    for coding, (body, error) in bodies.items():
+        decoder = formats.stream_decoder(coding)
+        for i in range(0, len(body) - 20, 7):  # chunk kecil: batas frame tidak sejajar chunk
+            list(decoder.feed(body[i:min(i + 7, len(body) - 20)]))
+        with pytest.raises(ValueError, match=error):
+            decoder.finish()
+        decoder = formats.stream_decoder(coding)
+        assert b"".join(decoder.feed(body)) == raw
+        decoder.finish()
+
+
+async def test_msgpack_payload_must_be_json_compatible(pg):
+    if formats.msgpack is None:
+        pytest.skip("butuh paket msgpack")
+    # max_payload_bytes=0: tidak ada cek ukuran yang meng-encode payload saat validasi
+    app = create_app(Settings(database_url=pg.db_url, workers=0, max_payload_bytes=0))
+    headers = {"Content-Type": "application/msgpack"}
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            for payload in ({"blob": b"\x00\xff"}, {1: "key int"}, {"nested": [{b"k": 1}]}):
+                body = formats.msgpack.packb({**ev("fmt-m", "1"), "payload": payload})
+                r = await c.post("/publish", content=body, headers=headers)
+                assert r.status_code == 400 and "JSON" in r.json()["detail"], payload
+            r = await c.post("/publish", content=formats.msgpack.packb(ev("fmt-m", "1")), headers=headers)
+            assert r.json()["inserted"] == 1
+
+
+async def test_publisher_ndjson_gzip_verifies(client):
+    [res] = await run(client, url="/publish", stats_url="/stats", mode="closed", count=300, batch_size=100,
+                      concurrency=2, dup_rate=0.2, topics=["fmt-pub"], retries=0, verify_timeout_s=5,
+                      seed=5, body_format="ndjson", content_encoding="gzip")
+    assert res["verify"]["ok"] and res["failed_events"] == 0
+    assert res["wire_bytes"] < res["body_bytes"]
@@ -0,0 +1,56 @@
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.main import create_app
+from aggregator.app.metrics import Histogram, Registry
+from aggregator.app.settings import Settings
+
+
+def test_histogram_render_cumulative_buckets():
+    r = Registry()
+    h = r.histogram("x_seconds", "test", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v)
+    text = r.render()
+    assert 'x_seconds_bucket{le="0.1"} 1' in text
+    assert 'x_seconds_bucket{le="1"} 3' in text
+    assert 'x_seconds_bucket{le="+Inf"} 4' in text
+    assert "x_seconds_count 4" in text
+    assert isinstance(h, Histogram)
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_publish_path(client):
+    payload = [
+        {"topic": "metrics", "event_id": f"MT{i % 3}", "timestamp": "2023-10-27T10:00:00Z",
+         "source": "pytest", "payload": {}}
+        for i in range(5)
+    ]
+    await client.post("/publish", json=payload)
+    r = await client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    lines = dict(
+        line.rsplit(" ", 1) for line in r.text.splitlines() if line and not line.startswith("#")
+    )
+    assert int(lines["aggregator_publish_requests_total"]) >= 1
+    assert int(lines["aggregator_rows_inserted_total"]) >= 3
+    assert int(lines["aggregator_rows_duplicate_total"]) >= 2
+    assert int(lines["aggregator_publish_batch_size_count"]) >= 1
+    assert int(lines["aggregator_db_pool_acquire_seconds_count"]) >= 1
+    assert int(lines["aggregator_db_pool_size"]) >= 1
+    # Default DB_QUERY_COUNT=false: tidak ada query logger di koneksi pool
+    assert int(lines["aggregator_db_queries_total"]) == 0
+
+
+@pytest.mark.asyncio
+async def test_db_query_count_setting(pg):
+    app = create_app(Settings(database_url=pg.db_url, workers=0, db_query_count=True))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            await c.post("/publish", json={"topic": "metrics-q", "event_id": "1", "timestamp": "2023-10-27T10:00:00Z",
+                                           "source": "pytest", "payload": {}})
+            r = await c.get("/metrics")
+    lines = dict(line.rsplit(" ", 1) for line in r.text.splitlines() if line and not line.startswith("#"))
+    assert int(lines["aggregator_db_queries_total"]) >= 1
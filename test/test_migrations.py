@@ -0,0 +1,46 @@
+import asyncio
+import shutil
+
+import asyncpg
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.main import create_app
+from aggregator.app.migrations import MIGRATIONS_DIR, MigrationError, migrate
+from aggregator.app.settings import Settings
+
+
+async def test_migrate_once_under_concurrent_start(make_dbs, tmp_path):
+    shutil.copytree(MIGRATIONS_DIR, tmp_path, dirs_exist_ok=True)
+    # Tidak idempotent: gagal bila dijalankan dua kali
+    (tmp_path / "0002_extra.sql").write_text("CREATE TABLE extra (x INT);")
+    dsn = (await make_dbs("migrate_a"))["migrate_a"]
+    conns = [await asyncpg.connect(dsn) for _ in range(5)]
+    try:
+        done = await asyncio.gather(*[migrate(c, tmp_path) for c in conns])
+        assert sorted(v for d in done for v in d) == [1, 2]
+        rows = await conns[0].fetch("SELECT version, name FROM schema_migrations ORDER BY version")
+        assert [(r["version"], r["name"]) for r in rows] == [(1, "baseline"), (2, "extra")]
+
+        # Skema terkini: fast path, tidak ada DDL/lock
+        assert await migrate(conns[0], tmp_path) == []
+        # Replica versi lama (belum kenal 0002) tetap boleh start
+        (tmp_path / "0002_extra.sql").unlink()
+        assert await migrate(conns[0], tmp_path) == []
+
+        (tmp_path / "0002_extra.sql").write_text("CREATE TABLE extra (x BIGINT);")
+        with pytest.raises(MigrationError):
+            await migrate(conns[0], tmp_path)
+    finally:
+        for c in conns:
+            await c.close()
+
+
+async def test_startup_metrics(pg):
+    app = create_app(Settings(database_url=pg.db_url, workers=0))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            text = (await c.get("/metrics")).text
+    values = dict(line.rsplit(" ", 1) for line in text.splitlines() if line.startswith("aggregator_startup_"))
+    assert 0 < float(values["aggregator_startup_db_init_seconds"]) <= float(values["aggregator_startup_total_seconds"])
@@ -0,0 +1,64 @@
+import pytest
+import asyncio
+import httpx
+from datetime import datetime, timezone
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.main import create_app
+from aggregator.app.notify import Wakeup
+from aggregator.app.settings import Settings
+
+
+def ev(event_id, topic="notify"):
+    return {
+        "topic": topic,
+        "event_id": event_id,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "source": "test",
+        "payload": {"n": 1},
+    }
+
+
+@pytest.mark.asyncio
+async def test_wakeup_not_lost_between_claim_and_wait():
+    w = Wakeup()
+    seen = w.seq
+    w.notify()  # datang sebelum worker sempat wait()
+    assert await w.wait(seen, timeout=0.01) is True
+    assert await w.wait(w.seq, timeout=0.01) is False
+
+
+@pytest.mark.asyncio
+async def test_wakeup_notify_wakes_one_waiter():
+    w = Wakeup()
+    seen = w.seq
+    waiters = [asyncio.create_task(w.wait(seen, timeout=0.2)) for _ in range(3)]
+    await asyncio.sleep(0)
+    w.notify()
+    done = await asyncio.gather(*waiters)
+    assert done.count(True) == 1
+
+
+@pytest.mark.asyncio
+async def test_notify_drives_workers_without_polling(pg):
+    """Poll interval 5 detik: event hanya bisa cepat diproses lewat NOTIFY."""
+    settings = Settings(database_url=pg.db_url, workers=2, poll_interval_ms=5000, max_poll_interval_ms=5000)
+    app = create_app(settings)
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            await asyncio.sleep(0.2)  # listener aktif
+            r = await c.post("/publish", json=[ev("N1"), ev("N2")])
+            assert r.json()["inserted"] == 2
+            pool = app.state.db_pool
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            while True:
+                async with pool.acquire() as conn:
+                    pending = await conn.fetchval(
+                        "SELECT count(*) FROM processed_events WHERE topic='notify' AND status <> 'done'")
+                if pending == 0:
+                    break
+                assert loop.time() - start < 2.0, "worker tidak dibangunkan NOTIFY"
+                await asyncio.sleep(0.05)
+            assert app.state.worker_stats.notify_wakeups >= 1
@@ -0,0 +1,41 @@
+import httpx
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.main import create_app
+from aggregator.app.settings import Settings
+
+
+def _app(pg, **kw):
+    return create_app(Settings(database_url=pg.db_url, workers=0, **kw))
+
+
+async def test_hot_statement_prepared_once_per_connection(pg):
+    app = _app(pg, db_pool_min_size=1, db_pool_max_size=1, db_synchronous_commit="off")
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            for i in range(5):
+                ev = {"topic": "pool", "event_id": f"p-{i}", "timestamp": "2025-01-01T00:00:00Z",
+                      "source": "t", "payload": {}}
+                assert (await c.post("/publish", json=ev)).status_code == 200
+        async with app.state.db_pool.acquire() as conn:
+            prepared = await conn.fetchval(
+                "SELECT count(*) FROM pg_prepared_statements "
+                "WHERE statement LIKE '%INSERT INTO dedup_keys%' AND statement NOT LIKE '%pg_prepared%'")
+            assert prepared == 1
+            assert await conn.fetchval("SHOW synchronous_commit") == "off"
+
+
+async def test_pool_exhaustion_returns_503_and_counts_timeout(pg):
+    app = _app(pg, db_pool_min_size=1, db_pool_max_size=1, db_acquire_timeout_sec=0.05)
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            async with app.state.db_pool.acquire():
+                r = await c.get("/stats")
+            assert r.status_code == 503
+            assert r.headers["Retry-After"] == "1"
+            assert (await c.get("/stats")).status_code == 200
+            text = (await c.get("/metrics")).text
+    assert "aggregator_db_pool_acquire_timeouts_total 1" in text
+    assert "aggregator_db_pool_waiting 0" in text
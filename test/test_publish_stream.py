@@ -0,0 +1,75 @@
+import asyncio
+import gzip
+
+import httpx
+import orjson
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.main import create_app
+from aggregator.app.settings import Settings
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+def line(topic, i):
+    return orjson.dumps({"topic": topic, "event_id": str(i), "timestamp": "2025-01-01T00:00:00Z",
+                         "source": "t", "payload": {"i": i}}) + b"\n"
+
+
+def topic_count(stats, topic):
+    return next((t["unique"] for t in stats["topics"] if t["topic"] == topic), 0)
+
+
+async def stream_app(pg, **kw):
+    return create_app(Settings(database_url=pg.db_url, workers=0, publish_stream_chunk_events=100,
+                               publish_stream_max_inflight=1, **kw))
+
+
+async def test_stream_inserts_while_body_arrives(pg):
+    app = await stream_app(pg)
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            seen_midway = []
+
+            async def body():
+                for i in range(250):
+                    yield line("st-a", i)
+                # Chunk pertama sudah commit sebelum sisa body dikirim
+                for _ in range(100):
+                    n = topic_count((await c.get("/stats")).json(), "st-a")
+                    if n >= 100:
+                        break
+                    await asyncio.sleep(0.01)
+                seen_midway.append(n)
+                yield line("st-a", 0)  # duplikat
+                yield b"\n" + line("st-a", 250).rstrip(b"\n")  # baris kosong + baris akhir tanpa newline
+
+            r = await c.post("/publish/stream", content=body(), headers=NDJSON)
+            assert r.status_code == 200, r.text
+            assert r.json() == {"accepted": 252, "inserted": 251, "duplicates": 1, "chunks": 3}
+            assert seen_midway[0] >= 100
+
+            gz = gzip.compress(b"".join(line("st-b", i) for i in range(120)))
+            r = await c.post("/publish/stream", content=gz, headers={**NDJSON, "Content-Encoding": "gzip"})
+            assert r.json()["inserted"] == 120
+
+
+async def test_stream_error_reports_committed_totals(pg):
+    app = await stream_app(pg, publish_stream_max_body_bytes=50_000)
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            body = b"".join(line("st-c", i) for i in range(150)) + b'{"topic": ""}\n'
+            r = await c.post("/publish/stream", content=body, headers=NDJSON)
+            assert r.status_code == 400
+            out = r.json()
+            assert out["detail"]["line"] == 151 and out["inserted"] == 100
+
+            async def big():
+                for i in range(1000):
+                    yield line("st-d", i)
+
+            r = await c.post("/publish/stream", content=big(), headers=NDJSON)
+            assert r.status_code == 413 and r.json()["inserted"] > 0
+
+            r = await c.post("/publish/stream", content=b"[]", headers={"Content-Type": "application/json"})
+            assert r.status_code == 415
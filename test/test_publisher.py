@@ -0,0 +1,38 @@
+import random
+
+from publisher.publisher import EventSource, Histogram, run
+
+
+def test_histogram_percentiles_within_relative_error():
+    h = Histogram()
+    values = [i / 10000 for i in range(1, 10001)]  # 0.1ms .. 1s
+    random.Random(1).shuffle(values)
+    for v in values:
+        h.record(v)
+    for p, exact in ((50, 0.5), (99, 0.99), (99.9, 0.999)):
+        assert abs(h.percentile(p) - exact) / exact < 1 / 64
+    assert h.percentile(100) == h.max == 1.0
+
+
+def test_zipf_duplicates_favor_early_keys():
+    src = EventSource(["a", "b"], dup_rate=0.5, key_zipf_s=1.2, seed=7)
+    events = [src.event() for _ in range(5000)]
+    hot = src.sent[0][1]
+    cold = src.sent[-1][1]
+    ids = [e["event_id"] for e in events]
+    assert ids.count(hot) > 50
+    assert ids.count(cold) <= 2
+
+
+async def test_closed_and_open_loop_verify_against_stats(client):
+    common = dict(url="/publish", stats_url="/stats", count=600, batch_size=50, dup_rate=0.3,
+                  topics=["pub-a", "pub-b"], key_zipf_s=1.0, retries=0, verify_timeout_s=5, seed=3)
+    [closed] = await run(client, mode="closed", concurrency=4, **common)
+    assert closed["failed_events"] == 0
+    assert closed["verify"]["ok"], closed["verify"]
+    assert closed["accepted"] == 600 and closed["duplicates"] > 0
+    assert closed["latency_ms"]["count"] == 12
+
+    open_steps = await run(client, mode="open", rate="3000,6000", **{**common, "seed": 11})
+    assert [r["target_rate"] for r in open_steps] == [3000.0, 6000.0]
+    assert all(r["verify"]["ok"] and r["failed_events"] == 0 for r in open_steps)
@@ -0,0 +1,160 @@
+import pytest
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from aggregator.app import db
+from aggregator.app.worker import worker_loop
+
+
+def row(event_id, topic="queue-test"):
+    return (topic, event_id, datetime.now(timezone.utc), "test", json.dumps({"q": 1}))
+
+
+async def stat(pool, key):
+    async with pool.acquire() as conn:
+        return (await db.read_stats(conn))[key]
+
+
+@pytest.mark.asyncio
+async def test_claim_reclaim_stuck_and_mark_done_once(pg):
+    """Baris stuck di 'processing' di-claim ulang, tapi unique_processed tetap +1 per event."""
+    pool = await db.init_db(pg.db_url)
+    try:
+        async with pool.acquire() as conn:
+            await db.insert_events(conn, [row("Q1"), row("Q2")], status="pending")
+            mine = {r["id"] for r in await conn.fetch(
+                "SELECT id FROM processed_events WHERE topic='queue-test'")}
+
+        claimed = await db.claim_events(pool, 10_000, stuck_processing_sec=60)
+        assert mine <= {r["id"] for r in claimed}
+        # Claim kedua tidak boleh mengambil baris yang sama (belum stuck)
+        again = await db.claim_events(pool, 10_000, stuck_processing_sec=60)
+        assert not mine & {r["id"] for r in again}
+
+        # Simulasi worker crash: claimed_at mundur melewati stuck_processing_sec
+        async with pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE processed_events SET claimed_at = now() - interval '1 hour' WHERE id = ANY($1::bigint[])",
+                list(mine))
+        reclaimed = [r for r in await db.claim_events(pool, 10_000, stuck_processing_sec=60) if r["id"] in mine]
+        assert {r["id"] for r in reclaimed} == mine
+        assert all(r["attempts"] == 2 for r in reclaimed)
+
+        before = await stat(pool, "unique_processed")
+        assert await db.mark_done(pool, list(mine)) == 2
+        # Worker lama yang "bangun" lagi tidak menghitung ulang
+        assert await db.mark_done(pool, list(mine)) == 0
+        assert await stat(pool, "unique_processed") == before + 2
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_mark_failed_retries_then_fails(pg):
+    pool = await db.init_db(pg.db_url)
+    try:
+        async with pool.acquire() as conn:
+            await db.insert_events(conn, [row("F1", topic="queue-fail")], status="pending")
+            rid = await conn.fetchval("SELECT id FROM processed_events WHERE topic='queue-fail'")
+            await conn.execute("UPDATE processed_events SET status='processing', attempts=1 WHERE id=$1", rid)
+            await db.mark_failed(pool, rid, "boom", max_attempts=2)
+            assert await conn.fetchval("SELECT status FROM processed_events WHERE id=$1", rid) == "pending"
+            await conn.execute("UPDATE processed_events SET status='processing', attempts=2 WHERE id=$1", rid)
+            await db.mark_failed(pool, rid, "boom", max_attempts=2)
+            r = await conn.fetchrow("SELECT status, last_error FROM processed_events WHERE id=$1", rid)
+            assert (r["status"], r["last_error"]) == ("failed", "boom")
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_release_claims_returns_rows_to_queue_without_attempt(pg):
+    """Shutdown yang memotong batch: baris kembali 'pending' dan attempts tidak bertambah."""
+    pool = await db.init_db(pg.db_url)
+    try:
+        async with pool.acquire() as conn:
+            await db.insert_events(conn, [row("R1", "release-test")], status="pending")
+        claimed = await db.claim_events(pool, 10_000, stuck_processing_sec=60)
+        mine = [r["id"] for r in claimed if r["topic"] == "release-test"]
+        await db.release_claims(pool, mine)
+        async with pool.acquire() as conn:
+            r = await conn.fetchrow(
+                "SELECT status, attempts, claimed_at FROM processed_events WHERE topic='release-test'")
+        assert (r["status"], r["attempts"], r["claimed_at"]) == ("pending", 0, None)
+        assert await db.mark_done(pool, [r["id"] for r in await db.claim_events(pool, 10_000)]) >= 1
+    finally:
+        await pool.close()
+
+
+async def cancel_worker_when(pool, event: asyncio.Event) -> None:
+    task = asyncio.create_task(worker_loop(pool, 10_000, 10, stop_event=asyncio.Event()))
+    await asyncio.wait_for(event.wait(), 5)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test_worker_cancelled_mid_claim_releases_rows(pg, monkeypatch):
+    """Cancel setelah UPDATE claim commit tapi sebelum hasilnya kembali ke worker."""
+    pool = await db.init_db(pg.db_url)
+    claimed = asyncio.Event()
+    claim_events = db.claim_events
+
+    async def slow_claim(*args):
+        rows = await claim_events(*args)
+        claimed.set()
+        await asyncio.sleep(0.2)
+        return rows
+
+    monkeypatch.setattr(db, "claim_events", slow_claim)
+    try:
+        async with pool.acquire() as conn:
+            await db.insert_events(conn, [row("C1", "cancel-claim")], status="pending")
+        await cancel_worker_when(pool, claimed)
+        async with pool.acquire() as conn:
+            r = await conn.fetchrow("SELECT status, attempts FROM processed_events WHERE topic='cancel-claim'")
+        assert (r["status"], r["attempts"]) == ("pending", 0)
+        async with pool.acquire() as conn:
+            # Jangan tinggalkan baris pending untuk test lain yang memakai DB sama
+            await conn.execute("DELETE FROM processed_events WHERE topic='cancel-claim'")
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_cancelled_during_mark_done_keeps_outcome(pg, monkeypatch):
+    """Cancel saat mark_done berjalan: yang sudah commit tetap 'done', yang gagal dikembalikan."""
+    pool = await db.init_db(pg.db_url)
+    entered = asyncio.Event()
+    mark_done = db.mark_done
+
+    async def slow_mark_done(pool_, ids, shard=0):
+        entered.set()
+        await asyncio.sleep(0.2)
+        if any(topic == "cancel-fail" for topic in topics.values()):
+            raise RuntimeError("boom")
+        return await mark_done(pool_, ids, shard)
+
+    monkeypatch.setattr(db, "mark_done", slow_mark_done)
+    try:
+        for topic in ("cancel-done", "cancel-fail"):
+            entered.clear()
+            async with pool.acquire() as conn:
+                await db.insert_events(conn, [row("M1", topic)], status="pending")
+                topics = {r["id"]: r["topic"] for r in await conn.fetch(
+                    "SELECT id, topic FROM processed_events WHERE status = 'pending'")}
+            before = await stat(pool, "unique_processed")
+            await cancel_worker_when(pool, entered)
+            async with pool.acquire() as conn:
+                status = await conn.fetchval("SELECT status FROM processed_events WHERE topic=$1", topic)
+            if topic == "cancel-done":
+                assert status == "done"
+                assert await stat(pool, "unique_processed") >= before + 1
+            else:
+                assert status == "pending"
+                async with pool.acquire() as conn:
+                    await conn.execute("DELETE FROM processed_events WHERE topic=$1", topic)
+    finally:
+        await pool.close()
@@ -0,0 +1,103 @@
+import asyncio
+
+import httpx
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.cache import ResponseCache
+from aggregator.app.main import create_app
+from aggregator.app.settings import Settings
+
+
+def ev(topic, event_id):
+    return {"topic": topic, "event_id": event_id, "timestamp": "2025-01-01T00:00:00Z",
+            "source": "t", "payload": {"n": event_id}}
+
+
+async def test_cache_single_flight_lru_and_invalidation():
+    cache = ResponseCache(max_entries=2, ttl_s=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"[]", {}
+
+    results = await asyncio.gather(*[cache.get_or_load("k", "a", loader) for _ in range(5)])
+    assert len(calls) == 1 and sum(hit for _, hit in results) == 4
+    cache.invalidate({"b"})
+    assert (await cache.get_or_load("k", "a", loader))[1]  # topic lain tidak menyentuh entry "a"
+    cache.invalidate({"a"})
+    assert not (await cache.get_or_load("k", "a", loader))[1]
+    await cache.get_or_load("k2", "b", loader)
+    await cache.get_or_load("k3", None, loader)
+    assert len(cache) == 2 and cache.evictions == 1
+
+
+async def test_topic_generations_stay_bounded():
+    cache = ResponseCache(max_entries=4, ttl_s=60)
+
+    async def loader():
+        return b"[]", {}
+
+    await cache.get_or_load("hot", "hot", loader)
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_loader():
+        started.set()
+        await release.wait()
+        return b"[]", {}
+
+    slow = asyncio.create_task(cache.get_or_load("cold", "cold", slow_loader))
+    await started.wait()
+    cache.invalidate({"cold"})  # write di tengah query -> entry "cold" basi
+    for i in range(1000):
+        cache.invalidate({f"t{i}"})
+    assert len(cache._topic_gen) <= 2 * cache.max_entries
+    release.set()
+    await slow
+    assert (await cache.get_or_load("hot", "hot", loader))[1]  # topic yang masih punya entry tidak terganggu
+    assert not (await cache.get_or_load("cold", "cold", loader))[1]
+    cache.invalidate({"hot"})
+    assert not (await cache.get_or_load("hot", "hot", loader))[1]
+
+
+async def test_events_cached_invalidated_on_publish_and_etag(pg):
+    app = create_app(Settings(database_url=pg.db_url, workers=0, response_cache_enabled=True,
+                              response_cache_ttl_ms=60_000, db_query_count=True))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            await c.post("/publish", json=[ev("rc-a", "1"), ev("rc-b", "1")])
+            first = await c.get("/events", params={"topic": "rc-a"})
+            other = await c.get("/events", params={"topic": "rc-b"})
+            etag = first.headers["ETag"]
+
+            queries = app.state.metrics.db_queries.value()
+            again = await c.get("/events", params={"topic": "rc-a"})
+            assert again.content == first.content and app.state.metrics.db_queries.value() == queries
+            r = await c.get("/events", params={"topic": "rc-a"}, headers={"If-None-Match": f'W/{etag}, "x"'})
+            assert r.status_code == 304 and r.content == b""
+
+            # Publish ke rc-a hanya membuat entry rc-a basi
+            await c.post("/publish", json=ev("rc-a", "2"))
+            fresh = await c.get("/events", params={"topic": "rc-a"}, headers={"If-None-Match": etag})
+            assert fresh.status_code == 200 and {e["event_id"] for e in fresh.json()} == {"1", "2"}
+            assert fresh.headers["ETag"] != etag
+            queries = app.state.metrics.db_queries.value()
+            assert (await c.get("/events", params={"topic": "rc-b"})).content == other.content
+            assert app.state.metrics.db_queries.value() == queries
+
+            m = app.state.metrics.response_cache_requests
+            assert m.value(endpoint="events", result="hit") == 3
+            assert m.value(endpoint="events", result="miss") == 3
+
+
+async def test_stats_etag_not_modified(client):
+    r = await client.get("/stats")
+    etag = r.headers["ETag"]
+    # Body memuat uptime_seconds (tidak ikut tag) -> validator lemah, bukan strong
+    assert etag.startswith('W/"')
+    assert (await client.get("/stats", headers={"If-None-Match": etag})).status_code == 304
+    assert (await client.get("/stats", headers={"If-None-Match": etag[2:]})).status_code == 304
+    await client.post("/publish", json=ev("rc-s", "1"))
+    r = await client.get("/stats", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
@@ -0,0 +1,24 @@
+import importlib
+
+import pytest
+
+from aggregator.app.db import pool_max_size, pool_options
+from aggregator.app.settings import Settings
+
+
+def test_pool_size_derived_from_global_budget():
+    s = Settings(processes=4, db_connection_budget=80, workers=4, notify_enabled=True, db_pool_min_size=30)
+    # 80 / 4 proses = 20, dikurangi 1 koneksi LISTEN
+    assert pool_max_size(s) == 19
+    opts = pool_options(s)
+    assert (opts["min_size"], opts["max_size"]) == (19, 19)
+    assert pool_max_size(Settings(processes=4, db_connection_budget=80, workers=0)) == 20
+    assert pool_max_size(Settings(db_pool_max_size=7)) == 7
+    with pytest.raises(ValueError):
+        pool_max_size(Settings(processes=8, db_connection_budget=8, workers=2))
+
+
+def test_module_app_is_built_lazily_once():
+    main = importlib.import_module("aggregator.app.main")
+    app = main.app
+    assert main.__dict__["app"] is app
@@ -0,0 +1,157 @@
+import asyncio
+
+import httpx
+import orjson
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.db import claim_events, init_db, mark_done
+from aggregator.app.ingest import Ingestor
+from aggregator.app.main import create_app
+from aggregator.app.models import EventIn
+from aggregator.app.rebalance import rebalance
+from aggregator.app.settings import Settings
+from aggregator.app.shards import ShardSet, parse_shards, plan_moves
+
+
+def ev(topic, event_id):
+    return {"topic": topic, "event_id": event_id, "timestamp": "2025-01-01T00:00:00Z",
+            "source": f"src-{topic}", "payload": {"n": event_id}}
+
+
+def spec(dsns, *names):
+    return ",".join(f"{n}={dsns[n]}" for n in names)
+
+
+def test_ring_moves_only_topics_of_new_shard():
+    topics = {f"topic-{i}" for i in range(2000)}
+    old = ShardSet(parse_shards("a=postgres://x/a,b=postgres://x/b", ""))
+    new = ShardSet(parse_shards("a=postgres://x/a,b=postgres://x/b,c=postgres://x/c", ""))
+    located = {}
+    for t in topics:
+        located.setdefault(old.for_topic(t).name, set()).add(t)
+    plan = plan_moves(located, new)
+    assert set(dst for _, dst in plan) == {"c"}
+    moved = sum(len(v) for v in plan.values())
+    assert 0.2 * len(topics) < moved < 0.47 * len(topics)
+    # Nama menentukan posisi di ring, bukan DSN
+    renamed = ShardSet(parse_shards("a=postgres://y/a,b=postgres://y/b", ""))
+    assert all(old.for_topic(t).name == renamed.for_topic(t).name for t in topics)
+    assert [n for n, _ in parse_shards("postgres://x/1, postgres://x/2", "")] == ["shard0", "shard1"]
+
+
+async def test_sharded_publish_read_and_rebalance(pg, make_dbs):
+    dsns = await make_dbs("shard_a", "shard_b", "shard_c")
+    topics = [f"t{i}" for i in range(8)]
+    batch = [ev(t, f"{t}-{j}") for t in topics for j in range(5)]
+    settings = Settings(database_url=pg.db_url, database_shards=spec(dsns, "shard_a", "shard_b"), workers=0)
+    app = create_app(settings)
+    async with LifespanManager(app):
+        shards = app.state.shards
+        assert {shards.for_topic(t).name for t in topics} == {"shard_a", "shard_b"}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            r = await c.post("/publish", json=batch + batch[:3])
+            assert r.json()["inserted"] == 40
+            for shard in shards:
+                async with shard.pool.acquire() as conn:
+                    have = {r["topic"] for r in await conn.fetch("SELECT DISTINCT topic FROM processed_events")}
+                assert have == {t for t in topics if shards.for_topic(t) is shard}
+
+            # Tanpa topic: gabungan semua shard, urutan + cursor sama seperti satu database
+            r = await c.get("/events", params={"limit": 25})
+            page1 = r.json()
+            r = await c.get("/events", params={"limit": 25, "cursor": r.headers["x-next-cursor"]})
+            rows = page1 + r.json()
+            keys = [(e["ts_ingest"], e["topic"], e["event_id"]) for e in rows]
+            assert len(set(keys)) == 40 and keys == sorted(keys, reverse=True)
+            r = await c.get("/events/export", params={"fields": "meta"})
+            assert [orjson.loads(line)["event_id"] for line in r.text.splitlines()] == [k[2] for k in keys]
+            r = await c.get("/events", params={"topic": "t3", "after_seq": 2})
+            assert [e["seq"] for e in r.json()] == [3, 4, 5]
+
+            stats = (await c.get("/stats")).json()
+            assert (stats["received"], stats["unique_processed"], stats["duplicate_dropped"]) == (43, 40, 3)
+            assert [t["topic"] for t in stats["topics"]] == topics
+            assert set((await c.get("/stats/storage")).json()["shards"]) == {"shard_a", "shard_b"}
+
+            r = await c.get("/subscribe/t5", params={"group": "g", "start": "earliest", "limit": 5})
+            assert r.status_code == 200
+            await app.state.subscriptions.committer.flush()
+            r = await c.post("/subscriptions/g/offsets/t6", json={"cursor": "2"})
+            assert r.status_code == 200
+            assert {o["topic"]: o["cursor"] for o in (await c.get("/subscriptions/g")).json()} == {"t5": "5", "t6": "2"}
+
+    # Shard baru: topic yang pindah disalin ke shard_c dan dihapus dari asal
+    old = ShardSet(parse_shards(settings.database_shards, ""))
+    new_spec = spec(dsns, "shard_a", "shard_b", "shard_c")
+    new = ShardSet(parse_shards(new_spec, ""))
+    moving = {t for t in topics if new.for_topic(t).name == "shard_c"}
+    assert moving, "ring test harus memindahkan minimal satu topic"
+    plan = await rebalance(old, new, settings, dry_run=True)
+    assert {t for r in plan.values() for t in r["topics"]} == moving
+    result = await rebalance(old, new, settings)
+    assert sum(r["events"] for r in result.values()) == 5 * len(moving)
+    assert await rebalance(old, new, settings) == {}  # diulang: tidak ada yang pindah lagi
+
+    app = create_app(Settings(database_url=pg.db_url, database_shards=new_spec, workers=0))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            stats = (await c.get("/stats")).json()
+            assert (stats["received"], stats["unique_processed"], stats["duplicate_dropped"]) == (43, 40, 3)
+            assert len((await c.get("/events", params={"limit": 100})).json()) == 40
+            t = sorted(moving)[0]
+            # Dedup, seq, source, dan offset group ikut pindah
+            r = await c.post("/publish", json=[ev(t, f"{t}-0"), ev(t, f"{t}-new")])
+            assert r.json()["inserted"] == 1
+            r = await c.get("/events", params={"topic": t, "after_seq": 4})
+            assert [(e["seq"], e["event_id"], e["source"]) for e in r.json()] == [
+                (5, f"{t}-4", f"src-{t}"), (6, f"{t}-new", f"src-{t}")]
+            offsets = {o["topic"] for o in (await c.get("/subscriptions/g")).json()}
+            assert offsets == {"t5", "t6"}
+
+
+async def test_rebalance_moves_pending_rows_to_destination_worker(pg, make_dbs):
+    dsns = await make_dbs("pend_a", "pend_b")
+    topics = [f"p{i}" for i in range(8)]
+    settings = Settings(database_url=pg.db_url, database_shards=spec(dsns, "pend_a"), workers=1)
+    # workers>0 tanpa worker berjalan: semua baris tertahan 'pending'
+    pool = await init_db(dsns["pend_a"], settings.stats_shards)
+    try:
+        events = [EventIn(**ev(t, f"{t}-{j}")) for t in topics for j in range(5)]
+        await Ingestor(pool, settings).write_groups([events], len(events))
+        claimed = await claim_events(pool, 16)
+        assert await mark_done(pool, [r["id"] for r in claimed]) == 16
+    finally:
+        await pool.close()
+
+    old = ShardSet(parse_shards(settings.database_shards, ""))
+    new_spec = spec(dsns, "pend_a", "pend_b")
+    new = ShardSet(parse_shards(new_spec, ""))
+    assert any(new.for_topic(t).name == "pend_b" for t in topics)
+    await rebalance(old, new, settings)
+
+    # Sebelum worker jalan: tiap shard hanya menghitung baris yang sudah 'done'
+    async def processed(name):
+        pool = await init_db(dsns[name], settings.stats_shards)
+        try:
+            async with pool.acquire() as conn:
+                return (await conn.fetchval("SELECT sum(unique_processed) FROM stats_shard"),
+                        await conn.fetchval("SELECT count(*) FROM processed_events WHERE status = 'done'"))
+        finally:
+            await pool.close()
+
+    per_shard = [await processed(name) for name in ("pend_a", "pend_b")]
+    assert all(counted == done for counted, done in per_shard)
+    assert sum(done for _, done in per_shard) == 16
+
+    # Baris pending yang pindah diselesaikan (dan dihitung) oleh worker shard tujuan
+    app = create_app(Settings(database_url=pg.db_url, database_shards=new_spec, workers=1))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            for _ in range(100):
+                stats = (await c.get("/stats")).json()
+                if stats["unique_processed"] >= 40:
+                    break
+                await asyncio.sleep(0.05)
+            assert (stats["received"], stats["unique_processed"], stats["duplicate_dropped"]) == (40, 40, 0)
+            assert sum(t["done"] for t in stats["topics"]) == 40
+    assert all(counted == done for counted, done in [await processed(name) for name in ("pend_a", "pend_b")])
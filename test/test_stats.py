@@ -0,0 +1,58 @@
+import asyncio
+
+import httpx
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.main import create_app
+from aggregator.app.settings import Settings
+
+
+def ev(topic, event_id, ts="2025-01-01T00:00:00Z"):
+    return {"topic": topic, "event_id": event_id, "timestamp": ts, "source": "t", "payload": {}}
+
+
+def topic_row(stats, topic):
+    return next(t for t in stats["topics"] if t["topic"] == topic)
+
+
+async def test_stats_topics_from_aggregates(client):
+    await client.post("/publish", json=[
+        ev("agg-a", "1", "2025-01-01T00:00:00Z"), ev("agg-a", "2", "2025-01-03T00:00:00Z"),
+        ev("agg-a", "1"), ev("agg-b", "1", "2025-01-02T00:00:00Z"),
+    ])
+    await client.post("/publish", json=ev("agg-b", "1"))
+    s = (await client.get("/stats")).json()
+    a, b = topic_row(s, "agg-a"), topic_row(s, "agg-b")
+    assert (a["received"], a["unique"], a["duplicates"], a["done"]) == (3, 2, 1, 2)
+    assert (b["received"], b["unique"], b["duplicates"], b["done"]) == (2, 1, 1, 1)
+    assert a["first_ts"].startswith("2025-01-01") and a["last_ts"].startswith("2025-01-03")
+    assert set(s["queue"]) == {"backlog", "failed"}
+    assert isinstance(s["uptime_seconds"], int)
+
+
+async def test_topic_done_counted_by_workers(client_with_workers):
+    await client_with_workers.post("/publish", json=[ev("agg-w", str(i)) for i in range(20)])
+    for _ in range(100):
+        t = topic_row((await client_with_workers.get("/stats")).json(), "agg-w")
+        if t["done"] == 20:
+            break
+        await asyncio.sleep(0.05)
+    assert (t["unique"], t["done"], t["failed"]) == (20, 20, 0)
+
+
+async def test_stats_ttl_cache_and_rollup(pg):
+    app = create_app(Settings(database_url=pg.db_url, workers=0, stats_cache_ttl_ms=60_000,
+                              topic_rollup_enabled=True, dedup_cache_enabled=True, db_query_count=True))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            first = (await c.get("/stats")).json()
+            await c.post("/publish", json=[ev("agg-c", "1"), ev("agg-c", "2")])
+            await c.post("/publish", json=ev("agg-c", "1"))  # duplikat disaring dedup cache
+            queries = app.state.metrics.db_queries.value()
+            cached = await asyncio.gather(*[c.get("/stats") for _ in range(10)])
+            assert app.state.metrics.db_queries.value() == queries
+            assert all(r.json()["received"] == first["received"] for r in cached)
+
+            rollup = (await c.get("/stats/topics/agg-c/rollup?minutes=5")).json()
+            assert sum(p["received"] for p in rollup) == 3
+            assert sum(p["unique"] for p in rollup) == 2
@@ -0,0 +1,74 @@
+import httpx
+import orjson
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.main import _payload_limit, create_app
+from aggregator.app.settings import Settings
+
+
+def ev(topic, event_id, payload=None, source="svc-a"):
+    return {"topic": topic, "event_id": event_id, "timestamp": "2025-01-01T00:00:00Z",
+            "source": source, "payload": {"n": event_id} if payload is None else payload}
+
+
+async def test_source_dictionary_and_meta_projection(client):
+    r = await client.post("/publish", json=[ev("sto-a", str(i), source="dict-src") for i in range(5)])
+    assert r.json()["inserted"] == 5
+    pool = client._transport.app.state.db_pool
+    async with pool.acquire() as conn:
+        assert await conn.fetchval("SELECT count(*) FROM event_sources WHERE name = 'dict-src'") == 1
+        row = await conn.fetchrow(
+            "SELECT source, source_id FROM processed_events WHERE topic = 'sto-a' LIMIT 1")
+        assert row["source"] is None and row["source_id"] is not None
+        # Baris versi lama (source TEXT, tanpa source_id) tetap terbaca
+        await conn.execute(
+            "INSERT INTO processed_events(topic, event_id, ts_ingest, source, payload, status) "
+            "VALUES ('sto-a', 'legacy', '2024-01-01', 'old-src', '{}', 'done')")
+
+    full = {e["event_id"]: e for e in (await client.get("/events", params={"topic": "sto-a"})).json()}
+    assert full["0"]["source"] == "dict-src" and full["legacy"]["source"] == "old-src"
+    meta = (await client.get("/events", params={"topic": "sto-a", "fields": "meta"})).json()
+    assert all("payload" not in e and e["payload_bytes"] > 0 for e in meta)
+    assert (await client.get("/events", params={"fields": "nope"})).status_code == 422
+
+    report = (await client.get("/stats/storage", params={"exact": "true"})).json()
+    assert report["rows_exact"] and report["rows"] >= 6
+    assert report["bytes_per_event"]["total"] > 0
+
+
+def test_payload_limit_skipped_for_small_bodies():
+    assert _payload_limit(1000, 1 << 20) == 0
+    assert _payload_limit((1 << 20) // 5, 1 << 20) == 0
+    assert _payload_limit((1 << 20) // 5 + 1, 1 << 20) == 1 << 20
+    assert _payload_limit(1 << 20, 0) == 0
+
+
+async def test_payload_limit_counts_reencoded_size(pg):
+    # Body (~330 byte) di bawah batas, tapi "1e15" di-encode orjson jadi 18 byte/angka
+    payload = b'{"x": [' + b",".join([b"1e15"] * 40) + b"]}"
+    body = b'{"topic": "sto-e", "event_id": "1", "timestamp": "2025-01-01T00:00:00Z", "source": "s", "payload": %s}' % payload
+    assert len(body) < 400 < len(orjson.dumps(orjson.loads(payload)))
+    app = create_app(Settings(database_url=pg.db_url, workers=0, max_payload_bytes=400))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            r = await c.post("/publish", content=body, headers={"Content-Type": "application/json"})
+            assert r.status_code == 400 and "melebihi batas 400 byte" in str(r.json()["detail"])
+            r = await c.post("/publish/stream", content=body + b"\n", headers={"Content-Type": "application/x-ndjson"})
+            assert r.status_code == 400 and "melebihi batas 400 byte" in str(r.json()["detail"])
+
+
+async def test_payload_and_field_limits(pg):
+    app = create_app(Settings(database_url=pg.db_url, workers=0, max_payload_bytes=64,
+                              db_toast_compression="pglz"))
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            assert (await c.post("/publish", json=ev("sto-b", "1", {"x": "y" * 10}))).status_code == 200
+            r = await c.post("/publish", json=ev("sto-b", "2", {"x": "y" * 100}))
+            assert r.status_code == 400 and "melebihi batas 64 byte" in str(r.json()["detail"])
+            # Batas baris stream (1 MiB) > batas payload: payload tetap dicek per baris
+            line = orjson.dumps(ev("sto-b", "4", {"x": "y" * 100})) + b"\n"
+            r = await c.post("/publish/stream", content=line, headers={"Content-Type": "application/x-ndjson"})
+            assert r.status_code == 400 and "melebihi batas 64 byte" in str(r.json()["detail"])
+            assert (await c.post("/publish", json=ev("t" * 201, "3"))).status_code == 400
+            async with app.state.db_pool.acquire() as conn:
+                assert await conn.fetchval("SHOW default_toast_compression") == "pglz"
@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+import orjson
+from asgi_lifespan import LifespanManager
+
+from aggregator.app.main import create_app
+from aggregator.app.settings import Settings
+
+
+def ev(topic, event_id):
+    return {"topic": topic, "event_id": event_id, "timestamp": "2025-01-01T00:00:00Z",
+            "source": "t", "payload": {"n": event_id}}
+
+
+def frames(body: bytes):
+    """[(cursor, [event_id, ...])] dari body SSE."""
+    out = []
+    for block in body.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if line and not line.startswith(":"))
+        if fields.get("event") == "events":
+            out.append((fields["id"], [e["event_id"] for e in orjson.loads(fields["data"])]))
+    return out
+
+
+def ids(body: bytes):
+    return [i for _, batch in frames(body) for i in batch]
+
+
+def app_for(pg, **kw):
+    kw.setdefault("subscription_poll_ms", 50)
+    return create_app(Settings(database_url=pg.db_url, workers=0, offset_commit_interval_ms=50, **kw))
+
+
+async def test_subscribe_live_shared_read_and_resume(pg):
+    app = app_for(pg, subscription_poll_ms=60_000)
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            await c.post("/publish", json=[ev("sub-a", "old")])
+            m = app.state.metrics.subscription_rows_read
+            subs = [asyncio.create_task(c.get("/subscribe/sub-a", params={"start": "latest", "limit": 6}))
+                    for _ in range(5)]
+            while app.state.subscriptions.subscribers < 5:
+                await asyncio.sleep(0.01)
+            for i in range(3):
+                await c.post("/publish", json=[ev("sub-a", f"{i}a"), ev("sub-a", f"{i}b"), ev("sub-b", f"{i}")])
+            bodies = [(await t).content for t in subs]
+            expected = ["0a", "0b", "1a", "1b", "2a", "2b"]
+            assert all(ids(b) == expected for b in bodies)
+            # Tiap baris dibaca dari DB sekali, dibagi kelima subscriber (bukan 5x)
+            assert m.value(kind="broadcast") == 6 and m.value(kind="catchup") == 0
+
+            # Consumer group: commit otomatis, koneksi berikutnya lanjut dari offset
+            r = await c.get("/subscribe/sub-a", params={"group": "g1", "start": "earliest", "limit": 3, "batch": 3})
+            assert ids(r.content) == ["old", "0a", "0b"]
+            [(after_0b, _)] = frames(r.content)
+            await app.state.subscriptions.committer.flush()
+            r = await c.get("/subscribe/sub-a", params={"group": "g1", "limit": 2})
+            assert ids(r.content) == ["1a", "1b"]
+            cursor = frames(r.content)[-1][0]
+            await app.state.subscriptions.committer.flush()
+            [off] = (await c.get("/subscriptions/g1")).json()
+            assert off["topic"] == "sub-a" and off["cursor"] == cursor
+
+            # Last-Event-ID (reconnect) mengalahkan offset group
+            r = await c.get("/subscribe/sub-a", params={"group": "g1", "limit": 2},
+                            headers={"Last-Event-ID": after_0b})
+            assert ids(r.content) == ["1a", "1b"]
+
+
+async def test_seek_offset_and_catchup_behind_buffer(pg):
+    app = app_for(pg, subscription_batch_max=2, subscription_buffer_events=2)
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            await c.post("/publish", json=[ev("sub-c", str(i)) for i in range(7)])
+            r = await c.get("/subscribe/sub-c", params={"group": "g2", "start": "earliest", "limit": 7})
+            assert ids(r.content) == [str(i) for i in range(7)]
+            assert app.state.metrics.subscription_db_reads.value(kind="catchup") >= 3
+            cursors = [cur for cur, _ in frames(r.content)]
+
+            # Seek mundur = replay dari sesudah cursor itu
+            r = await c.post("/subscriptions/g2/offsets/sub-c", json={"cursor": cursors[0]})
+            assert r.status_code == 200
+            r = await c.get("/subscribe/sub-c", params={"group": "g2", "limit": 2})
+            assert ids(r.content) == ["2", "3"]
+
+            assert (await c.post("/subscriptions/g2/offsets/sub-c", json={"cursor": "x"})).status_code == 400
+            r = await c.get("/subscribe/sub-c", headers={"Last-Event-ID": "nope"})
+            assert r.status_code == 400